@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import threading
+
+# Content-addressed store for synthesized audio. Each blob is named after a hash of
+# the normalized text and the voice settings, with the audio format as extension
+# (blobs/<hash>.ogg), so identical sentences shared by many manuals are synthesized
+# and stored once per format. manifest.json maps each item (manual_{id}_{item_id})
+# to its blob, format and MIME type; the frontend resolves audio through it.
+
+# --- Configuration ---
+BLOBS_DIR = 'blobs'
+MANIFEST_FILE = 'manifest.json'
+PUBLIC_URL_PREFIX = '/manual_audio' # Where the store's root directory is served by the frontend
+# Output formats: TTS AudioEncoding name, file extension, MIME type and ffmpeg arguments for transcoding
+AUDIO_FORMATS = {
+    'wav': {'encoding': 'LINEAR16', 'extension': 'wav', 'mime': 'audio/wav', 'ffmpeg_args': ['-c:a', 'pcm_s16le']},
+    'ogg_opus': {'encoding': 'OGG_OPUS', 'extension': 'ogg', 'mime': 'audio/ogg; codecs=opus',
+                 'ffmpeg_args': ['-c:a', 'libopus', '-b:a', '32k', '-application', 'voip']},
+    'mp3': {'encoding': 'MP3', 'extension': 'mp3', 'mime': 'audio/mpeg', 'ffmpeg_args': ['-c:a', 'libmp3lame', '-b:a', '64k']},
+}
+# --- End Configuration ---
+
+def normalize_tts_text(text):
+    """The text actually sent to TTS: markup brackets removed, whitespace collapsed."""
+    return " ".join(text.replace('<', '').replace('>', '').split())
+
+def audio_content_hash(text, language_code, voice_name):
+    """SHA-256 over everything that determines the spoken audio (the format is the blob's extension)."""
+    key = "\x00".join([normalize_tts_text(text), language_code, voice_name])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def item_key(manual_id, item_id):
+    return f"manual_{manual_id}_{item_id}"
+
+class AudioStore:
+    """Blob directory plus item manifest under one root (e.g. public/manual_audio)."""
+
+    def __init__(self, root, url_prefix=PUBLIC_URL_PREFIX):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+        self.manifest_path = os.path.join(root, MANIFEST_FILE)
+        self._lock = threading.Lock()
+        self._items = self._read_manifest().get("items", {})
+        self._dirty = set()
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f: return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read audio manifest {self.manifest_path} ({e}), starting empty.")
+            return {}
+
+    def blob_relpath(self, content_hash, audio_format):
+        return f"{BLOBS_DIR}/{content_hash}.{AUDIO_FORMATS[audio_format]['extension']}"
+
+    def blob_path(self, content_hash, audio_format):
+        return os.path.join(self.root, self.blob_relpath(content_hash, audio_format))
+
+    def find_blob(self, content_hash, preferred_format):
+        """Returns the format of an existing blob for content_hash, preferring preferred_format, or None."""
+        for audio_format in [preferred_format] + [f for f in AUDIO_FORMATS if f != preferred_format]:
+            if os.path.exists(self.blob_path(content_hash, audio_format)): return audio_format
+        return None
+
+    def link(self, key, content_hash, audio_format):
+        """Points an item at a blob (recorded in memory until save())."""
+        relpath = self.blob_relpath(content_hash, audio_format)
+        entry = {"hash": content_hash, "format": audio_format, "mime": AUDIO_FORMATS[audio_format]['mime'],
+                 "path": relpath, "url": f"{self.url_prefix}/{relpath}"}
+        with self._lock:
+            if self._items.get(key) != entry:
+                self._items[key] = entry
+                self._dirty.add(key)
+
+    def get(self, key):
+        with self._lock: return self._items.get(key)
+
+    def items(self):
+        with self._lock: return dict(self._items)
+
+    def save(self):
+        """Writes the manifest atomically, merging in entries written meanwhile by other processes."""
+        with self._lock:
+            if not self._dirty: return
+            items = self._read_manifest().get("items", {})
+            items.update({key: self._items[key] for key in self._dirty})
+            self._items = items
+            self._dirty.clear()
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = self.manifest_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"items": dict(sorted(items.items()))}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.manifest_path)
+
+    def stats(self):
+        """Items, distinct blobs referenced and their total size on disk."""
+        with self._lock: paths = {entry["path"] for entry in self._items.values()}
+        size = sum(os.path.getsize(os.path.join(self.root, p)) for p in paths if os.path.exists(os.path.join(self.root, p)))
+        return {"items": len(self._items), "blobs": len(paths), "bytes": size}
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_audio_store(root, url_prefix=PUBLIC_URL_PREFIX):
+    """Returns the process-wide AudioStore for root, shared by concurrent generators."""
+    with _stores_lock:
+        if root not in _stores: _stores[root] = AudioStore(root, url_prefix)
+        return _stores[root]
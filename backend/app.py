@@ -1,16 +1,43 @@
 import sqlite3
 import json
 import os
-import vertexai
-from vertexai.generative_models import GenerativeModel, Part, Content
-from flask import Flask, jsonify, abort, request # Added request
+import queue
+import sys
+import threading
+import time
+from flask import Flask, jsonify, abort, request, stream_with_context # Added request
 from flask_cors import CORS # To handle Cross-Origin Resource Sharing
 
+# Allow importing the shared modules that live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_pool import ConnectionPool
+from embedding_index import EmbeddingIndexHolder
+from http_cache import CompressedBodyCache, body_version, prepare_response
+from knowledge_base import KnowledgeBase
+from manual_documents import content_version, get_manual_document, serialize_document
+from manual_loader import load_manual
+from model_clients import get_generative_model
+from qa_cache import AnswerCache
+from qa_retrieval import Bm25Index, build_context, chunk_sources, format_catalog, fuse_rankings, index_for_snapshot, iter_chunks
+from search_index import search
+
 app = Flask(__name__)
 CORS(app) # Allow requests from your React frontend development server
 
 DATABASE_FILE = 'manuals.db' # Path relative to project root
-KNOWLEDGE_JSON_FILE = 'all_manuals_knowledge.json' # Path relative to project root
+KNOWLEDGE_JSON_FILE = 'all_manuals_knowledge.json' # Path relative to project root (or a .jsonl export / shard directory)
+EMBEDDING_INDEX_DIR = 'embedding_index' # Path relative to project root (optional)
+DB_POOL_MAX_CONNECTIONS = 8 # Upper bound on concurrently open read connections
+DB_POOL_TIMEOUT_SECONDS = 5 # How long a request waits for a free connection
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+QA_TOP_K = 40 # Chunks considered for the QA prompt
+QA_CONTEXT_TOKEN_BUDGET = 8000 # Approximate prompt tokens spent on the manual catalog and retrieved chunks
+QA_CATALOG_TOKEN_BUDGET = 500 # Part of the budget above reserved for the list of manual titles
+QA_CACHE_FILE = 'qa_cache.db' # Path relative to project root (None disables the answer cache)
+QA_CACHE_MAX_ENTRIES = 5000
+QA_CACHE_TTL_SECONDS = 7 * 24 * 3600
+QA_CACHE_SIMILARITY_THRESHOLD = 0.8 # Near-duplicate question matching (None = exact matches only)
 
 # --- Vertex AI Config ---
 PROJECT_ID = "bliss-hack25fra-9531"
@@ -19,19 +46,47 @@ MODEL_NAME = "gemini-2.0-flash" # Or your preferred model for QA
 # --- End Vertex AI Config ---
 
 
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def get_db_pool():
+    """Returns the shared read-only connection pool, creating it on first use."""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                if not os.path.exists(DATABASE_FILE):
+                    print(f"FATAL ERROR: Database file '{DATABASE_FILE}' not found.")
+                    return None
+                _db_pool = ConnectionPool(DATABASE_FILE, max_connections=DB_POOL_MAX_CONNECTIONS)
+                print(f"Database pool ready for {DATABASE_FILE} (journal_mode={_db_pool.journal_mode})")
+    return _db_pool
+
 def get_db_connection():
-    """Connects to the specific database."""
-    if not os.path.exists(DATABASE_FILE):
-        print(f"FATAL ERROR: Database file '{DATABASE_FILE}' not found.")
-        return None
+    """Returns this request thread's pooled, read-only connection to the database."""
+    pool = get_db_pool()
+    if pool is None: return None
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        conn.row_factory = sqlite3.Row
-        return conn
-    except sqlite3.Error as e:
+        return pool.acquire(timeout=DB_POOL_TIMEOUT_SECONDS)
+    except (sqlite3.Error, queue.Empty) as e:
         print(f"Database connection error: {e}")
         return None
 
+_compressed_bodies = CompressedBodyCache()
+knowledge_base = KnowledgeBase(KNOWLEDGE_JSON_FILE)
+embedding_index = EmbeddingIndexHolder(EMBEDDING_INDEX_DIR)
+
+def conditional_json_response(body, version):
+    """Returns a JSON body with a strong ETag, answering If-None-Match with 304 and compressing if accepted."""
+    status, payload, headers = prepare_response(body, version, request.headers.get('If-None-Match'),
+                                                request.headers.get('Accept-Encoding'), _compressed_bodies)
+    return app.response_class(payload, status=status, mimetype='application/json', headers=headers)
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """Hands the request's connection back to the pool."""
+    if _db_pool is not None: _db_pool.release()
+
 @app.route('/api/manuals', methods=['GET'])
 def get_manuals_list():
     """Returns a list of available manuals."""
@@ -39,12 +94,11 @@ def get_manuals_list():
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
     try:
         manuals = conn.execute('SELECT manual_id, title, source_path FROM manuals ORDER BY title').fetchall()
-        conn.close()
         manuals_list = [dict(row) for row in manuals]
-        return jsonify(manuals_list)
+        body = json.dumps(manuals_list, ensure_ascii=False, separators=(',', ':'))
+        return conditional_json_response(body, body_version(body.encode('utf-8')))
     except sqlite3.Error as e:
         print(f"Error fetching manuals list: {e}")
-        if conn: conn.close()
         return jsonify({"error": "Failed to fetch manuals list"}), 500
 
 
@@ -54,100 +108,286 @@ def get_manual_details(manual_id):
     conn = get_db_connection()
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
     try:
-        manual_meta = conn.execute('SELECT * FROM manuals WHERE manual_id = ?', (manual_id,)).fetchone()
-        if manual_meta is None: conn.close(); abort(404, description="Manual not found")
-
-        output_data = dict(manual_meta)
-        try: output_data['features'] = json.loads(output_data.get('features', '[]') or '[]')
-        except (json.JSONDecodeError, TypeError): output_data['features'] = []
-        try: output_data['special_features'] = json.loads(output_data.get('special_features', '[]') or '[]')
-        except (json.JSONDecodeError, TypeError): output_data['special_features'] = []
-
-        tabs = conn.execute("SELECT tab_id, tab_key, title, tab_order, content_type FROM tabs WHERE manual_id = ? ORDER BY tab_order", (manual_id,)).fetchall()
-        output_data['tabs'] = []
-        for tab_row in tabs:
-            tab_data = dict(tab_row); tab_id = tab_data['tab_id']; content_type = tab_data['content_type']; tab_key = tab_data['tab_key']
-            if content_type == 'list':
-                items = conn.execute("SELECT item_order, text FROM tab_content_list WHERE tab_id = ? ORDER BY item_order", (tab_id,)).fetchall()
-                tab_data['content'] = [{"id": f"{tab_key}_item_{item['item_order']:02d}", "text": item['text']} for item in items]
-            elif content_type == 'steps':
-                steps_raw = conn.execute("SELECT step_order, text, warning, note FROM tab_content_steps WHERE tab_id = ? ORDER BY step_order", (tab_id,)).fetchall()
-                steps_list = [{"id": f"{tab_key}_step_{step['step_order']:02d}", "text": step['text']} for step in steps_raw]
-                warning = steps_raw[0]['warning'] if steps_raw and steps_raw[0]['warning'] else None
-                note = steps_raw[-1]['note'] if steps_raw and steps_raw[-1]['note'] else None
-                steps_content = {"steps": steps_list}
-                if warning: steps_content["warning"] = warning
-                if note: steps_content["note"] = note
-                tab_data['content'] = steps_content
-            elif content_type == 'text':
-                text_content = conn.execute("SELECT text FROM tab_content_text WHERE tab_id = ?", (tab_id,)).fetchone()
-                tab_data['content'] = text_content['text'] if text_content else ""
-            output_data['tabs'].append(tab_data)
-        conn.close()
-        return jsonify(output_data)
+        # Serve the pre-serialized document; fall back to assembling it if not materialized yet
+        try: materialized = get_manual_document(conn, manual_id)
+        except sqlite3.OperationalError: materialized = None # manual_documents table missing
+        if materialized is not None:
+            document, version = materialized
+        else:
+            output_data = load_manual(conn, manual_id, include_assets=True)
+            if output_data is None: return jsonify({"error": "Manual not found"}), 404
+            print(f"Warning: Manual {manual_id} has no materialized document. Run 'python manual_documents.py'.")
+            document = serialize_document(output_data)
+            version = content_version(document)
+        return conditional_json_response(document, version)
     except sqlite3.Error as e:
         print(f"Error fetching details for manual {manual_id}: {e}")
-        if conn: conn.close()
         return jsonify({"error": f"Failed to fetch details for manual {manual_id}"}), 500 # Added return
     except Exception as e:
          print(f"Unexpected error for manual {manual_id}: {e}")
-         if conn: conn.close()
          return jsonify({"error": "An unexpected error occurred"}), 500 # Added return
 
+@app.route('/api/search', methods=['GET'])
+def search_manuals():
+    """Full-text search over manual content. Query params: q (required), limit, manual_id."""
+    query = request.args.get('q', '').strip()
+    if not query: return jsonify({"error": "Missing 'q' query parameter"}), 400
+    limit = max(1, min(request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int), SEARCH_MAX_LIMIT))
+    manual_id = request.args.get('manual_id', type=int)
+
+    conn = get_db_connection()
+    if conn is None: return jsonify({"error": "Database connection failed"}), 500
+    try:
+        return jsonify({"query": query, "results": search(conn, query, limit=limit, manual_id=manual_id)})
+    except sqlite3.OperationalError as e:
+        print(f"Search error for '{query}': {e} (run setup_database.py and search_index.py?)")
+        return jsonify({"error": "Search index unavailable"}), 503
+    except sqlite3.Error as e:
+        print(f"Search error for '{query}': {e}")
+        return jsonify({"error": "Search failed"}), 500
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Returns runtime statistics for the backend's shared resources."""
+    pool = get_db_pool()
+    answer_cache = get_answer_cache()
+    return jsonify({"db_pool": pool.stats() if pool else None, "compressed_bodies": _compressed_bodies.stats(),
+                    "qa_cache": answer_cache.stats() if answer_cache else None})
+
 # --- New QA Endpoint ---
-@app.route('/api/qa', methods=['POST'])
-def handle_qa():
-    """Handles QA requests using the full knowledge base."""
-    if not request.is_json: return jsonify({"error": "Request must be JSON"}), 400
+class QaContextError(Exception):
+    """Raised when the context for a QA request can't be built; carries the HTTP status to return."""
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
 
-    data = request.get_json()
-    user_question = data.get('question')
-    if not user_question: return jsonify({"error": "Missing 'question' in request body"}), 400
+def load_scoped_manual(manual_id, tab_key=None):
+    """Loads one manual's assembled document from the DB, optionally keeping only one tab."""
+    conn = get_db_connection()
+    if conn is None: raise QaContextError("Database connection failed")
+    try:
+        try: materialized = get_manual_document(conn, manual_id)
+        except sqlite3.OperationalError: materialized = None # manual_documents table missing
+        manual = json.loads(materialized[0]) if materialized else load_manual(conn, manual_id)
+    except sqlite3.Error as e:
+        print(f"Error loading manual {manual_id} for QA: {e}")
+        raise QaContextError(f"Failed to load manual {manual_id}")
+    if manual is None: raise QaContextError(f"Manual {manual_id} not found", 404)
+    if tab_key:
+        manual['tabs'] = [tab for tab in manual['tabs'] if tab.get('tab_key') == tab_key]
+        if not manual['tabs']: raise QaContextError(f"Tab '{tab_key}' not found in manual {manual_id}", 404)
+    return manual
+
+def rank_chunks(question, keyword_index, manual_id=None):
+    """Ranks chunks with BM25, fused with the embedding index when one is available."""
+    ranked = keyword_index.search(question, top_k=QA_TOP_K)
+    vector_index = embedding_index.get() # Optional semantic index (see embedding_index.py)
+    if vector_index is not None:
+        try:
+            vector_ranked = vector_index.search(question, top_k=QA_TOP_K, manual_id=manual_id)
+            if manual_id is not None: # Keep only chunks that are part of the (possibly tab-filtered) scope
+                in_scope = {(c.manual_id, c.item_id) for c in keyword_index.chunks}
+                vector_ranked = [(score, c) for score, c in vector_ranked if (c.manual_id, c.item_id) in in_scope]
+            ranked = fuse_rankings(ranked, vector_ranked)
+        except Exception as e: print(f"Warning: Embedding search failed, using keyword ranking only: {e}")
+    return ranked
+
+def prepare_qa_context(question, manual_id=None, tab_key=None):
+    """Builds the prompt context for a question. Returns (catalog_text, context_text, selected_chunks).
+
+    Without a manual_id the best chunks of the whole knowledge base are used; with
+    one, the context comes only from that manual (and tab), read from the DB.
+    """
+    if manual_id is not None:
+        manual = load_scoped_manual(manual_id, tab_key)
+        chunks = list(iter_chunks([manual]))
+        context_text, selected_chunks = build_context([(0.0, c) for c in chunks], token_budget=QA_CONTEXT_TOKEN_BUDGET)
+        if len(selected_chunks) < len(chunks): # Manual doesn't fit the budget: keep its most relevant chunks
+            context_text, selected_chunks = build_context(rank_chunks(question, Bm25Index(chunks), manual_id), token_budget=QA_CONTEXT_TOKEN_BUDGET)
+        print(f"QA context (manual {manual_id}{'/' + tab_key if tab_key else ''}): {len(selected_chunks)} of {len(chunks)} chunks ({len(context_text)} chars).")
+        return format_catalog([manual]), context_text, selected_chunks
 
-    # 1. Load the knowledge base JSON
+    # Get the in-memory knowledge base (reloaded only when the file changes)
     try:
-        if not os.path.exists(KNOWLEDGE_JSON_FILE): return jsonify({"error": f"Knowledge base file '{KNOWLEDGE_JSON_FILE}' not found. Run export script."}), 500
-        with open(KNOWLEDGE_JSON_FILE, 'r', encoding='utf-8') as f: knowledge_base = json.load(f)
-        knowledge_text = json.dumps(knowledge_base) # Use compact JSON for prompt
-    except Exception as e: print(f"Error loading knowledge base {KNOWLEDGE_JSON_FILE}: {e}"); return jsonify({"error": "Failed to load knowledge base"}), 500
+        snapshot = knowledge_base.snapshot()
+        index = index_for_snapshot(snapshot)
+    except FileNotFoundError: raise QaContextError(f"Knowledge base file '{KNOWLEDGE_JSON_FILE}' not found. Run export script.")
+    except Exception as e: print(f"Error loading knowledge base {KNOWLEDGE_JSON_FILE}: {e}"); raise QaContextError("Failed to load knowledge base")
 
-    # 2. Prepare prompt for LLM
-    max_knowledge_chars = 150000 # Example limit
-    if len(knowledge_text) > max_knowledge_chars:
-        print(f"Warning: Knowledge base text truncated to {max_knowledge_chars} chars for prompt.")
-        knowledge_text = knowledge_text[:max_knowledge_chars] # Simple truncation
+    # The catalog is capped too, so the prompt does not grow with the number of manuals
+    context_text, selected_chunks = build_context(rank_chunks(question, index), token_budget=QA_CONTEXT_TOKEN_BUDGET - QA_CATALOG_TOKEN_BUDGET)
+    catalog_text = format_catalog(snapshot.manuals, QA_CATALOG_TOKEN_BUDGET, {c.manual_id for c in selected_chunks})
+    print(f"QA context: {len(selected_chunks)} of {len(index.chunks)} chunks ({len(context_text)} chars).")
+    return catalog_text, context_text, selected_chunks
 
-    combined_prompt = f"""
-Context: You are a helpful assistant knowledgeable about the technical manuals provided below in JSON format. Answer the user's question based *only* on the information contained within this JSON data. If the answer cannot be found in the provided data, say "I cannot find information about that in the provided manuals."
+def qa_scope(manual_id=None, tab_key=None):
+    """Cache scope of a QA request: 'all', 'manual:<id>' or 'manual:<id>/<tab_key>'."""
+    if manual_id is None: return 'all'
+    return f"manual:{manual_id}/{tab_key}" if tab_key else f"manual:{manual_id}"
 
-Provided Manuals Data (JSON):
-```json
-{knowledge_text}
-```
+def qa_knowledge_version(manual_id=None):
+    """Version of the knowledge a question would be answered from, or None if unknown (no caching)."""
+    if manual_id is None:
+        try: return f"{knowledge_base.snapshot().version}|{MODEL_NAME}"
+        except Exception: return None
+    conn = get_db_connection()
+    if conn is None: return None
+    try: row = conn.execute("SELECT content_version FROM manual_documents WHERE manual_id = ?", (manual_id,)).fetchone()
+    except sqlite3.Error: return None
+    return f"{row[0]}|{MODEL_NAME}" if row else None
+
+_qa_cache = None
+_qa_cache_lock = threading.Lock()
+
+def get_answer_cache():
+    """Returns the shared QA answer cache, or None if it is disabled or can't be opened."""
+    global _qa_cache
+    if _qa_cache is None and QA_CACHE_FILE:
+        with _qa_cache_lock:
+            if _qa_cache is None:
+                try: _qa_cache = AnswerCache(QA_CACHE_FILE, max_entries=QA_CACHE_MAX_ENTRIES, ttl_seconds=QA_CACHE_TTL_SECONDS,
+                                             similarity_threshold=QA_CACHE_SIMILARITY_THRESHOLD)
+                except sqlite3.Error as e: print(f"Warning: QA answer cache disabled, cannot open {QA_CACHE_FILE}: {e}"); return None
+    return _qa_cache
+
+def build_qa_prompt(question, catalog_text, context_text):
+    return f"""
+Context: You are a helpful assistant knowledgeable about technical manuals. Answer the user's question based *only* on the manual excerpts provided below. Each excerpt is prefixed with the manual and section it comes from. If the answer cannot be found in the provided excerpts, say "I cannot find information about that in the provided manuals."
+
+Available Manuals:
+{catalog_text}
+
+Relevant Manual Excerpts:
+{context_text or "(no matching excerpts)"}
 
-User Question: {user_question}
+User Question: {question}
 
 Answer:
 """
 
-    # 3. Call Vertex AI Gemini
+def validate_qa_body(data):
+    """Validates a parsed QA request body. Returns (question, manual_id, tab_key, error_message)."""
+    if not isinstance(data, dict): return None, None, None, "Request must be JSON"
+    user_question = data.get('question')
+    if not user_question: return None, None, None, "Missing 'question' in request body"
+    if not isinstance(user_question, str) or not user_question.strip(): return None, None, None, "'question' must be a non-empty string"
+    manual_id = data.get('manual_id')
+    if manual_id is not None:
+        try: manual_id = int(manual_id)
+        except (TypeError, ValueError): return None, None, None, "'manual_id' must be an integer"
+    tab_key = data.get('tab_key') or None
+    if tab_key is not None and manual_id is None: return None, None, None, "'tab_key' requires 'manual_id'"
+    return user_question, manual_id, tab_key, None
+
+def parse_qa_request():
+    """Validates the QA request body. Returns (question, manual_id, tab_key, error_response)."""
+    if not request.is_json: return None, None, None, (jsonify({"error": "Request must be JSON"}), 400)
+    user_question, manual_id, tab_key, error = validate_qa_body(request.get_json())
+    if error: return None, None, None, (jsonify({"error": error}), 400)
+    return user_question, manual_id, tab_key, None
+
+def sse_event(event, data):
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/qa', methods=['POST'])
+def handle_qa():
+    """Handles QA requests using the most relevant chunks of the knowledge base, or of one manual.
+
+    Body: {"question": str, "manual_id": int (optional), "tab_key": str (optional, needs manual_id)}
+    Clients sending 'Accept: text/event-stream' get the streaming variant (see handle_qa_stream).
+    """
+    if 'text/event-stream' in request.headers.get('Accept', ''): return handle_qa_stream()
+    user_question, manual_id, tab_key, error_response = parse_qa_request()
+    if error_response: return error_response
+
+    # 0. Answer repeated questions from the cache
+    answer_cache, scope, version = get_answer_cache(), qa_scope(manual_id, tab_key), qa_knowledge_version(manual_id)
+    if answer_cache is not None and version is not None:
+        cached = answer_cache.get(user_question, version, scope)
+        if cached is not None:
+            print(f"QA answer served from cache ({'near-duplicate' if cached['near_duplicate'] else 'exact'} match, scope {scope}).")
+            return jsonify({"answer": cached["answer"], "sources": cached["sources"], "cached": True})
+
+    # 1. Retrieve the relevant chunks and prepare the prompt
+    try: catalog_text, context_text, selected_chunks = prepare_qa_context(user_question, manual_id, tab_key)
+    except QaContextError as e: return jsonify({"error": str(e)}), e.status
+    combined_prompt = build_qa_prompt(user_question, catalog_text, context_text)
+
+    # 2. Call Vertex AI Gemini
     try:
         print(f"Sending QA request to Gemini model ({MODEL_NAME})...")
-        vertexai.init(project=PROJECT_ID, location=LOCATION)
-        model = GenerativeModel(MODEL_NAME)
+        model = get_generative_model(MODEL_NAME, PROJECT_ID, LOCATION)
         # Send simple text prompt
         response = model.generate_content(combined_prompt)
 
         answer = response.text.strip()
         print("Received QA answer from model.")
-        return jsonify({"answer": answer})
+        sources = chunk_sources(selected_chunks)
+        if answer_cache is not None and version is not None: answer_cache.put(user_question, version, scope, answer, sources)
+        return jsonify({"answer": answer, "sources": sources, "cached": False})
 
     except Exception as e:
         print(f"Error during QA processing or Vertex AI interaction: {e}")
         return jsonify({"error": "Failed to get answer from AI model"}), 500
 
+@app.route('/api/qa/stream', methods=['POST'])
+def handle_qa_stream():
+    """Streams a QA answer as Server-Sent Events.
+
+    Events: 'token' ({"text"}) for each piece of the answer as the model produces it,
+    then 'done' ({"sources", "cached", "timings"}) or 'error' ({"error"}).
+    Request validation and context errors are returned as plain JSON errors.
+    """
+    started = time.perf_counter()
+    user_question, manual_id, tab_key, error_response = parse_qa_request()
+    if error_response: return error_response
+    sse_headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} # Don't let proxies buffer the stream
+
+    answer_cache, scope, version = get_answer_cache(), qa_scope(manual_id, tab_key), qa_knowledge_version(manual_id)
+    if answer_cache is not None and version is not None:
+        cached = answer_cache.get(user_question, version, scope)
+        if cached is not None:
+            timings = {"total_ms": round((time.perf_counter() - started) * 1000, 1)}
+            body = sse_event('token', {"text": cached["answer"]}) + sse_event('done', {"sources": cached["sources"], "cached": True, "timings": timings})
+            return app.response_class(body, mimetype='text/event-stream', headers=sse_headers)
+
+    try: catalog_text, context_text, selected_chunks = prepare_qa_context(user_question, manual_id, tab_key)
+    except QaContextError as e: return jsonify({"error": str(e)}), e.status
+    combined_prompt = build_qa_prompt(user_question, catalog_text, context_text)
+    context_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def generate():
+        first_token_ms, parts = None, []
+        try:
+            print(f"Streaming QA request to Gemini model ({MODEL_NAME})...")
+            model = get_generative_model(MODEL_NAME, PROJECT_ID, LOCATION)
+            for response_chunk in model.generate_content(combined_prompt, stream=True):
+                try: text = response_chunk.text
+                except ValueError: continue # Chunk without text (e.g. only finish metadata)
+                if not text: continue
+                if first_token_ms is None: first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                parts.append(text)
+                yield sse_event('token', {"text": text})
+
+            answer = "".join(parts).strip()
+            print("Finished streaming QA answer from model.")
+            sources = chunk_sources(selected_chunks)
+            if answer_cache is not None and version is not None and answer: answer_cache.put(user_question, version, scope, answer, sources)
+            timings = {"context_ms": context_ms, "first_token_ms": first_token_ms, "total_ms": round((time.perf_counter() - started) * 1000, 1)}
+            yield sse_event('done', {"sources": sources, "cached": False, "timings": timings})
+        except Exception as e:
+            print(f"Error during streaming QA or Vertex AI interaction: {e}")
+            yield sse_event('error', {"error": "Failed to get answer from AI model"})
+
+    return app.response_class(stream_with_context(generate()), mimetype='text/event-stream', headers=sse_headers)
+
 
 if __name__ == '__main__':
+    # Create the shared model client up front so the first QA request doesn't pay for it
+    try: get_generative_model(MODEL_NAME, PROJECT_ID, LOCATION)
+    except Exception as e: print(f"Warning: Could not initialize model client ({e}); retrying on first QA request.")
+
     if not os.path.exists(DATABASE_FILE):
         print(f"ERROR: Database file '{DATABASE_FILE}' not found.")
         print("Please run 'python setup_database.py' first.")
@@ -0,0 +1,161 @@
+import asyncio
+import functools
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+# Required for this serving mode: pip install starlette uvicorn a2wsgi
+import uvicorn
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import app as flask_backend
+from model_clients import get_generative_model
+from qa_retrieval import chunk_sources
+
+# Production serving mode for the backend. The QA endpoints run natively async:
+# the Gemini call is awaited, so hundreds of questions can wait on the model
+# without holding a thread each. Their SQLite and retrieval work runs on a small
+# bounded executor. Every other route is the Flask app from app.py, served
+# through a2wsgi on its own bounded thread pool, so catalog reads never queue
+# behind model calls.
+#
+#     python backend/asgi.py   (or: uvicorn backend.asgi:app --port 5001 from the project root)
+
+# --- Configuration ---
+HOST = '0.0.0.0'
+PORT = 5001
+DB_EXECUTOR_WORKERS = flask_backend.DB_POOL_MAX_CONNECTIONS # Threads for QA cache/DB/retrieval work
+WSGI_WORKERS = flask_backend.DB_POOL_MAX_CONNECTIONS # Threads serving the Flask routes
+QA_MAX_CONCURRENT_MODEL_CALLS = 256 # Requests awaiting the model at once; more wait for a slot
+# --- End Configuration ---
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="asgi-db")
+_model_slots = asyncio.Semaphore(QA_MAX_CONCURRENT_MODEL_CALLS)
+
+def _with_pooled_connection(fn, *args):
+    """Runs fn on an executor thread and hands back the pooled connection it may have checked out."""
+    try: return fn(*args)
+    finally:
+        if flask_backend._db_pool is not None: flask_backend._db_pool.release()
+
+async def run_db(fn, *args):
+    """Runs blocking (SQLite, retrieval) work on the bounded DB executor."""
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, functools.partial(_with_pooled_connection, fn, *args))
+
+def _lookup_cached_answer(question, manual_id, tab_key):
+    """Blocking part of a QA request before the model call. Returns (answer_cache, scope, version, cached)."""
+    answer_cache, scope, version = flask_backend.get_answer_cache(), flask_backend.qa_scope(manual_id, tab_key), flask_backend.qa_knowledge_version(manual_id)
+    cached = answer_cache.get(question, version, scope) if answer_cache is not None and version is not None else None
+    return answer_cache, scope, version, cached
+
+async def read_qa_request(request):
+    """Parses and validates the QA body. Returns (question, manual_id, tab_key, error_response)."""
+    if 'application/json' not in request.headers.get('content-type', ''):
+        return None, None, None, JSONResponse({"error": "Request must be JSON"}, status_code=400)
+    try: data = await request.json()
+    except ValueError: return None, None, None, JSONResponse({"error": "Invalid JSON body"}, status_code=400)
+    user_question, manual_id, tab_key, error = flask_backend.validate_qa_body(data)
+    if error: return None, None, None, JSONResponse({"error": error}, status_code=400)
+    return user_question, manual_id, tab_key, None
+
+async def handle_qa(request):
+    """Async variant of app.handle_qa (same request body and responses)."""
+    if 'text/event-stream' in request.headers.get('accept', ''): return await handle_qa_stream(request)
+    user_question, manual_id, tab_key, error_response = await read_qa_request(request)
+    if error_response: return error_response
+
+    answer_cache, scope, version, cached = await run_db(_lookup_cached_answer, user_question, manual_id, tab_key)
+    if cached is not None:
+        print(f"QA answer served from cache ({'near-duplicate' if cached['near_duplicate'] else 'exact'} match, scope {scope}).")
+        return JSONResponse({"answer": cached["answer"], "sources": cached["sources"], "cached": True})
+
+    try: catalog_text, context_text, selected_chunks = await run_db(flask_backend.prepare_qa_context, user_question, manual_id, tab_key)
+    except flask_backend.QaContextError as e: return JSONResponse({"error": str(e)}, status_code=e.status)
+    combined_prompt = flask_backend.build_qa_prompt(user_question, catalog_text, context_text)
+
+    try:
+        model = get_generative_model(flask_backend.MODEL_NAME, flask_backend.PROJECT_ID, flask_backend.LOCATION)
+        async with _model_slots:
+            response = await model.generate_content_async(combined_prompt)
+        answer = response.text.strip()
+        sources = chunk_sources(selected_chunks)
+        if answer_cache is not None and version is not None: await run_db(answer_cache.put, user_question, version, scope, answer, sources)
+        return JSONResponse({"answer": answer, "sources": sources, "cached": False})
+    except Exception as e:
+        print(f"Error during QA processing or Vertex AI interaction: {e}")
+        return JSONResponse({"error": "Failed to get answer from AI model"}, status_code=500)
+
+async def handle_qa_stream(request):
+    """Async variant of app.handle_qa_stream: the same Server-Sent Events."""
+    started = time.perf_counter()
+    user_question, manual_id, tab_key, error_response = await read_qa_request(request)
+    if error_response: return error_response
+    sse_headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    sse_event = flask_backend.sse_event
+
+    answer_cache, scope, version, cached = await run_db(_lookup_cached_answer, user_question, manual_id, tab_key)
+    if cached is not None:
+        timings = {"total_ms": round((time.perf_counter() - started) * 1000, 1)}
+        body = sse_event('token', {"text": cached["answer"]}) + sse_event('done', {"sources": cached["sources"], "cached": True, "timings": timings})
+        return StreamingResponse(iter([body]), media_type='text/event-stream', headers=sse_headers)
+
+    try: catalog_text, context_text, selected_chunks = await run_db(flask_backend.prepare_qa_context, user_question, manual_id, tab_key)
+    except flask_backend.QaContextError as e: return JSONResponse({"error": str(e)}, status_code=e.status)
+    combined_prompt = flask_backend.build_qa_prompt(user_question, catalog_text, context_text)
+    context_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    async def generate():
+        first_token_ms, parts = None, []
+        try:
+            model = get_generative_model(flask_backend.MODEL_NAME, flask_backend.PROJECT_ID, flask_backend.LOCATION)
+            async with _model_slots:
+                async for response_chunk in await model.generate_content_async(combined_prompt, stream=True):
+                    try: text = response_chunk.text
+                    except ValueError: continue # Chunk without text (e.g. only finish metadata)
+                    if not text: continue
+                    if first_token_ms is None: first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                    parts.append(text)
+                    yield sse_event('token', {"text": text})
+
+            answer = "".join(parts).strip()
+            sources = chunk_sources(selected_chunks)
+            if answer_cache is not None and version is not None and answer: await run_db(answer_cache.put, user_question, version, scope, answer, sources)
+            timings = {"context_ms": context_ms, "first_token_ms": first_token_ms, "total_ms": round((time.perf_counter() - started) * 1000, 1)}
+            yield sse_event('done', {"sources": sources, "cached": False, "timings": timings})
+        except Exception as e:
+            print(f"Error during streaming QA or Vertex AI interaction: {e}")
+            yield sse_event('error', {"error": "Failed to get answer from AI model"})
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=sse_headers)
+
+@asynccontextmanager
+async def lifespan(_app):
+    # Create the shared model client up front so the first QA request doesn't pay for it
+    try: await run_db(get_generative_model, flask_backend.MODEL_NAME, flask_backend.PROJECT_ID, flask_backend.LOCATION)
+    except Exception as e: print(f"Warning: Could not initialize model client ({e}); retrying on first QA request.")
+    yield
+    _db_executor.shutdown(wait=False)
+    if flask_backend._db_pool is not None: flask_backend._db_pool.close_all()
+
+app = Starlette(routes=[
+    Route('/api/qa', handle_qa, methods=['POST']),
+    Route('/api/qa/stream', handle_qa_stream, methods=['POST']),
+    Mount('/', WSGIMiddleware(flask_backend.app, workers=WSGI_WORKERS)), # All other routes
+], lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+
+
+if __name__ == '__main__':
+    if not os.path.exists(flask_backend.DATABASE_FILE):
+        print(f"ERROR: Database file '{flask_backend.DATABASE_FILE}' not found.")
+        print("Please run 'python setup_database.py' first.")
+    else:
+        print(f"Starting ASGI server on {HOST}:{PORT}, serving data from {flask_backend.DATABASE_FILE}")
+        uvicorn.run(app, host=HOST, port=PORT)
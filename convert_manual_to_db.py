@@ -1,10 +1,18 @@
 import argparse # Re-import argparse
+import hashlib
 import json
 import os
 import mimetypes
 import sqlite3
-import vertexai
-from vertexai.generative_models import GenerativeModel, Part, Content
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from vertexai.generative_models import Part
+from manual_documents import refresh_manual_documents
+from parse_cache import get_parse_cache, parse_cache_key
+from pdf_sections import CORE_TAB_HEADINGS, MAX_SECTION_PAGES, extract_pdf_pages, merge_section_results, split_sections
+from rate_limit import call_with_retries
+from model_clients import active_backend, get_generative_model
+from search_index import index_manuals
 
 # --- Configuration ---
 PROJECT_ID = "bliss-hack25fra-9531"
@@ -12,6 +20,16 @@ LOCATION = "europe-central2"
 # Use a more powerful Gemini model
 MODEL_NAME = "gemini-2.0-flash"
 DATABASE_FILE = 'manuals.db'
+GENERATION_CONFIG = {"temperature": 0.1, "top_p": 0.95, "top_k": 40, "max_output_tokens": 8192, "response_mime_type": "application/json"}
+PARSE_CACHE_FILE = 'parse_cache.db' # Raw model outputs, replayed for unchanged sources (None disables)
+SECTION_PARSE_MIN_PAGES = 20 # PDFs with at least this many pages are parsed in sections from their text (needs pypdf)
+SECTION_PARSE_WORKERS = 4 # Concurrent section requests, shared by all parses in the process
+SECTION_MAX_RETRIES = 3
+BULK_LOAD_BATCH_SIZE = 500 # Manuals per transaction when bulk-loading from the parse cache
+# Connection settings while ingesting. synchronous=NORMAL is durable in WAL mode; the fast-load settings
+# (synchronous=OFF) may lose the last transactions on power loss and are meant for rebuilds from the parse cache.
+INGEST_PRAGMAS = {"synchronous": "NORMAL", "cache_size": -64 * 1024, "temp_store": "MEMORY"}
+FAST_LOAD_PRAGMAS = {"synchronous": "OFF", "cache_size": -256 * 1024, "temp_store": "MEMORY"}
 # --- End Configuration ---
 
 # --- Target JSON Schema Description (for prompting the LLM) ---
@@ -53,21 +71,9 @@ def extract_text_from_txt(txt_path):
         return text
     except Exception as e: print(f"Error reading text file {txt_path}: {e}"); return None
 
-def parse_manual_with_llm(manual_file_path, project_id, location, model_name):
-    """Uses Vertex AI Gemini to parse a manual file (PDF/TXT) into the new JSON schema and translate to English."""
-    print(f"Processing file for LLM parsing: {manual_file_path}")
-    raw_response_text = ""
-    response = None
-    try:
-        with open(manual_file_path, "rb") as f: file_bytes = f.read()
-        mime_type, _ = mimetypes.guess_type(manual_file_path)
-        if not mime_type:
-            if manual_file_path.lower().endswith(".pdf"): mime_type = "application/pdf"
-            elif manual_file_path.lower().endswith(".txt"): mime_type = "text/plain"
-            else: mime_type = "text/plain"; print(f"Warning: Could not determine MIME type for {manual_file_path}. Assuming text/plain.")
-        print(f"Detected MIME type: {mime_type}")
-
-        prompt_header = f"""
+def build_prompt_header(manual_file_path):
+    """Parse instructions sent with every manual (the schema description included)."""
+    return f"""
 Analyze the provided technical manual content (either text or PDF). Structure its content into a JSON object adhering to the NEW schema described below.
 **IMPORTANT: Translate ALL extracted text content into English.**
 Add the original PDF path "{manual_file_path}" to the `sourcePdfPath` field.
@@ -84,6 +90,103 @@ Detailed Instructions:
 6. Omit tabs for missing core topics.
 7. Ensure the final output is ONLY the valid JSON object.
 """
+
+SECTION_INSTRUCTIONS = """
+The manual text below is only pages {first}-{last} of a {total}-page manual; the other pages are parsed separately and merged.{hint}
+Extract only what these pages contain: omit tabs without content on these pages, and leave `title`, `features` and `specialFeatures` empty if these pages do not state them.
+"""
+
+# Identify the prompts for the parse cache; the source path in them is overwritten after parsing anyway
+PROMPT_HASH = hashlib.sha256(build_prompt_header("").encode('utf-8')).hexdigest()
+SECTION_PROMPT_HASH = hashlib.sha256(json.dumps([build_prompt_header(""), SECTION_INSTRUCTIONS, SECTION_PARSE_MIN_PAGES,
+                                                 MAX_SECTION_PAGES, CORE_TAB_HEADINGS]).encode('utf-8')).hexdigest()
+
+_section_executor = None
+_section_executor_lock = threading.Lock()
+
+def _section_pool():
+    global _section_executor
+    with _section_executor_lock:
+        if _section_executor is None:
+            _section_executor = ThreadPoolExecutor(max_workers=SECTION_PARSE_WORKERS, thread_name_prefix="section")
+        return _section_executor
+
+def parse_pdf_sections(manual_file_path, pages, model, model_name):
+    """Parses the text of a large PDF section by section, concurrently, and merges the results in page order.
+
+    Sending text instead of the PDF keeps each request small, and each response stays within max_output_tokens.
+    Returns the merged manual, or None if any section fails.
+    """
+    sections = split_sections(pages)
+    print(f"Parsing {len(pages)} pages of {manual_file_path} in {len(sections)} sections with {model_name}...")
+    prompt_header = build_prompt_header(manual_file_path)
+
+    def parse_section(section):
+        first, last, tab_id, text = section
+        hint = f" They most likely belong to the '{tab_id}' topic." if tab_id else ""
+        prompt = (prompt_header + SECTION_INSTRUCTIONS.format(first=first + 1, last=last + 1, total=len(pages), hint=hint)
+                  + "\nManual Text:\n--- START TEXT ---\n" + text + "\n--- END TEXT ---\n\nGenerate the JSON object:")
+        response = call_with_retries(model.generate_content, contents=[Part.from_text(prompt)], generation_config=GENERATION_CONFIG,
+                                     max_retries=SECTION_MAX_RETRIES, label=f"{os.path.basename(manual_file_path)} pages {first + 1}-{last + 1}")
+        if not response.candidates or not response.candidates[0].content.parts:
+            raise ValueError(f"no content parts in the response for pages {first + 1}-{last + 1}")
+        return json.loads(response.candidates[0].content.parts[0].text)
+
+    try:
+        results = list(_section_pool().map(parse_section, sections)) # map keeps page order, so the merge is deterministic
+    except Exception as e:
+        print(f"Error parsing a section of {manual_file_path}: {e}")
+        return None
+    return merge_section_results(results)
+
+def cached_model_name(model_name):
+    """The model identity used in the parse cache: parses from non-Vertex backends (e.g. the fake) never mix with real ones."""
+    return model_name if active_backend() == 'vertex' else f"{active_backend()}:{model_name}"
+
+def _store_parse(cache, source_hash, manual_file_path, prompt_hash, model_name, raw_response_text):
+    model_name = cached_model_name(model_name)
+    try: cache.put(parse_cache_key(source_hash, prompt_hash, model_name, GENERATION_CONFIG), source_hash, manual_file_path,
+                   prompt_hash, model_name, GENERATION_CONFIG, raw_response_text)
+    except sqlite3.Error as e: print(f"Warning: Could not store parse in cache: {e}")
+
+def parse_manual_with_llm(manual_file_path, project_id, location, model_name, use_cache=True):
+    """Uses Vertex AI Gemini to parse a manual file (PDF/TXT) into the new JSON schema and translate to English.
+
+    PDFs of SECTION_PARSE_MIN_PAGES or more pages with a text layer are parsed in sections (parse_pdf_sections).
+    Model outputs are kept in the parse cache; a cached parse of the same file contents, prompt, model and
+    generation config is replayed without calling the model. use_cache=False forces a fresh parse (still stored).
+    """
+    print(f"Processing file for LLM parsing: {manual_file_path}")
+    raw_response_text = ""
+    response = None
+    try:
+        with open(manual_file_path, "rb") as f: file_bytes = f.read()
+        source_hash = hashlib.sha256(file_bytes).hexdigest()
+        cache = get_parse_cache(PARSE_CACHE_FILE) if PARSE_CACHE_FILE else None
+        if cache and use_cache:
+            for prompt_hash in (PROMPT_HASH, SECTION_PROMPT_HASH): # Whole-file or sectioned parse
+                raw_response_text = cache.get(parse_cache_key(source_hash, prompt_hash, cached_model_name(model_name), GENERATION_CONFIG))
+                if raw_response_text is not None:
+                    print(f"Using cached parse for {manual_file_path} (model {model_name}).")
+                    json_data = json.loads(raw_response_text)
+                    json_data["sourcePdfPath"] = manual_file_path
+                    return json_data
+        mime_type, _ = mimetypes.guess_type(manual_file_path)
+        if not mime_type:
+            if manual_file_path.lower().endswith(".pdf"): mime_type = "application/pdf"
+            elif manual_file_path.lower().endswith(".txt"): mime_type = "text/plain"
+            else: mime_type = "text/plain"; print(f"Warning: Could not determine MIME type for {manual_file_path}. Assuming text/plain.")
+        print(f"Detected MIME type: {mime_type}")
+
+        pages = extract_pdf_pages(manual_file_path, SECTION_PARSE_MIN_PAGES) if mime_type == "application/pdf" else None
+        if pages:
+            json_data = parse_pdf_sections(manual_file_path, pages, get_generative_model(model_name, project_id, location), model_name)
+            if json_data is None: return None
+            if cache: _store_parse(cache, source_hash, manual_file_path, SECTION_PROMPT_HASH, model_name, json.dumps(json_data, ensure_ascii=False))
+            json_data["sourcePdfPath"] = manual_file_path
+            return json_data
+
+        prompt_header = build_prompt_header(manual_file_path)
         # The API expects a list containing Part objects
         prompt_parts: list[Part] = []
 
@@ -99,12 +202,10 @@ Detailed Instructions:
         else: print(f"Error: Unsupported MIME type '{mime_type}'."); return None
 
         print(f"Sending request to Gemini model ({model_name})...")
-        vertexai.init(project=project_id, location=location)
-        model = GenerativeModel(model_name)
-        generation_config = {"temperature": 0.1, "top_p": 0.95, "top_k": 40, "max_output_tokens": 8192, "response_mime_type": "application/json"}
+        model = get_generative_model(model_name, project_id, location)
 
         # Pass the list of Part objects
-        response = model.generate_content(contents=prompt_parts, generation_config=generation_config) # Pass list of Parts
+        response = model.generate_content(contents=prompt_parts, generation_config=GENERATION_CONFIG) # Pass list of Parts
 
         print("Received response from model.")
         if not response.candidates or not response.candidates[0].content.parts:
@@ -113,7 +214,8 @@ Detailed Instructions:
         raw_response_text = response.candidates[0].content.parts[0].text
         json_data = json.loads(raw_response_text)
         print("Successfully parsed response as JSON.")
-        if "sourcePdfPath" not in json_data: json_data["sourcePdfPath"] = manual_file_path
+        if cache: _store_parse(cache, source_hash, manual_file_path, PROMPT_HASH, model_name, raw_response_text)
+        json_data["sourcePdfPath"] = manual_file_path # Always the real path: re-ingestion matches manuals by it
         return json_data
 
     except FileNotFoundError: print(f"Error: Input file not found at {manual_file_path}"); return None
@@ -121,63 +223,245 @@ Detailed Instructions:
     except Exception as e: print(f"Error during processing or Vertex AI interaction: {e}"); return None
 
 
-def insert_manual_data(conn, data):
-    """Inserts parsed manual data into the SQLite database. Returns manual_id if successful or existing, None on error."""
+def source_file_hash(path):
+    """SHA-256 of a source manual file. An unchanged hash means the manual needs no re-parse."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''): digest.update(block)
+    return digest.hexdigest()
+
+def get_ingested_manual(conn, source_path):
+    """Returns (manual_id, source_hash) for an already ingested source file, or None."""
+    row = conn.execute("SELECT manual_id, source_hash FROM manuals WHERE source_path = ?", (source_path,)).fetchone()
+    return (row[0], row[1]) if row else None
+
+# Content table, order column and value columns per tab type (text tabs hold a single row)
+CONTENT_TABLES = {
+    'list': ('tab_content_list', 'item_order', ('text',)),
+    'steps': ('tab_content_steps', 'step_order', ('text', 'warning', 'note')),
+    'text': ('tab_content_text', None, ('text',)),
+}
+
+def content_item_id(tab_key, tab_type, order):
+    """The item ID used by the API, search index and generated assets for a content row."""
+    if tab_type == 'list': return f"{tab_key}_item_{order:02d}"
+    if tab_type == 'steps': return f"{tab_key}_step_{order:02d}"
+    return f"{tab_key}_main"
+
+def normalize_tabs(data):
+    """Validates the parsed tabs into [{key, title, order, type, rows: {order: values}}], skipping invalid content."""
+    tabs = []
+    for i, tab in enumerate(data.get("tabs", [])):
+        tab_key, tab_title, tab_type, tab_content = tab.get("id"), tab.get("title"), tab.get("type"), tab.get("content")
+        if not all([tab_key, tab_title, tab_type]) or tab_content is None: print(f"Warning: Skipping tab due to missing data: {tab}"); continue
+        rows = {}
+        if tab_type == 'list' and isinstance(tab_content, list):
+            for j, item in enumerate(tab_content): # Expecting objects {id, text}; the JSON id is not stored
+                item_text = item.get("text")
+                if isinstance(item_text, str): rows[j] = (item_text,)
+                else: print(f"Warning: Skipping list item in tab '{tab_title}' due to missing/invalid data: {item}")
+        elif tab_type == 'steps' and isinstance(tab_content, dict):
+            warning, note, steps = tab_content.get("warning"), tab_content.get("note"), tab_content.get("steps", [])
+            if isinstance(steps, list):
+                for j, step in enumerate(steps): # Expecting objects {id, text}; warning/note live on the first/last step
+                    step_text = step.get("text")
+                    if isinstance(step_text, str): rows[j] = (step_text, warning if j == 0 else None, note if j == len(steps) - 1 else None)
+                    else: print(f"Warning: Skipping step in tab '{tab_title}' due to missing/invalid data: {step}")
+            else: print(f"Warning: 'steps' content in tab '{tab_title}' is not a list.")
+        elif tab_type == 'text' and isinstance(tab_content, str):
+            rows[0] = (tab_content,)
+        else:
+            print(f"Warning: Skipping content for tab '{tab_title}' due to unexpected type/structure: Type={tab_type}, Content Type={type(tab_content)}")
+            if tab_type not in CONTENT_TABLES: continue # Would violate the content_type CHECK constraint
+        tabs.append({"key": tab_key, "title": tab_title, "order": i, "type": tab_type, "rows": rows})
+    return tabs
+
+def _content_insert_sql(tab_type):
+    table, order_column, value_columns = CONTENT_TABLES[tab_type]
+    columns = ("tab_id",) + ((order_column,) if order_column else ()) + value_columns
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+
+def _content_values(tab_id, tab_type, rows):
+    order_column = CONTENT_TABLES[tab_type][1]
+    return [(tab_id,) + ((order,) if order_column else ()) + row for order, row in sorted(rows.items())]
+
+def _insert_content_rows(cursor, tab_id, tab_type, rows):
+    cursor.executemany(_content_insert_sql(tab_type), _content_values(tab_id, tab_type, rows))
+
+def _insert_tab(cursor, manual_id, tab):
+    cursor.execute("INSERT INTO tabs (manual_id, tab_key, title, tab_order, content_type) VALUES (?, ?, ?, ?, ?)",
+                   (manual_id, tab["key"], tab["title"], tab["order"], tab["type"]))
+    _insert_content_rows(cursor, cursor.lastrowid, tab["type"], tab["rows"])
+
+def _insert_tabs_bulk(cursor, new_manuals):
+    """Inserts the tabs of [(manual_id, normalized tabs)] with one executemany for the tabs and one per content table."""
+    if not new_manuals: return
+    cursor.executemany("INSERT INTO tabs (manual_id, tab_key, title, tab_order, content_type) VALUES (?, ?, ?, ?, ?)",
+                       [(manual_id, tab["key"], tab["title"], tab["order"], tab["type"]) for manual_id, tabs in new_manuals for tab in tabs])
+    manual_ids = [manual_id for manual_id, _ in new_manuals]
+    tab_ids = {}
+    for start in range(0, len(manual_ids), 500): # Stay below SQLite's host parameter limit
+        chunk = manual_ids[start:start + 500]
+        tab_ids.update({(row[1], row[2]): row[0] for row in cursor.execute(
+            f"SELECT tab_id, manual_id, tab_order FROM tabs WHERE manual_id IN ({', '.join('?' for _ in chunk)})", chunk)})
+    values = {tab_type: [] for tab_type in CONTENT_TABLES}
+    for manual_id, tabs in new_manuals:
+        for tab in tabs: values[tab["type"]] += _content_values(tab_ids[(manual_id, tab["order"])], tab["type"], tab["rows"])
+    for tab_type, rows in values.items():
+        if rows: cursor.executemany(_content_insert_sql(tab_type), rows)
+
+def _delete_tab(cursor, tab_id):
+    for table, _, _ in CONTENT_TABLES.values(): cursor.execute(f"DELETE FROM {table} WHERE tab_id = ?", (tab_id,))
+    cursor.execute("DELETE FROM tabs WHERE tab_id = ?", (tab_id,))
+
+def _load_tab_rows(cursor, tab_id, tab_type):
+    table, order_column, value_columns = CONTENT_TABLES[tab_type]
+    order_sql = order_column or "0"
+    return {row[0]: tuple(row[1:]) for row in cursor.execute(f"SELECT {order_sql}, {', '.join(value_columns)} FROM {table} WHERE tab_id = ?", (tab_id,))}
+
+def update_manual_data(conn, manual_id, data, source_hash=None):
+    """Applies a re-parsed manual as a diff against the stored rows. Does not commit.
+
+    Only changed manual fields, tabs and content rows are rewritten. Generated assets of
+    changed items are marked stale, those of removed items deleted. Returns (changed, removed) item IDs.
+    """
     cursor = conn.cursor()
-    source_path = data.get("sourcePdfPath")
-    title = data.get("title", "Untitled Manual")
-    manual_id = None
+    fields = (data.get("title", "Untitled Manual"), json.dumps(data.get("features", [])), json.dumps(data.get("specialFeatures", [])))
+    current = cursor.execute("SELECT title, features, special_features, source_hash FROM manuals WHERE manual_id = ?", (manual_id,)).fetchone()
+    if current[:3] != fields or (source_hash is not None and current[3] != source_hash):
+        cursor.execute("UPDATE manuals SET title = ?, features = ?, special_features = ?, source_hash = COALESCE(?, source_hash) WHERE manual_id = ?",
+                       fields + (source_hash, manual_id))
+
+    stored = {row[1]: row for row in cursor.execute(
+        "SELECT tab_id, tab_key, title, tab_order, content_type FROM tabs WHERE manual_id = ?", (manual_id,)).fetchall()}
+    changed, removed = [], []
+    for tab in normalize_tabs(data):
+        old = stored.pop(tab["key"], None)
+        if old is not None and old[4] != tab["type"]:
+            removed += [content_item_id(tab["key"], old[4], order) for order in _load_tab_rows(cursor, old[0], old[4])]
+            _delete_tab(cursor, old[0])
+            old = None
+        if old is None:
+            _insert_tab(cursor, manual_id, tab)
+            changed += [content_item_id(tab["key"], tab["type"], order) for order in tab["rows"]]
+            continue
+
+        tab_id = old[0]
+        if (old[2], old[3]) != (tab["title"], tab["order"]):
+            cursor.execute("UPDATE tabs SET title = ?, tab_order = ? WHERE tab_id = ?", (tab["title"], tab["order"], tab_id))
+        table, order_column, value_columns = CONTENT_TABLES[tab["type"]]
+        where = "tab_id = ?" + (f" AND {order_column} = ?" if order_column else "")
+        old_rows = _load_tab_rows(cursor, tab_id, tab["type"])
+        for order, row in tab["rows"].items():
+            if order not in old_rows:
+                _insert_content_rows(cursor, tab_id, tab["type"], {order: row})
+            elif old_rows[order] != row:
+                cursor.execute(f"UPDATE {table} SET {', '.join(c + ' = ?' for c in value_columns)} WHERE {where}",
+                               row + (tab_id,) + ((order,) if order_column else ()))
+            else:
+                continue
+            if order not in old_rows or old_rows[order][0] != row[0]: changed.append(content_item_id(tab["key"], tab["type"], order))
+        for order in old_rows.keys() - tab["rows"].keys():
+            cursor.execute(f"DELETE FROM {table} WHERE {where}", (tab_id,) + ((order,) if order_column else ()))
+            removed.append(content_item_id(tab["key"], tab["type"], order))
+
+    for old in stored.values(): # Tabs no longer present
+        removed += [content_item_id(old[1], old[4], order) for order in _load_tab_rows(cursor, old[0], old[4])]
+        _delete_tab(cursor, old[0])
+
+    # Invalidate generated media: stale for changed text (regenerated on the next run), gone for removed items
+    cursor.executemany("UPDATE assets SET source_text_hash = '' WHERE manual_id = ? AND item_id = ?", [(manual_id, i) for i in changed])
+    cursor.executemany("DELETE FROM assets WHERE manual_id = ? AND item_id = ?", [(manual_id, i) for i in removed])
+    return changed, removed
 
-    if not source_path: print("Error: Parsed data missing 'sourcePdfPath'."); return None
+def apply_ingest_pragmas(conn, fast=False):
+    """Tunes a connection for ingestion; fast=True uses FAST_LOAD_PRAGMAS (not durable, for rebuilds)."""
+    for name, value in (FAST_LOAD_PRAGMAS if fast else INGEST_PRAGMAS).items(): conn.execute(f"PRAGMA {name} = {value}")
 
-    cursor.execute("SELECT manual_id FROM manuals WHERE source_path = ?", (source_path,))
-    existing = cursor.fetchone()
-    if existing: print(f"Manual '{source_path}' already exists (ID: {existing[0]}). Skipping insertion."); return existing[0]
+def insert_manuals(conn, manuals, force=False):
+    """Writes parsed manuals, given as (data, source_hash) pairs, in a single transaction and commits.
 
+    New manuals are inserted with one executemany per table for the whole batch; manuals whose source_path
+    already exists are updated in place (see update_manual_data), or skipped if their recorded source_hash
+    equals source_hash (unless force is set). Documents and search rows are refreshed once for the batch.
+    Returns a manual_id (or None for invalid data) per input; on a database error nothing is written.
+    """
+    cursor = conn.cursor()
+    ids = [None] * len(manuals)
+    new_manuals, written = [], set()
     try:
-        features_json = json.dumps(data.get("features", []))
-        special_features_json = json.dumps(data.get("specialFeatures", []))
-        cursor.execute("INSERT INTO manuals (title, source_path, features, special_features) VALUES (?, ?, ?, ?)",
-                       (title, source_path, features_json, special_features_json))
-        manual_id = cursor.lastrowid
-        print(f"Inserted into manuals table, ID: {manual_id}")
-
-        tabs_data = data.get("tabs", [])
-        for i, tab in enumerate(tabs_data):
-            tab_key, tab_title, tab_type, tab_content = tab.get("id"), tab.get("title"), tab.get("type"), tab.get("content")
-            if not all([tab_key, tab_title, tab_type]) or tab_content is None: print(f"Warning: Skipping tab due to missing data: {tab}"); continue
-
-            cursor.execute("INSERT INTO tabs (manual_id, tab_key, title, tab_order, content_type) VALUES (?, ?, ?, ?, ?)",
-                           (manual_id, tab_key, tab_title, i, tab_type))
-            tab_id = cursor.lastrowid
-
-            if tab_type == 'list' and isinstance(tab_content, list):
-                for j, item in enumerate(tab_content): # Expecting objects {id, text}
-                    item_id_from_json = item.get("id") # We don't store this specific ID in DB
-                    item_text = item.get("text")
-                    if isinstance(item_text, str): cursor.execute("INSERT INTO tab_content_list (tab_id, item_order, text) VALUES (?, ?, ?)", (tab_id, j, item_text))
-                    else: print(f"Warning: Skipping list item in tab '{tab_title}' due to missing/invalid data: {item}")
-            elif tab_type == 'steps' and isinstance(tab_content, dict):
-                warning, note, steps = tab_content.get("warning"), tab_content.get("note"), tab_content.get("steps", [])
-                if isinstance(steps, list):
-                    for j, step in enumerate(steps): # Expecting objects {id, text}
-                        step_id_from_json = step.get("id") # We don't store this specific ID in DB
-                        step_text = step.get("text")
-                        if isinstance(step_text, str): cursor.execute("INSERT INTO tab_content_steps (tab_id, step_order, text, warning, note) VALUES (?, ?, ?, ?, ?)", (tab_id, j, step_text, warning if j == 0 else None, note if j == len(steps) - 1 else None))
-                        else: print(f"Warning: Skipping step in tab '{tab_title}' due to missing/invalid data: {step}")
-                else: print(f"Warning: 'steps' content in tab '{tab_title}' is not a list.")
-            elif tab_type == 'text' and isinstance(tab_content, str):
-                 cursor.execute("INSERT INTO tab_content_text (tab_id, text) VALUES (?, ?)", (tab_id, tab_content))
-            else: print(f"Warning: Skipping content for tab '{tab_title}' due to unexpected type/structure: Type={tab_type}, Content Type={type(tab_content)}")
+        known = {row[0]: (row[1], row[2]) for row in cursor.execute("SELECT source_path, manual_id, source_hash FROM manuals")}
+        if not conn.in_transaction: cursor.execute("BEGIN")
+        for index, (data, source_hash) in enumerate(manuals):
+            source_path = data.get("sourcePdfPath")
+            title = data.get("title", "Untitled Manual")
+            if not source_path: print("Error: Parsed data missing 'sourcePdfPath'."); continue
+
+            existing = known.get(source_path)
+            if existing and not force and source_hash is not None and existing[1] == source_hash:
+                print(f"Manual '{source_path}' is unchanged (ID: {existing[0]}). Skipping.")
+                ids[index] = existing[0]
+                continue
+            if existing:
+                if any(manual_id == existing[0] for manual_id, _ in new_manuals): # Same file twice in this batch
+                    _insert_tabs_bulk(cursor, new_manuals)
+                    new_manuals = []
+                changed, removed = update_manual_data(conn, existing[0], data, source_hash)
+                print(f"Updated manual '{title}' (ID: {existing[0]}): {len(changed)} items changed or added, {len(removed)} removed.")
+                ids[index] = existing[0]
+            else:
+                cursor.execute("INSERT INTO manuals (title, source_path, source_hash, features, special_features) VALUES (?, ?, ?, ?, ?)",
+                               (title, source_path, source_hash, json.dumps(data.get("features", [])), json.dumps(data.get("specialFeatures", []))))
+                ids[index] = cursor.lastrowid
+                known[source_path] = (cursor.lastrowid, source_hash)
+                new_manuals.append((cursor.lastrowid, normalize_tabs(data)))
+                print(f"Inserted into manuals table, ID: {cursor.lastrowid}")
+            written.add(ids[index])
+        _insert_tabs_bulk(cursor, new_manuals)
 
+        # Materialize the API documents and update the search index in the same transaction
+        refresh_manual_documents(conn, sorted(written))
+        index_manuals(conn, sorted(written))
         conn.commit()
-        print(f"Successfully inserted data for manual '{title}' (ID: {manual_id})")
-        return manual_id # Return the new ID
+        return ids
+
+    except sqlite3.Error as e: print(f"Database error during insertion: {e}"); conn.rollback(); return [None] * len(manuals)
+    except Exception as e: print(f"Unexpected error during insertion: {e}"); conn.rollback(); return [None] * len(manuals)
+
+def insert_manual_data(conn, data, source_hash=None, force=False):
+    """Inserts parsed manual data into the SQLite database. Returns manual_id if successful or existing, None on error.
 
-    except sqlite3.Error as e: print(f"Database error during insertion: {e}"); conn.rollback(); return None
-    except Exception as e: print(f"Unexpected error during insertion: {e}"); conn.rollback(); return None
+    A manual whose source_path already exists is updated in place (see update_manual_data);
+    if its recorded source_hash equals source_hash, nothing is written unless force is set.
+    """
+    manual_id = insert_manuals(conn, [(data, source_hash)], force)[0]
+    if manual_id is not None: print(f"Successfully stored data for manual '{data.get('title', 'Untitled Manual')}' (ID: {manual_id})")
+    return manual_id
+
+def bulk_load_from_cache(db_file, batch_size=BULK_LOAD_BATCH_SIZE, fast=True):
+    """Loads the latest cached parse of every source (for the current prompt, model and generation config)
+    into the database without calling the model, batch_size manuals per transaction. Returns the number stored."""
+    cache = get_parse_cache(PARSE_CACHE_FILE)
+    entries = cache.latest_parses([PROMPT_HASH, SECTION_PROMPT_HASH], cached_model_name(MODEL_NAME), GENERATION_CONFIG)
+    print(f"Loading {len(entries)} cached parses into {db_file} ({'fast-load' if fast else 'normal'} mode)...")
+    conn = sqlite3.connect(db_file)
+    stored = 0
+    try:
+        apply_ingest_pragmas(conn, fast)
+        for start in range(0, len(entries), batch_size):
+            manuals = []
+            for source_path, source_hash, raw_response in entries[start:start + batch_size]:
+                try: data = json.loads(raw_response)
+                except json.JSONDecodeError as e: print(f"Warning: Skipping cached parse of {source_path}: {e}"); continue
+                data["sourcePdfPath"] = source_path
+                manuals.append((data, source_hash))
+            stored += sum(manual_id is not None for manual_id in insert_manuals(conn, manuals))
+    finally:
+        conn.close()
+    print(f"Loaded {stored} of {len(entries)} cached manuals.")
+    return stored
 
-def process_single_manual(input_path, db_file):
+def process_single_manual(input_path, db_file, use_cache=True):
     """Processes a single manual file and inserts data into the database. Returns the manual_id."""
     print("-" * 40)
     print(f"Processing Manual: {input_path}")
@@ -185,14 +469,25 @@ def process_single_manual(input_path, db_file):
     if not os.path.exists(input_path): print(f"Error: Input file not found at {input_path}"); return None
     if not os.path.exists(db_file): print(f"Error: Database file '{db_file}' not found."); return None
 
-    parsed_data = parse_manual_with_llm(input_path, PROJECT_ID, LOCATION, MODEL_NAME)
+    # Skip the (slow, paid) parse entirely when the source file is unchanged since its last ingestion
+    source_hash = source_file_hash(input_path)
+    conn = sqlite3.connect(db_file)
+    try: existing = get_ingested_manual(conn, input_path)
+    except sqlite3.OperationalError as e: print(f"Database error reading ingested manuals: {e} (run setup_database.py first?)"); return None
+    finally: conn.close()
+    if use_cache and existing and existing[1] == source_hash:
+        print(f"Manual '{input_path}' is unchanged since its last ingestion (ID: {existing[0]}). Skipping parse.")
+        return existing[0]
+
+    parsed_data = parse_manual_with_llm(input_path, PROJECT_ID, LOCATION, MODEL_NAME, use_cache)
 
     manual_id = None
     if parsed_data:
         conn = None
         try:
             conn = sqlite3.connect(db_file)
-            manual_id = insert_manual_data(conn, parsed_data)
+            apply_ingest_pragmas(conn)
+            manual_id = insert_manual_data(conn, parsed_data, source_hash, force=not use_cache)
         except sqlite3.Error as e: print(f"Database connection error: {e}")
         finally:
             if conn: conn.close(); print("Database connection closed.")
@@ -202,8 +497,16 @@ def process_single_manual(input_path, db_file):
 if __name__ == "__main__":
     # Set up argument parser
     parser = argparse.ArgumentParser(description="Convert a single manual file (PDF/TXT) into structured data in the SQLite DB.")
-    parser.add_argument("-i", "--input", required=True, help="Path to the input manual file (PDF or TXT).")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("-i", "--input", help="Path to the input manual file (PDF or TXT).")
+    source.add_argument("--from-cache", action="store_true", help="Bulk-load every cached parse into the database without calling the model.")
     # Removed output path argument as it goes to DB
+    parser.add_argument("--no-cache", action="store_true", help="Re-parse with the model even if the file is unchanged or a cached parse exists (the new parse is cached).")
+    parser.add_argument("--durable", action="store_true", help="With --from-cache: keep synchronous writes instead of the fast-load settings.")
     args = parser.parse_args()
 
-    process_single_manual(args.input, DATABASE_FILE)
\ No newline at end of file
+    if args.from_cache:
+        if not os.path.exists(DATABASE_FILE): print(f"Error: Database file '{DATABASE_FILE}' not found. Please run setup_database.py first.")
+        else: bulk_load_from_cache(DATABASE_FILE, fast=not args.durable)
+    else:
+        process_single_manual(args.input, DATABASE_FILE, use_cache=not args.no_cache)
\ No newline at end of file
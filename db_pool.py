@@ -0,0 +1,125 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Configuration ---
+DEFAULT_MAX_CONNECTIONS = 8
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024 # Bytes of the DB file to memory-map
+DEFAULT_CACHE_SIZE_KIB = 16 * 1024 # Page cache per connection (negative PRAGMA value = KiB)
+DEFAULT_CACHED_STATEMENTS = 256 # Prepared statements kept per connection
+# --- End Configuration ---
+
+def enable_wal(db_file):
+    """Switches the database to WAL journal mode (persistent) so readers don't block the writer."""
+    conn = sqlite3.connect(db_file)
+    try: return conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    finally: conn.close()
+
+class ConnectionPool:
+    """A bounded pool of read-only SQLite connections.
+
+    A worker thread checks out one connection for the duration of a request and
+    returns it afterwards, so connections (and their page cache and prepared
+    statements) are reused across requests and threads.
+    """
+
+    def __init__(self, db_file, max_connections=DEFAULT_MAX_CONNECTIONS, mmap_size=DEFAULT_MMAP_SIZE,
+                 cache_size_kib=DEFAULT_CACHE_SIZE_KIB, cached_statements=DEFAULT_CACHED_STATEMENTS):
+        self.db_file = db_file
+        self.max_connections = max_connections
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.cached_statements = cached_statements
+        try: self.journal_mode = enable_wal(db_file)
+        except sqlite3.Error as e:
+            print(f"Warning: Could not enable WAL mode on {db_file}: {e}")
+            self.journal_mode = None
+
+        self._idle = queue.LifoQueue() # LIFO keeps the warmest connection in use
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._all = []
+        self._stats = {"acquires": 0, "reuses": 0, "waits": 0, "wait_time_ms": 0.0}
+
+    def _connect(self):
+        # Connections may be released by one thread and picked up by another, never used concurrently
+        conn = sqlite3.connect(self.db_file, check_same_thread=False, cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def acquire(self, timeout=None):
+        """Returns this thread's connection, checking one out of the pool if needed."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None: return conn
+
+        start = time.perf_counter()
+        waited = False
+        try:
+            conn = self._idle.get_nowait()
+            reused = True
+        except queue.Empty:
+            reused = False
+            with self._lock:
+                can_open = len(self._all) < self.max_connections
+                if can_open:
+                    conn = self._connect()
+                    self._all.append(conn)
+            if not can_open:
+                waited = True
+                conn = self._idle.get(timeout=timeout) # Raises queue.Empty on timeout
+                reused = True
+
+        with self._lock:
+            self._stats["acquires"] += 1
+            if reused: self._stats["reuses"] += 1
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_time_ms"] += (time.perf_counter() - start) * 1000
+        self._local.conn = conn
+        return conn
+
+    def release(self):
+        """Returns this thread's connection (if any) to the pool."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None: return
+        self._local.conn = None
+        if conn.in_transaction: conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager that checks a connection out for the duration of a block.
+
+        Nested blocks share the thread's connection; only the block that checked it out releases it.
+        """
+        checked_out = getattr(self._local, "conn", None) is None
+        conn = self.acquire(timeout)
+        try: yield conn
+        finally:
+            if checked_out: self.release()
+
+    def stats(self):
+        """Returns a snapshot of pool usage counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open_connections"] = len(self._all)
+        stats["idle_connections"] = self._idle.qsize()
+        stats["in_use_connections"] = stats["open_connections"] - stats["idle_connections"]
+        stats["max_connections"] = self.max_connections
+        stats["journal_mode"] = self.journal_mode
+        stats["wait_time_ms"] = round(stats["wait_time_ms"], 3)
+        return stats
+
+    def close_all(self):
+        """Closes every connection opened by the pool."""
+        with self._lock:
+            conns, self._all = self._all, []
+        while True:
+            try: self._idle.get_nowait()
+            except queue.Empty: break
+        for conn in conns: conn.close()
@@ -0,0 +1,64 @@
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+# --- Configuration ---
+BUSY_TIMEOUT_MS = 30000 # Wait for other processes' write locks instead of failing
+# --- End Configuration ---
+
+class SQLiteWriter:
+    """Serializes all writes to a SQLite database through one thread and one connection.
+
+    Work is submitted as `fn(conn, *args, **kwargs)` and runs in submission order;
+    `submit` returns a Future with the function's result. Functions are responsible
+    for committing (as insert_manual_data does).
+    """
+
+    def __init__(self, db_file, name="sqlite-writer"):
+        self.db_file = db_file
+        self._queue = queue.Queue()
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error: raise self._error
+
+    def _run(self):
+        try:
+            conn = sqlite3.connect(self.db_file)
+            conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        except sqlite3.Error as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None: break
+                fn, args, kwargs, future = item
+                if not future.set_running_or_notify_cancel(): continue
+                try: future.set_result(fn(conn, *args, **kwargs))
+                except BaseException as e: future.set_exception(e)
+        finally:
+            conn.close()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queues fn(conn, *args, **kwargs) on the writer thread and returns a Future."""
+        future = Future()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def call(self, fn, *args, **kwargs):
+        """Runs fn on the writer thread and waits for its result."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def close(self):
+        """Finishes queued work and stops the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc_info): self.close()
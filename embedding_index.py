@@ -0,0 +1,238 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+
+try:
+    import numpy as np # Required: pip install numpy
+except ImportError:
+    np = None
+
+from manual_loader import load_manuals
+from qa_retrieval import Chunk, iter_chunks
+
+# Local vector index for semantic QA retrieval. Chunk embeddings are stored as a
+# contiguous float32 matrix (vectors.npy, memory-mapped on load) next to a JSON
+# file describing the rows. Rows are L2-normalized, so cosine similarity is a
+# single matrix-vector product. Rebuilds only re-embed manuals whose chunks changed.
+
+# --- Configuration ---
+DATABASE_FILE = 'manuals.db'
+INDEX_DIR = 'embedding_index'
+VECTORS_FILE = 'vectors.npy'
+META_FILE = 'meta.json'
+DEFAULT_EMBEDDER = 'minilm' # Falls back to 'hashing' if sentence-transformers is not installed
+MINILM_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+HASHING_DIMENSIONS = 512
+EMBED_BATCH_SIZE = 64
+# --- End Configuration ---
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+class HashingEmbedder:
+    """Dependency-free embedder: hashes words and character trigrams into a fixed-size vector.
+
+    Captures spelling overlap (e.g. 'connect'/'connection') but not true paraphrases;
+    use it for tests, benchmarks or when no local model is available.
+    """
+    name = 'hashing'
+
+    def __init__(self, dimensions=HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def _features(self, text):
+        words = re.findall(r"\w+", text.lower())
+        yield from words
+        for word in words:
+            padded = f"#{word}#"
+            yield from (padded[i:i + 3] for i in range(len(padded) - 2))
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode('utf-8'))
+                matrix[row, h % self.dimensions] += 1.0 if (h >> 31) & 1 else -1.0
+        return _normalize_rows(matrix)
+
+class SentenceTransformerEmbedder:
+    """CPU sentence-transformers model (pip install sentence-transformers)."""
+    name = 'minilm'
+
+    def __init__(self, model_name=MINILM_MODEL_NAME):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu')
+
+    def embed(self, texts):
+        vectors = self.model.encode(list(texts), batch_size=EMBED_BATCH_SIZE, convert_to_numpy=True, show_progress_bar=False)
+        return _normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+_EMBEDDERS = {'hashing': HashingEmbedder, 'minilm': SentenceTransformerEmbedder}
+_embedder_instances = {}
+_embedder_lock = threading.Lock()
+
+def register_embedder(name, factory):
+    """Registers a custom embedder factory (an object with `name` and `embed(texts) -> float32 matrix`)."""
+    _EMBEDDERS[name] = factory
+
+def get_embedder(name=DEFAULT_EMBEDDER):
+    """Returns a shared embedder instance, falling back to hashing if the model can't be loaded."""
+    with _embedder_lock:
+        if name not in _embedder_instances:
+            try: _embedder_instances[name] = _EMBEDDERS[name]()
+            except (ImportError, OSError) as e:
+                print(f"Warning: Embedder '{name}' unavailable ({e}), using 'hashing' instead.")
+                _embedder_instances.setdefault('hashing', HashingEmbedder())
+                _embedder_instances[name] = _embedder_instances['hashing']
+        return _embedder_instances[name]
+
+def embedding_text(chunk):
+    """The text embedded for a chunk: its manual and tab titles give it context."""
+    return f"{chunk.manual_title} - {chunk.tab_title}: {chunk.text}"
+
+def _manual_hash(chunks, embedder_name):
+    digest = hashlib.sha256(embedder_name.encode('utf-8'))
+    for chunk in chunks: digest.update(b'\x00' + embedding_text(chunk).encode('utf-8'))
+    return digest.hexdigest()
+
+class EmbeddingIndex:
+    """A loaded (memory-mapped) embedding index."""
+
+    def __init__(self, vectors, chunks, embedder_name):
+        self.vectors = vectors
+        self.chunks = chunks
+        self.embedder_name = embedder_name
+        self._manual_ids = np.array([c.manual_id for c in chunks]) if chunks else np.zeros(0)
+
+    @classmethod
+    def load(cls, index_dir=INDEX_DIR):
+        """Loads the index. Raises ValueError if its embedder is unavailable here (queries would not match its vectors)."""
+        with open(os.path.join(index_dir, META_FILE), 'r', encoding='utf-8') as f: meta = json.load(f)
+        embedder = get_embedder(meta['embedder'])
+        if embedder.name != meta['embedder']:
+            raise ValueError(f"index was built with embedder '{meta['embedder']}', which is unavailable here (got '{embedder.name}')")
+        vectors = np.load(os.path.join(index_dir, VECTORS_FILE), mmap_mode='r')
+        return cls(vectors, [Chunk(*fields) for fields in meta['chunks']], meta['embedder'])
+
+    def search(self, query, top_k=20, manual_id=None):
+        """Returns up to top_k (cosine similarity, chunk) pairs for a question, best first."""
+        if not self.chunks: return []
+        query_vector = get_embedder(self.embedder_name).embed([query])[0]
+        scores = self.vectors @ query_vector
+        if manual_id is not None: scores = np.where(self._manual_ids == manual_id, scores, -np.inf)
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(float(scores[i]), self.chunks[i]) for i in best if np.isfinite(scores[i])]
+
+def build_index(conn, index_dir=INDEX_DIR, embedder_name=DEFAULT_EMBEDDER):
+    """Builds or incrementally updates the index from the DB. Returns (reused_manuals, embedded_manuals)."""
+    embedder = get_embedder(embedder_name)
+    chunks_by_manual = {}
+    for chunk in iter_chunks(load_manuals(conn)): chunks_by_manual.setdefault(chunk.manual_id, []).append(chunk)
+
+    # Previous index, if compatible, provides rows for unchanged manuals
+    old_meta, old_vectors = None, None
+    try:
+        with open(os.path.join(index_dir, META_FILE), 'r', encoding='utf-8') as f: old_meta = json.load(f)
+        old_vectors = np.load(os.path.join(index_dir, VECTORS_FILE), mmap_mode='r')
+        if old_meta.get('embedder') != embedder.name: old_meta, old_vectors = None, None
+    except (OSError, ValueError):
+        old_meta, old_vectors = None, None
+    old_manuals = old_meta['manuals'] if old_meta else {}
+
+    blocks, all_chunks, manuals_meta = [], [], {}
+    reused = embedded = 0
+    for manual_id, chunks in chunks_by_manual.items():
+        manual_hash = _manual_hash(chunks, embedder.name)
+        previous = old_manuals.get(str(manual_id))
+        if previous and previous['hash'] == manual_hash:
+            block = np.asarray(old_vectors[previous['start']:previous['end']])
+            reused += 1
+        else:
+            texts = [embedding_text(c) for c in chunks]
+            block = np.vstack([embedder.embed(texts[i:i + EMBED_BATCH_SIZE]) for i in range(0, len(texts), EMBED_BATCH_SIZE)])
+            embedded += 1
+        start = len(all_chunks)
+        manuals_meta[str(manual_id)] = {"hash": manual_hash, "start": start, "end": start + len(chunks)}
+        blocks.append(block)
+        all_chunks.extend(chunks)
+
+    dims = blocks[0].shape[1] if blocks else getattr(embedder, 'dimensions', 0)
+    vectors = np.ascontiguousarray(np.vstack(blocks) if blocks else np.zeros((0, dims)), dtype=np.float32)
+
+    # Write atomically: vectors first, then the metadata that points at them
+    os.makedirs(index_dir, exist_ok=True)
+    tmp_vectors = os.path.join(index_dir, VECTORS_FILE + '.tmp.npy')
+    np.save(tmp_vectors, vectors)
+    del old_vectors # Release the memory map before replacing the file
+    os.replace(tmp_vectors, os.path.join(index_dir, VECTORS_FILE))
+    meta = {"embedder": embedder.name, "dimensions": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            "manuals": manuals_meta, "chunks": [list(c) for c in all_chunks]}
+    tmp_meta = os.path.join(index_dir, META_FILE + '.tmp')
+    with open(tmp_meta, 'w', encoding='utf-8') as f: json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_meta, os.path.join(index_dir, META_FILE))
+    return reused, embedded
+
+class EmbeddingIndexHolder:
+    """Lazily loads the on-disk index and reloads it when the metadata file changes."""
+
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = index_dir
+        self._index = None
+        self._file_key = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the current index, or None if numpy or the index files are unavailable."""
+        if np is None: return None
+        try:
+            st = os.stat(os.path.join(self.index_dir, META_FILE))
+            file_key = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+        if file_key == self._file_key: return self._index
+        with self._lock:
+            if file_key != self._file_key:
+                try:
+                    self._index = EmbeddingIndex.load(self.index_dir)
+                    print(f"Embedding index loaded from {self.index_dir} ({len(self._index.chunks)} chunks, {self._index.embedder_name}).")
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Warning: Could not load embedding index from {self.index_dir}: {e}. Using keyword ranking only.")
+                    self._index = None
+                self._file_key = file_key
+        return self._index
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or update the local embedding index used for semantic QA retrieval.")
+    parser.add_argument("-e", "--embedder", default=DEFAULT_EMBEDDER, choices=sorted(_EMBEDDERS), help=f"Embedder to use (default: {DEFAULT_EMBEDDER}).")
+    parser.add_argument("-q", "--query", help="Optional: Query the existing index instead of building it.")
+    args = parser.parse_args()
+
+    if np is None:
+        print("Error: numpy is required for the embedding index (pip install numpy).")
+    elif args.query:
+        try: index = EmbeddingIndex.load(INDEX_DIR)
+        except (OSError, ValueError, KeyError) as e: print(f"Error: Could not load embedding index from {INDEX_DIR}: {e}")
+        else:
+            for score, chunk in index.search(args.query, top_k=10):
+                print(f"[{score:.3f}] manual {chunk.manual_id} {chunk.item_id}: {chunk.text[:80]}")
+    elif not os.path.exists(DATABASE_FILE):
+        print(f"Error: Database file '{DATABASE_FILE}' not found.")
+    else:
+        conn = sqlite3.connect(DATABASE_FILE)
+        try:
+            reused, embedded = build_index(conn, INDEX_DIR, args.embedder)
+            print(f"Embedding index written to {INDEX_DIR}: {embedded} manuals embedded, {reused} unchanged.")
+        except sqlite3.Error as e:
+            print(f"Database error building embedding index: {e}")
+        finally:
+            conn.close()
@@ -1,10 +1,24 @@
+import argparse
+import hashlib
+import json
 import os
 import sqlite3
-import json
+from manual_documents import refresh_manual_documents
+
+# Exports the knowledge base for the QA backend from the materialized manual
+# documents (see manual_documents.py), streaming them to disk one at a time:
+#   json   - one JSON array file (the default, all_manuals_knowledge.json)
+#   jsonl  - one compact document per line
+#   shards - one compact file per manual plus index.json with each manual's
+#            content version; only manuals whose version changed are rewritten.
+# Every file is written to a temp file and renamed, so readers never see a partial file.
 
 # --- Configuration ---
 DATABASE_FILE = 'manuals.db'
 OUTPUT_JSON_FILE = 'all_manuals_knowledge.json' # Single file output
+OUTPUT_JSONL_FILE = 'all_manuals_knowledge.jsonl'
+OUTPUT_SHARD_DIR = 'all_manuals_knowledge' # Shard directory (KnowledgeBase accepts it in place of the file)
+SHARD_INDEX_FILE = 'index.json'
 # --- End Configuration ---
 
 def create_connection(db_file):
@@ -12,120 +26,123 @@ def create_connection(db_file):
     conn = None
     try:
         conn = sqlite3.connect(db_file)
-        conn.row_factory = sqlite3.Row # Return rows as dictionary-like objects
         print(f"SQLite DB connection successful to {db_file}")
     except sqlite3.Error as e:
         print(f"Error connecting to database: {e}")
     return conn
 
-def fetch_all_manual_data(conn):
-    """Fetches and structures data for all manuals from the DB."""
-    cursor = conn.cursor()
-    all_manuals_data = []
-
+def iter_documents(conn):
+    """Yields (manual_id, title, content_version, document) in manual order, materializing missing documents first."""
+    missing = [row[0] for row in conn.execute(
+        "SELECT manual_id FROM manuals WHERE manual_id NOT IN (SELECT manual_id FROM manual_documents)")]
+    if missing:
+        print(f"Materializing {len(missing)} missing manual documents...")
+        refresh_manual_documents(conn, missing)
+        conn.commit()
+    yield from conn.execute("""
+        SELECT d.manual_id, m.title, d.content_version, d.document
+        FROM manual_documents d JOIN manuals m ON m.manual_id = d.manual_id ORDER BY d.manual_id
+    """)
+
+def export_version(versions):
+    """Version of a whole export: SHA-256 over the (manual_id, content_version) pairs."""
+    return hashlib.sha256(json.dumps(sorted(versions.items())).encode('utf-8')).hexdigest()
+
+def _write_atomic(path, chunks):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for chunk in chunks: f.write(chunk)
+    os.replace(tmp_path, path)
+
+def export_json(conn, output_file=OUTPUT_JSON_FILE):
+    """Streams all documents into one JSON array. Returns the number of manuals."""
+    count = 0
+    def chunks():
+        nonlocal count
+        yield "["
+        for _, _, _, document in iter_documents(conn):
+            yield ("\n" if count == 0 else ",\n") + document
+            count += 1
+        yield "\n]\n"
+    _write_atomic(output_file, chunks())
+    return count
+
+def export_jsonl(conn, output_file=OUTPUT_JSONL_FILE):
+    """Streams all documents into a JSON Lines file. Returns the number of manuals."""
+    count = 0
+    def chunks():
+        nonlocal count
+        for _, _, _, document in iter_documents(conn):
+            yield document + "\n"
+            count += 1
+    _write_atomic(output_file, chunks())
+    return count
+
+def read_shard_index(shard_dir):
+    """Returns the index of a shard export ({"version", "manuals": {id: entry}}), or an empty one."""
     try:
-        # Fetch all manuals
-        cursor.execute("SELECT * FROM manuals ORDER BY manual_id")
-        manuals = cursor.fetchall()
-
-        if not manuals:
-            print("No manuals found in the database.")
-            return []
-
-        print(f"Found {len(manuals)} manuals. Fetching details...")
-
-        for manual_row in manuals:
-            manual_data = dict(manual_row)
-            manual_id = manual_data['manual_id']
-
-            # Safely parse JSON fields from DB
-            try: manual_data['features'] = json.loads(manual_data.get('features', '[]') or '[]')
-            except (json.JSONDecodeError, TypeError): manual_data['features'] = []
-            try: manual_data['special_features'] = json.loads(manual_data.get('special_features', '[]') or '[]')
-            except (json.JSONDecodeError, TypeError): manual_data['special_features'] = []
-
-            # Fetch tabs for this manual
-            cursor.execute("""
-                SELECT tab_id, tab_key, title, tab_order, content_type
-                FROM tabs WHERE manual_id = ? ORDER BY tab_order
-            """, (manual_id,))
-            tabs = cursor.fetchall()
-
-            manual_data['tabs'] = [] # Use the key expected by frontend
-
-            for tab_row in tabs:
-                tab_data = dict(tab_row)
-                tab_id = tab_data['tab_id']
-                content_type = tab_data['content_type']
-                tab_key = tab_data['tab_key'] # Get tab_key for generating item/step IDs
-
-                # Fetch content based on type
-                if content_type == 'list':
-                    cursor.execute("SELECT item_order, text FROM tab_content_list WHERE tab_id = ? ORDER BY item_order", (tab_id,))
-                    items = cursor.fetchall()
-                    # Generate list item objects with IDs
-                    tab_data['content'] = [{"id": f"{tab_key}_item_{item['item_order']:02d}", "text": item['text']} for item in items]
-                elif content_type == 'steps':
-                    cursor.execute("SELECT step_order, text, warning, note FROM tab_content_steps WHERE tab_id = ? ORDER BY step_order", (tab_id,))
-                    steps_raw = cursor.fetchall()
-                    steps_list = [{"id": f"{tab_key}_step_{step['step_order']:02d}", "text": step['text']} for step in steps_raw]
-                    # Get warning/note from first/last step if they exist
-                    warning = steps_raw[0]['warning'] if steps_raw and steps_raw[0]['warning'] else None
-                    note = steps_raw[-1]['note'] if steps_raw and steps_raw[-1]['note'] else None
-                    steps_content = {"steps": steps_list}
-                    if warning: steps_content["warning"] = warning
-                    if note: steps_content["note"] = note
-                    tab_data['content'] = steps_content
-                elif content_type == 'text':
-                    cursor.execute("SELECT text FROM tab_content_text WHERE tab_id = ?", (tab_id,))
-                    text_content = cursor.fetchone()
-                    tab_data['content'] = text_content['text'] if text_content else ""
-                else:
-                    tab_data['content'] = None # Or handle unknown type
-
-                # Use the correct key 'id' for the tab identifier
-                tab_data['id'] = tab_key
-                # Remove redundant keys fetched from DB if needed
-                # del tab_data['tab_key']
-                # del tab_data['tab_id']
-
-                manual_data['tabs'].append(tab_data)
-
-            all_manuals_data.append(manual_data)
-
-        return all_manuals_data
-
-    except sqlite3.Error as e:
-        print(f"Database error fetching data: {e}")
-        return None
-    except Exception as e:
-        print(f"Error structuring data: {e}")
-        return None
+        with open(os.path.join(shard_dir, SHARD_INDEX_FILE), 'r', encoding='utf-8') as f: return json.load(f)
+    except FileNotFoundError:
+        return {"version": None, "manuals": {}}
+
+def shard_filename(manual_id):
+    return f"manual_{manual_id}.json"
+
+def export_shards(conn, shard_dir=OUTPUT_SHARD_DIR, full=False):
+    """Writes one shard per manual, rewriting only those whose content version changed (all if full),
+    removes shards of deleted manuals and writes the index last. Returns (written, unchanged, removed)."""
+    os.makedirs(shard_dir, exist_ok=True)
+    previous = {} if full else read_shard_index(shard_dir)["manuals"]
+    manuals, written = {}, 0
+    for manual_id, title, version, document in iter_documents(conn):
+        entry = {"title": title, "file": shard_filename(manual_id), "content_version": version}
+        old = previous.get(str(manual_id))
+        if old is None or old["content_version"] != version or not os.path.exists(os.path.join(shard_dir, entry["file"])):
+            _write_atomic(os.path.join(shard_dir, entry["file"]), [document])
+            written += 1
+        manuals[str(manual_id)] = entry
+
+    removed = 0
+    for manual_id, old in previous.items():
+        if manual_id not in manuals and os.path.exists(os.path.join(shard_dir, old["file"])):
+            os.remove(os.path.join(shard_dir, old["file"]))
+            removed += 1
+
+    versions = {int(manual_id): entry["content_version"] for manual_id, entry in manuals.items()}
+    index = {"version": export_version(versions), "manuals": manuals}
+    _write_atomic(os.path.join(shard_dir, SHARD_INDEX_FILE), [json.dumps(index, ensure_ascii=False, indent=1)])
+    return written, len(manuals) - written, removed
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the manual knowledge base for the QA backend.")
+    parser.add_argument("-f", "--format", choices=["json", "jsonl", "shards"], default="json",
+                        help="Single JSON file, JSON Lines, or one shard per manual with an index (default: json).")
+    parser.add_argument("-o", "--output", help="Output file or shard directory (default depends on the format).")
+    parser.add_argument("--full", action="store_true", help="With --format shards: rewrite every shard, not only changed ones.")
+    args = parser.parse_args()
+
     print("--- Starting Database to JSON Export Script ---")
     if not os.path.exists(DATABASE_FILE):
         print(f"Error: Database file '{DATABASE_FILE}' not found.")
     else:
         conn = create_connection(DATABASE_FILE)
         if conn:
-            all_data = fetch_all_manual_data(conn)
-            conn.close()
-            print("Database connection closed.")
-
-            if all_data is not None:
-                try:
-                    # Ensure output directory exists (optional, saves in current dir)
-                    # os.makedirs(os.path.dirname(OUTPUT_JSON_FILE), exist_ok=True)
-                    with open(OUTPUT_JSON_FILE, 'w', encoding='utf-8') as f:
-                        json.dump(all_data, f, indent=2, ensure_ascii=False)
-                    print(f"Successfully exported all manual data to {OUTPUT_JSON_FILE}")
-                except IOError as e:
-                    print(f"Error writing JSON to file {OUTPUT_JSON_FILE}: {e}")
-                except Exception as e:
-                    print(f"Unexpected error during JSON writing: {e}")
-            else:
-                print("Failed to fetch or structure data from database.")
+            try:
+                if args.format == "shards":
+                    shard_dir = args.output or OUTPUT_SHARD_DIR
+                    written, unchanged, removed = export_shards(conn, shard_dir, args.full)
+                    print(f"Exported shards to {shard_dir}: {written} written, {unchanged} unchanged, {removed} removed.")
+                else:
+                    output_file = args.output or (OUTPUT_JSONL_FILE if args.format == "jsonl" else OUTPUT_JSON_FILE)
+                    count = (export_jsonl if args.format == "jsonl" else export_json)(conn, output_file)
+                    print(f"Successfully exported {count} manuals to {output_file}")
+            except sqlite3.Error as e:
+                print(f"Database error during export: {e}")
+            except OSError as e:
+                print(f"Error writing export: {e}")
+            finally:
+                conn.close()
+                print("Database connection closed.")
         else:
-            print("Database connection failed.")
\ No newline at end of file
+            print("Database connection failed.")
@@ -1,7 +1,12 @@
 import os
 import sqlite3
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import texttospeech
+from model_clients import get_tts_client
+from rate_limit import TokenBucket, ProgressReporter, call_with_retries, positive_int
+from audio_store import AUDIO_FORMATS, get_audio_store, audio_content_hash, normalize_tts_text, item_key
+from manual_assets import UNKNOWN_SOURCE_HASH, asset_row, file_hash, plan_assets, save_assets
 
 # --- Configuration ---
 PROJECT_ID = 'bliss-hack25fra-9531'
@@ -10,9 +15,15 @@ DATABASE_FILE = 'manuals.db'
 OUTPUT_DIR = 'technisat-manual/public/manual_audio'
 VOICE_LANGUAGE_CODE = 'en-US'
 VOICE_NAME = 'en-US-Standard-J'
-AUDIO_ENCODING = texttospeech.AudioEncoding.LINEAR16 # WAV format
+AUDIO_FORMAT = 'ogg_opus' # 'ogg_opus' (smallest), 'mp3' (widest browser support) or 'wav' (uncompressed LINEAR16)
+TTS_CONCURRENCY = 8 # Concurrent synthesis requests per manual
+TTS_REQUESTS_PER_MINUTE = 900 # Keep below the project's Text-to-Speech quota (1000/min by default)
+TTS_MAX_RETRIES = 5 # Retries on quota (429) and transient errors, with jittered exponential backoff
 # --- End Configuration ---
 
+# Shared by every caller in this process (e.g. several manuals in process_manuals_batch)
+tts_rate_limiter = TokenBucket.per_minute(TTS_REQUESTS_PER_MINUTE, burst=TTS_CONCURRENCY)
+
 def create_connection(db_file):
     """ Create a database connection to the SQLite database """
     conn = None
@@ -23,23 +34,31 @@ def create_connection(db_file):
         print(f"Error connecting to database: {e}")
     return conn
 
-def synthesize_speech(text, output_filename, client):
-    """Synthesizes speech from text and saves to a file using a provided client."""
-    clean_text = text.replace('<', '').replace('>', '')
-    if not clean_text.strip():
+def synthesize_speech(text, output_filename, client, rate_limiter=None, audio_format=AUDIO_FORMAT):
+    """Synthesizes speech from text and saves to a file using a provided client.
+
+    Requests are paced by rate_limiter (if given) and retried on quota and transient errors.
+    """
+    clean_text = normalize_tts_text(text)
+    if not clean_text:
         print(f"Skipping empty text for {output_filename}")
         return False
     try:
         synthesis_input = texttospeech.SynthesisInput(text=clean_text)
         voice = texttospeech.VoiceSelectionParams(language_code=VOICE_LANGUAGE_CODE, name=VOICE_NAME)
-        audio_config = texttospeech.AudioConfig(audio_encoding=AUDIO_ENCODING)
+        audio_encoding = texttospeech.AudioEncoding[AUDIO_FORMATS[audio_format]['encoding']]
+        audio_config = texttospeech.AudioConfig(audio_encoding=audio_encoding)
 
         print(f"Synthesizing audio for: '{clean_text[:60]}...' -> {os.path.basename(output_filename)}")
-        response = client.synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
+        response = call_with_retries(client.synthesize_speech, input=synthesis_input, voice=voice, audio_config=audio_config,
+                                     rate_limiter=rate_limiter, max_retries=TTS_MAX_RETRIES, label=os.path.basename(output_filename))
 
+        # Write atomically so an interrupted run never leaves a truncated file that later runs would skip
         os.makedirs(os.path.dirname(output_filename), exist_ok=True)
-        with open(output_filename, "wb") as out:
+        tmp_filename = output_filename + ".tmp"
+        with open(tmp_filename, "wb") as out:
             out.write(response.audio_content)
+        os.replace(tmp_filename, output_filename)
         return True
     except Exception as e:
         print(f"Error synthesizing speech for '{clean_text[:60]}...': {e}")
@@ -92,48 +111,108 @@ def get_content_to_process(conn, manual_id_filter=None): # Renamed arg
         return []
 
 
-def process_audio_for_manual(db_file, output_dir, manual_id_filter=None): # Renamed arg
-    """Processes audio generation for a specific manual_id or all."""
+def synthesize_items(jobs, client, concurrency=TTS_CONCURRENCY, rate_limiter=None, progress=None, audio_format=AUDIO_FORMAT):
+    """Synthesizes (text, output_filename) jobs on a thread pool. Returns the number of files written.
+
+    The TTS client is thread-safe, so all workers share it (and its gRPC channel).
+    """
+    rate_limiter = rate_limiter or tts_rate_limiter
+    progress = progress or ProgressReporter(len(jobs), "audio files")
+
+    def run(job):
+        success = synthesize_speech(job[0], job[1], client, rate_limiter, audio_format)
+        progress.record("succeeded" if success else "failed")
+        return success
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="tts") as pool:
+        return sum(pool.map(run, jobs))
+
+def process_audio_for_manual(db_file, output_dir, manual_id_filter=None, concurrency=TTS_CONCURRENCY, rate_limiter=None,
+                             audio_format=AUDIO_FORMAT, writer=None, generate=True): # Renamed arg
+    """Processes audio generation for a specific manual_id or all.
+
+    Work is planned from the assets table: items whose recorded text/voice hash matches are
+    skipped, stale ones (text changed) re-linked or synthesized. Existing audio (legacy files,
+    recorded as stale; stored blobs) is linked without credentials; generate=False stops there (backfill).
+    Asset rows are written through writer (a SQLiteWriter) if given.
+    """
     if not os.path.exists(db_file): print(f"Error: Database file '{db_file}' not found."); return
 
     conn = create_connection(db_file)
     if conn is None: return
 
-    tts_client = None
-    try:
-        print("Initializing Google Cloud Text-to-Speech client...")
-        tts_client = texttospeech.TextToSpeechClient()
-        print("Text-to-Speech client initialized.")
-    except Exception as e:
-        print(f"Error initializing TTS client: {e}");
-        if conn: conn.close(); return
-
     try:
         content_to_process = get_content_to_process(conn, manual_id_filter)
-        total_items = len(content_to_process)
-        generated_count = 0
-
-        if total_items == 0: print("No text content found."); return
+        if not content_to_process: print("No text content found."); return
 
         if not os.path.exists(output_dir):
             try: os.makedirs(output_dir); print(f"Created output directory: {output_dir}")
             except OSError as e: print(f"Error creating output directory {output_dir}: {e}"); return
 
-        # Iterate through fetched data including manual_id and item_db_id
-        for i, (manual_id, tab_key, item_type, item_order, text, item_db_id) in enumerate(content_to_process):
-            # Construct filename including manual_id and the item's specific ID
-            filename = f"manual_{manual_id}_{item_db_id}.wav"
-            output_filename = os.path.join(output_dir, filename)
-
-            if os.path.exists(output_filename):
-                 print(f"Skipping existing audio: {output_filename}")
-                 continue
-
-            success = synthesize_speech(text, output_filename, tts_client)
-            if success: generated_count += 1
-            print(f"Progress: {i + 1}/{total_items}")
-
-        print(f"\nAudio generation process finished. {generated_count}/{total_items} files generated (or skipped).")
+        # Plan from the assets table in one query: items whose text/voice hash is unchanged need nothing
+        items = {}
+        for manual_id, tab_key, item_type, item_order, text, item_db_id in content_to_process:
+            if normalize_tts_text(text): items[(manual_id, item_db_id, audio_content_hash(text, VOICE_LANGUAGE_CODE, VOICE_NAME))] = text
+        fresh, stale, missing = plan_assets(conn, 'audio', list(items))
+        print(f"Audio: {len(fresh)} items up to date, {len(stale)} stale, {len(missing)} missing.")
+
+        # Map the remaining items to content-addressed blobs; only texts without a blob are synthesized, once each.
+        # Blobs already stored in another format are reused (transcode_audio.py converts them).
+        # Per-item WAVs from before the store are recorded where they are (files untouched), as stale: their text is unknown.
+        store = get_audio_store(output_dir)
+        pending = {} # content hash -> (text, blob path, [(manual_id, item_id)])
+        linked, legacy, other_format = [], [], 0
+        missing_items = set(missing)
+        for manual_id, item_db_id, content_hash in stale + missing:
+            legacy_filename = os.path.join(output_dir, f"{item_key(manual_id, item_db_id)}.wav")
+            existing_format = store.find_blob(content_hash, audio_format)
+            if not existing_format and (manual_id, item_db_id, content_hash) in missing_items and os.path.exists(legacy_filename):
+                legacy.append((manual_id, item_db_id, legacy_filename))
+            if existing_format:
+                linked.append((manual_id, item_db_id, content_hash, existing_format))
+                other_format += existing_format != audio_format
+            else:
+                text = items[(manual_id, item_db_id, content_hash)]
+                pending.setdefault(content_hash, (text, store.blob_path(content_hash, audio_format), []))[2].append((manual_id, item_db_id))
+
+        jobs = [(text, blob_path) for text, blob_path, _ in pending.values()]
+        if other_format: print(f"{other_format} items use existing audio in another format; run transcode_audio.py --format {audio_format} to convert it.")
+        tts_client = None
+        if jobs and generate:
+            try:
+                print("Initializing Google Cloud Text-to-Speech client...")
+                tts_client = get_tts_client()
+                print("Text-to-Speech client initialized.")
+            except Exception as e:
+                print(f"Error initializing TTS client: {e}")
+        if tts_client is None:
+            jobs = [] # Still record the audio that already exists
+            if pending: print(f"{len(pending)} distinct texts left to synthesize (run generate_manual_audio.py).")
+        print(f"Synthesizing {len(jobs)} distinct texts ({len(linked)} items reuse existing audio) with {concurrency} concurrent requests...")
+        progress = ProgressReporter(len(jobs), "audio files")
+        generated_count = synthesize_items(jobs, tts_client, concurrency, rate_limiter, progress, audio_format) if jobs else 0
+
+        for content_hash, (text, blob_path, targets) in pending.items():
+            if os.path.exists(blob_path): linked += [(manual_id, item_db_id, content_hash, audio_format) for manual_id, item_db_id in targets]
+
+        # Record every linked item in the manifest and the assets table (each blob hashed once)
+        rows = [asset_row(manual_id, item_db_id, 'audio', f"{store.url_prefix}/{os.path.basename(path)}", UNKNOWN_SOURCE_HASH, path,
+                          mime=AUDIO_FORMATS['wav']['mime']) for manual_id, item_db_id, path in legacy]
+        if legacy: print(f"{len(legacy)} items use per-item WAVs from before the audio store.")
+        blob_hashes = {}
+        for manual_id, item_db_id, content_hash, blob_format in linked:
+            store.link(item_key(manual_id, item_db_id), content_hash, blob_format)
+            entry = store.get(item_key(manual_id, item_db_id))
+            blob_path = store.blob_path(content_hash, blob_format)
+            if blob_path not in blob_hashes: blob_hashes[blob_path] = file_hash(blob_path)
+            rows.append(asset_row(manual_id, item_db_id, 'audio', entry["url"], content_hash, blob_path,
+                                  mime=entry["mime"], content_hash=blob_hashes[blob_path]))
+        store.save()
+        save_assets(conn, rows, writer)
+
+        stats = store.stats()
+        print(f"\nAudio generation process finished. {generated_count}/{len(jobs)} files generated ({progress.summary()}). "
+              f"Store: {stats['items']} items -> {stats['blobs']} blobs, {stats['bytes'] / 1e6:.1f} MB.")
 
     finally:
         if conn: conn.close(); print("Database connection closed.")
@@ -143,6 +222,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate audio for manual content stored in the database.")
     # Keep argument name consistent
     parser.add_argument("-m", "--manual_id", type=int, help="Optional: Process only content for a specific manual_id.")
+    parser.add_argument("-c", "--concurrency", type=positive_int, default=TTS_CONCURRENCY, help=f"Concurrent synthesis requests (default: {TTS_CONCURRENCY}).")
+    parser.add_argument("-f", "--format", default=AUDIO_FORMAT, choices=sorted(AUDIO_FORMATS), help=f"Output audio format (default: {AUDIO_FORMAT}).")
+    parser.add_argument("--rpm", type=positive_int, default=TTS_REQUESTS_PER_MINUTE, help=f"Maximum TTS requests per minute (default: {TTS_REQUESTS_PER_MINUTE}).")
     args = parser.parse_args()
 
     print("--- Starting Manual Audio Generation Script (DB version) ---")
@@ -152,4 +234,5 @@ if __name__ == "__main__":
     else: print("Processing all manuals found in DB.")
     print("-" * 40)
 
-    process_audio_for_manual(DATABASE_FILE, OUTPUT_DIR, manual_id_filter=args.manual_id) # Pass arg correctly
\ No newline at end of file
+    process_audio_for_manual(DATABASE_FILE, OUTPUT_DIR, manual_id_filter=args.manual_id, concurrency=args.concurrency,
+                             rate_limiter=TokenBucket.per_minute(args.rpm, burst=args.concurrency), audio_format=args.format) # Pass arg correctly
\ No newline at end of file
@@ -1,17 +1,30 @@
 import os
+import json
+import time
 import sqlite3
 import argparse
-import vertexai
-from vertexai.preview.vision_models import ImageGenerationModel
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from model_clients import get_image_model
+from rate_limit import TokenBucket, ProgressReporter, call_with_retries, positive_int
+from manual_assets import UNKNOWN_SOURCE_HASH, asset_row, plan_assets, save_assets, text_hash
 
 # --- Configuration ---
 PROJECT_ID = "bliss-hack25fra-9531"
 LOCATION = "europe-central2"
 DATABASE_FILE = 'manuals.db'
 OUTPUT_DIR = 'technisat-manual/public/manual_images'
+PUBLIC_URL_PREFIX = '/manual_images' # Where OUTPUT_DIR is served by the frontend
 IMAGEN_MODEL_NAME = "imagegeneration@005" # Stable version
+IMAGEN_MAX_IN_FLIGHT = 4 # Concurrent generate_images requests
+IMAGEN_REQUESTS_PER_MINUTE = 20 # Keep below the project's Imagen quota for the model/region
+IMAGEN_MAX_RETRIES = 6 # Retries on quota (429) and transient errors, with jittered exponential backoff
+FAILURE_QUEUE_FILE = 'image_failures.json' # Prompts that still failed after retries, for --retry-failures
 # --- End Configuration ---
 
+# Shared by every caller in this process (e.g. several manuals in process_manuals_batch)
+imagen_rate_limiter = TokenBucket.per_minute(IMAGEN_REQUESTS_PER_MINUTE, burst=IMAGEN_MAX_IN_FLIGHT)
+
 def create_connection(db_file):
     """ Create a database connection to the SQLite database """
     conn = None
@@ -22,25 +35,95 @@ def create_connection(db_file):
         print(f"Error connecting to database: {e}")
     return conn
 
-def generate_image(prompt, output_filename, model):
-    """Generates an image using Vertex AI Imagen and saves it, using a provided model instance."""
-    response = None
+def render_image(prompt, output_filename, model, rate_limiter=None):
+    """Generates one image and writes it atomically. Raises if no image could be generated."""
     enhanced_prompt = f"Technical illustration: {prompt}"
     print(f"Generating image for prompt: '{enhanced_prompt[:70]}...' -> {os.path.basename(output_filename)}")
-    try:
-        response = model.generate_images(prompt=enhanced_prompt, number_of_images=1)
-        if response.images:
-            image_bytes = response.images[0]._image_bytes
-            os.makedirs(os.path.dirname(output_filename), exist_ok=True)
-            with open(output_filename, 'wb') as img_file: img_file.write(image_bytes)
-            return True
-        else:
-            print(f"Warning: No image generated for prompt. Response: {response}")
-            return False
-    except Exception as e:
-        print(f"Error generating image for prompt '{enhanced_prompt[:70]}...': {e}")
-        if response: print(f"Full Response on Error: {response}")
-        return False
+    response = call_with_retries(model.generate_images, prompt=enhanced_prompt, number_of_images=1, rate_limiter=rate_limiter,
+                                 max_retries=IMAGEN_MAX_RETRIES, label=os.path.basename(output_filename))
+    if not response.images:
+        raise RuntimeError(f"No image generated for prompt (possibly filtered). Response: {response}")
+    os.makedirs(os.path.dirname(output_filename), exist_ok=True)
+    tmp_filename = output_filename + ".tmp"
+    with open(tmp_filename, 'wb') as img_file: img_file.write(response.images[0]._image_bytes)
+    os.replace(tmp_filename, output_filename)
+
+class FailureQueue:
+    """Persistent JSON queue of image jobs that failed after all retries, keyed by output file name."""
+
+    def __init__(self, path=FAILURE_QUEUE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f: self._entries = json.load(f)
+        except FileNotFoundError:
+            self._entries = {}
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read failure queue {path} ({e}), starting empty.")
+            self._entries = {}
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def add(self, job, error):
+        with self._lock:
+            key = os.path.basename(job["output_filename"])
+            attempts = self._entries.get(key, {}).get("attempts", 0) + 1
+            self._entries[key] = dict(job, error=str(error), attempts=attempts, last_failed_at=time.time())
+            self._save()
+
+    def remove(self, job):
+        with self._lock:
+            if self._entries.pop(os.path.basename(job["output_filename"]), None) is not None: self._save()
+
+    def jobs(self, manual_id=None):
+        with self._lock:
+            return [{k: entry[k] for k in ("manual_id", "tab_key", "step_order", "prompt", "output_filename")}
+                    for entry in self._entries.values() if manual_id is None or entry["manual_id"] == manual_id]
+
+    def __len__(self):
+        with self._lock: return len(self._entries)
+
+_failure_queues = {}
+_failure_queues_lock = threading.Lock()
+
+def get_failure_queue(path=FAILURE_QUEUE_FILE):
+    """Returns the process-wide FailureQueue for path, so concurrent callers never overwrite each other's entries."""
+    with _failure_queues_lock:
+        if path not in _failure_queues: _failure_queues[path] = FailureQueue(path)
+        return _failure_queues[path]
+
+def generate_images(jobs, model, max_in_flight=IMAGEN_MAX_IN_FLIGHT, rate_limiter=None, failure_queue=None, progress=None):
+    """Runs image jobs with at most max_in_flight requests at once, paced by the (shared) rate limiter.
+
+    Jobs that still fail after retries go to the failure queue; successful ones leave it. Returns the successful jobs.
+    """
+    rate_limiter = rate_limiter or imagen_rate_limiter
+    failure_queue = failure_queue or get_failure_queue()
+    progress = progress or ProgressReporter(len(jobs), "images")
+
+    def run(job):
+        try:
+            render_image(job["prompt"], job["output_filename"], model, rate_limiter)
+        except Exception as e:
+            print(f"Error generating image {os.path.basename(job['output_filename'])}: {e}")
+            failure_queue.add(job, e)
+            progress.record("failed")
+            return None
+        failure_queue.remove(job)
+        progress.record("succeeded")
+        return job
+
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight), thread_name_prefix="imagen") as pool:
+        return [job for job in pool.map(run, jobs) if job is not None]
+
+def image_asset_row(job, source_text_hash=None):
+    """The assets table row for a generated (or adopted) step image; source_text_hash defaults to the prompt's."""
+    item_id = f"{job['tab_key']}_step_{job['step_order']:02d}"
+    return asset_row(job["manual_id"], item_id, 'image', f"{PUBLIC_URL_PREFIX}/{os.path.basename(job['output_filename'])}",
+                     text_hash(job["prompt"]) if source_text_hash is None else source_text_hash, job["output_filename"], mime='image/png')
 
 def get_steps_to_process(conn, manual_id_filter=None): # Renamed arg for clarity
     """Fetches steps data from the database, including manual_id."""
@@ -67,49 +150,68 @@ def get_steps_to_process(conn, manual_id_filter=None): # Renamed arg for clarity
         print(f"Database error fetching steps: {e}")
         return []
 
-def process_images_for_manual(db_file, output_dir, manual_id_filter=None): # Renamed arg
-    """Processes image generation for a specific manual_id or all."""
+def process_images_for_manual(db_file, output_dir, manual_id_filter=None, max_in_flight=IMAGEN_MAX_IN_FLIGHT, rate_limiter=None,
+                              retry_failures=False, failure_queue_file=FAILURE_QUEUE_FILE, writer=None, generate=True): # Renamed arg
+    """Processes image generation for a specific manual_id or all.
+
+    Work is planned from the assets table: images whose recorded prompt hash matches are
+    skipped, stale ones (step text changed) regenerated. Untracked images already on disk are
+    recorded first as stale, which needs no credentials; generate=False stops there (backfill).
+    With retry_failures, only the prompts recorded in the failure queue are generated again.
+    Asset rows are written through writer (a SQLiteWriter) if given.
+    """
     if not os.path.exists(db_file): print(f"Error: Database file '{db_file}' not found."); return
 
     conn = create_connection(db_file)
     if conn is None: return
 
-    imagen_model = None
-    try:
-        print("Initializing Vertex AI and Imagen Model...")
-        vertexai.init(project=PROJECT_ID, location=LOCATION)
-        imagen_model = ImageGenerationModel.from_pretrained(IMAGEN_MODEL_NAME)
-        print("Vertex AI and Imagen Model initialized.")
-    except Exception as e:
-        print(f"Error initializing Vertex AI or Imagen Model: {e}")
-        if conn: conn.close(); return
-
+    failure_queue = get_failure_queue(failure_queue_file)
     try:
-        steps_to_process = get_steps_to_process(conn, manual_id_filter)
-        total_steps = len(steps_to_process)
-        generated_count = 0
-
-        if total_steps == 0: print("No steps found to generate images for."); return
-
         if not os.path.exists(output_dir):
             try: os.makedirs(output_dir); print(f"Created output directory: {output_dir}")
             except OSError as e: print(f"Error creating output directory {output_dir}: {e}"); return
 
-        # Iterate through fetched data including manual_id
-        for i, (manual_id, tab_key, step_order, step_text) in enumerate(steps_to_process):
-            # Construct filename including manual_id
-            output_filename = os.path.join(output_dir, f"manual_{manual_id}_{tab_key}_step_{step_order:02d}.png")
-
-            if os.path.exists(output_filename):
-                 print(f"Skipping existing image: {output_filename}")
-                 continue
-
-            prompt_text = f"Step {step_order + 1}: {step_text}"
-            success = generate_image(prompt_text, output_filename, imagen_model)
-            if success: generated_count += 1
-            print(f"Progress: {i + 1}/{total_steps}")
-
-        print(f"\nImage generation process finished. {generated_count}/{total_steps} images generated (or skipped).")
+        if retry_failures:
+            jobs = failure_queue.jobs(manual_id_filter)
+            print(f"Retrying {len(jobs)} previously failed images from {failure_queue_file}.")
+            progress = ProgressReporter(len(jobs), "images")
+        else:
+            steps_to_process = get_steps_to_process(conn, manual_id_filter)
+            if not steps_to_process: print("No steps found to generate images for."); return
+
+            # Plan from the assets table in one query (filenames include manual_id)
+            all_jobs = {}
+            for manual_id, tab_key, step_order, step_text in steps_to_process:
+                prompt = f"Step {step_order + 1}: {step_text}"
+                all_jobs[(manual_id, f"{tab_key}_step_{step_order:02d}", text_hash(prompt))] = {
+                    "manual_id": manual_id, "tab_key": tab_key, "step_order": step_order, "prompt": prompt,
+                    "output_filename": os.path.join(output_dir, f"manual_{manual_id}_{tab_key}_step_{step_order:02d}.png")}
+            fresh, stale, missing = plan_assets(conn, 'image', list(all_jobs))
+
+            # Untracked images already on disk (generated before the assets table existed) are recorded so they are
+            # served, but from unknown text: they stay stale and are regenerated like any other
+            adopted = {item for item in missing if os.path.exists(all_jobs[item]["output_filename"])}
+            if adopted: save_assets(conn, [image_asset_row(all_jobs[item], UNKNOWN_SOURCE_HASH) for item in adopted], writer)
+            jobs = [all_jobs[item] for item in stale + missing]
+            print(f"Images: {len(fresh)} up to date, {len(stale)} stale, {len(missing)} missing ({len(adopted)} adopted from disk).")
+            progress = ProgressReporter(len(jobs), "images")
+
+        if not jobs: print("No images to generate."); return
+        if not generate: print(f"{len(jobs)} images left to generate (run generate_manual_images.py)."); return
+
+        try:
+            print("Initializing Vertex AI and Imagen Model...")
+            imagen_model = get_image_model(IMAGEN_MODEL_NAME, PROJECT_ID, LOCATION)
+            print("Vertex AI and Imagen Model initialized.")
+        except Exception as e:
+            print(f"Error initializing Vertex AI or Imagen Model: {e}")
+            return
+        print(f"Generating {len(jobs)} images with up to {max_in_flight} requests in flight...")
+        generated = generate_images(jobs, imagen_model, max_in_flight, rate_limiter, failure_queue, progress)
+        save_assets(conn, [image_asset_row(job) for job in generated], writer)
+
+        print(f"\nImage generation process finished. {len(generated)}/{len(jobs)} images generated ({progress.summary()}).")
+        if len(failure_queue): print(f"{len(failure_queue)} failed images recorded in {failure_queue_file}; rerun with --retry-failures.")
 
     finally:
         if conn: conn.close(); print("Database connection closed.")
@@ -119,6 +221,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate images for manual steps stored in the database.")
     # Keep argument name consistent
     parser.add_argument("-m", "--manual_id", type=int, help="Optional: Process only steps for a specific manual_id.")
+    parser.add_argument("-c", "--max-in-flight", type=positive_int, default=IMAGEN_MAX_IN_FLIGHT, help=f"Concurrent Imagen requests (default: {IMAGEN_MAX_IN_FLIGHT}).")
+    parser.add_argument("--rpm", type=positive_int, default=IMAGEN_REQUESTS_PER_MINUTE, help=f"Maximum Imagen requests per minute (default: {IMAGEN_REQUESTS_PER_MINUTE}).")
+    parser.add_argument("--retry-failures", action="store_true", help=f"Only retry the prompts recorded in {FAILURE_QUEUE_FILE}.")
     args = parser.parse_args()
 
     print("--- Starting Manual Image Generation Script (DB version) ---")
@@ -128,4 +233,6 @@ if __name__ == "__main__":
     else: print("Processing all manuals found in DB.")
     print("-" * 40)
 
-    process_images_for_manual(DATABASE_FILE, OUTPUT_DIR, manual_id_filter=args.manual_id) # Pass arg correctly
\ No newline at end of file
+    process_images_for_manual(DATABASE_FILE, OUTPUT_DIR, manual_id_filter=args.manual_id, max_in_flight=args.max_in_flight,
+                              rate_limiter=TokenBucket.per_minute(args.rpm, burst=args.max_in_flight),
+                              retry_failures=args.retry_failures) # Pass arg correctly
\ No newline at end of file
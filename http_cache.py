@@ -0,0 +1,110 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+# Helpers for conditional (ETag / If-None-Match) and compressed JSON responses.
+# Compressed bodies are cached by (version, encoding) so each version of a
+# document is compressed only once.
+
+# --- Configuration ---
+MIN_COMPRESS_BYTES = 512 # Smaller bodies are sent uncompressed
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+MAX_CACHED_BODIES = 256 # Compressed bodies kept in memory (LRU)
+# --- End Configuration ---
+
+def body_version(body):
+    """Returns a content hash usable as a version for bodies without a stored version."""
+    return hashlib.sha256(body).hexdigest()[:32]
+
+def make_etag(version, encoding=None):
+    """Builds a strong ETag; each encoding is a distinct representation of the same version."""
+    return f'"{version}-{encoding}"' if encoding else f'"{version}"'
+
+def etag_matches(if_none_match, version):
+    """True if an If-None-Match header refers to any representation of `version`."""
+    if not if_none_match: return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*': return True
+        if tag.startswith('W/'): tag = tag[2:]
+        tag = tag.strip('"')
+        for suffix in ('-gzip', '-br'):
+            if tag.endswith(suffix): tag = tag[:-len(suffix)]
+        if tag == version: return True
+    return False
+
+def choose_encoding(accept_encoding):
+    """Picks the best supported Content-Encoding from an Accept-Encoding header (None = identity)."""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try: q = float(params[2:])
+            except ValueError: q = 0.0
+        if name: accepted[name.strip().lower()] = q
+    if brotli is not None and accepted.get('br', 0) > 0: return 'br'
+    if accepted.get('gzip', 0) > 0: return 'gzip'
+    return None
+
+class CompressedBodyCache:
+    """Thread-safe LRU cache of compressed response bodies keyed by (version, encoding)."""
+
+    def __init__(self, max_entries=MAX_CACHED_BODIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, encoding, body):
+        """Returns `body` compressed with `encoding`, compressing it only on a cache miss."""
+        key = (version, encoding)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        if encoding == 'br': compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+        else: compressed = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+        with self._lock:
+            self._entries[key] = compressed
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+        return compressed
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+def prepare_response(body, version, if_none_match, accept_encoding, cache):
+    """Decides how to answer a GET for `body` at `version`.
+
+    Returns (status, payload_bytes, headers): 304 with an empty payload if the
+    client already has this version, otherwise 200 with a (possibly compressed) body.
+    """
+    if isinstance(body, str): body = body.encode('utf-8')
+    encoding = choose_encoding(accept_encoding) if len(body) >= MIN_COMPRESS_BYTES else None
+    headers = {
+        "ETag": make_etag(version, encoding),
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "no-cache", # Always revalidate; unchanged content costs a 304
+    }
+    if etag_matches(if_none_match, version): return 304, b'', headers
+
+    if encoding:
+        body = cache.get(version, encoding, body)
+        headers["Content-Encoding"] = encoding
+    return 200, body, headers
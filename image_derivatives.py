@@ -0,0 +1,174 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from PIL import Image, features # Required: pip install pillow
+except ImportError:
+    Image = features = None
+
+from rate_limit import ProgressReporter
+
+# Post-processing for generated step images: responsive WebP (optionally AVIF)
+# variants at a few widths plus a small thumbnail per source PNG, written under
+# <images dir>/derived/. derivatives.json records, per image, the source hash and
+# the variants, so reruns only process new or changed sources and the frontend
+# can build a srcset from it. Encoding runs in a process pool across CPU cores.
+# By default every public/manual_images* directory is processed, each served
+# under its own name.
+
+# --- Configuration ---
+PUBLIC_DIR = 'technisat-manual/public' # Served at the site root by the frontend
+IMAGES_DIR_PATTERN = 'manual_images*' # Image directories under PUBLIC_DIR
+IMAGES_DIR = 'technisat-manual/public/manual_images'
+PUBLIC_URL_PREFIX = '/manual_images' # Where IMAGES_DIR is served by the frontend
+DERIVED_SUBDIR = 'derived'
+MANIFEST_FILE = 'derivatives.json'
+WIDTHS = (320, 640, 1024) # Responsive widths (never upscaled beyond the source)
+THUMBNAIL_WIDTH = 160
+FORMATS = ('webp',) # Add 'avif' for smaller files where Pillow supports it (slower to encode)
+QUALITY = {'webp': 80, 'avif': 60}
+WORKERS = os.cpu_count() or 4
+# --- End Configuration ---
+
+MIME_TYPES = {'webp': 'image/webp', 'avif': 'image/avif'}
+
+def settings_fingerprint(widths=WIDTHS, thumbnail_width=THUMBNAIL_WIDTH, formats=FORMATS):
+    """Changes whenever derivative settings change, so every image is redone."""
+    settings = {"widths": list(widths), "thumbnail": thumbnail_width, "formats": list(formats),
+                "quality": {f: QUALITY[f] for f in formats}}
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''): digest.update(block)
+    return digest.hexdigest()
+
+def _save_variant(image, width, path, image_format):
+    height = max(1, round(image.height * width / image.width))
+    resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+    options = {"method": 6} if image_format == 'webp' else {} # Slowest, smallest WebP encoding
+    tmp_path = f"{path}.tmp"
+    resized.save(tmp_path, format=image_format.upper(), quality=QUALITY[image_format], **options)
+    os.replace(tmp_path, path)
+    return height
+
+def render_derivatives(source_path, derived_dir, stem, widths=WIDTHS, thumbnail_width=THUMBNAIL_WIDTH, formats=FORMATS):
+    """Writes all variants of one source image (runs in a worker process). Returns its manifest entry minus URLs."""
+    with Image.open(source_path) as image:
+        image.load()
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    targets = sorted({min(w, image.width) for w in widths})
+    variants, thumbnails = [], []
+    for image_format in formats:
+        for width in targets:
+            filename = f"{stem}-{width}w.{image_format}"
+            height = _save_variant(image, width, os.path.join(derived_dir, filename), image_format)
+            variants.append({"format": image_format, "width": width, "height": height, "file": filename})
+        filename = f"{stem}-thumb.{image_format}"
+        width = min(thumbnail_width, image.width)
+        height = _save_variant(image, width, os.path.join(derived_dir, filename), image_format)
+        thumbnails.append({"format": image_format, "width": width, "height": height, "file": filename})
+    return {"width": image.width, "height": image.height, "variants": variants, "thumbnails": thumbnails}
+
+def _with_urls(entry, url_prefix):
+    for variant in entry["variants"] + entry["thumbnails"]:
+        variant["url"] = f"{url_prefix}/{DERIVED_SUBDIR}/{variant['file']}"
+        variant["mime"] = MIME_TYPES[variant["format"]]
+    return entry
+
+def _read_manifest(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f: return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read {path} ({e}), rebuilding all derivatives.")
+        return {}
+
+def find_image_dirs(public_dir=PUBLIC_DIR, pattern=IMAGES_DIR_PATTERN):
+    """Returns [(images_dir, url_prefix)] for every image directory under public_dir."""
+    return [(path, f"/{os.path.basename(path)}") for path in sorted(glob.glob(os.path.join(public_dir, pattern))) if os.path.isdir(path)]
+
+def build_derivatives(images_dir=IMAGES_DIR, url_prefix=PUBLIC_URL_PREFIX, widths=WIDTHS, thumbnail_width=THUMBNAIL_WIDTH,
+                      formats=FORMATS, workers=WORKERS):
+    """Creates or updates derivatives for every PNG in images_dir. Returns (processed, unchanged, failed)."""
+    unsupported = [f for f in formats if not features.check(f)]
+    if unsupported: raise ValueError(f"Pillow was built without support for: {', '.join(unsupported)}")
+
+    manifest_path = os.path.join(images_dir, MANIFEST_FILE)
+    derived_dir = os.path.join(images_dir, DERIVED_SUBDIR)
+    os.makedirs(derived_dir, exist_ok=True)
+    fingerprint = settings_fingerprint(widths, thumbnail_width, formats)
+    old_manifest = _read_manifest(manifest_path)
+    old_images = old_manifest.get("images", {}) if old_manifest.get("settings") == fingerprint else {}
+    if old_manifest.get("images") and not old_images: print("Derivative settings changed, rebuilding all derivatives.")
+
+    # Plan: a source is unchanged if its size/mtime (or, failing that, its content hash) match the manifest
+    images, todo = {}, []
+    for filename in sorted(os.listdir(images_dir)):
+        if not filename.lower().endswith('.png'): continue
+        stem, source_path = os.path.splitext(filename)[0], os.path.join(images_dir, filename)
+        st = os.stat(source_path)
+        previous = old_images.get(stem)
+        if previous and previous["source_size"] == st.st_size and previous["source_mtime_ns"] == st.st_mtime_ns:
+            images[stem] = previous
+            continue
+        source_hash = file_hash(source_path)
+        if previous and previous["source_hash"] == source_hash:
+            images[stem] = dict(previous, source_mtime_ns=st.st_mtime_ns, source_size=st.st_size)
+            continue
+        todo.append((stem, filename, source_path, source_hash, st))
+
+    print(f"Image derivatives: {len(todo)} sources to process, {len(images)} unchanged ({workers} workers).")
+    progress = ProgressReporter(len(todo), "images")
+    failed = 0
+    if todo:
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(render_derivatives, source_path, derived_dir, stem, widths, thumbnail_width, formats):
+                       (stem, filename, source_hash, st) for stem, filename, source_path, source_hash, st in todo}
+            for future in as_completed(futures):
+                stem, filename, source_hash, st = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    print(f"Error creating derivatives for {filename}: {e}")
+                    failed += 1
+                    progress.record("failed")
+                    continue
+                images[stem] = dict(_with_urls(entry, url_prefix), source=filename, source_hash=source_hash,
+                                    source_size=st.st_size, source_mtime_ns=st.st_mtime_ns)
+                progress.record("succeeded")
+
+    # Remove derivative files no longer referenced (changed settings, removed or re-rendered sources)
+    referenced = {v["file"] for entry in images.values() for v in entry["variants"] + entry["thumbnails"]}
+    for filename in os.listdir(derived_dir):
+        if filename not in referenced and not filename.endswith('.tmp'): os.remove(os.path.join(derived_dir, filename))
+
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"settings": fingerprint, "images": dict(sorted(images.items()))}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, manifest_path)
+    print(f"Image derivatives finished ({progress.summary()}). Manifest: {manifest_path}")
+    return len(todo) - failed, len(images) - (len(todo) - failed), failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create responsive WebP/AVIF variants and thumbnails for generated step images.")
+    parser.add_argument("-d", "--images-dir", help=f"Directory with the source PNGs (default: every {PUBLIC_DIR}/{IMAGES_DIR_PATTERN}).")
+    parser.add_argument("-u", "--url-prefix", help="URL the directory is served under (default: /<directory name>).")
+    parser.add_argument("-f", "--formats", nargs="+", default=list(FORMATS), choices=sorted(MIME_TYPES), help=f"Output formats (default: {' '.join(FORMATS)}).")
+    parser.add_argument("-w", "--workers", type=int, default=WORKERS, help=f"Worker processes (default: {WORKERS}).")
+    args = parser.parse_args()
+
+    if Image is None:
+        print("Error: Pillow is required for image derivatives (pip install pillow).")
+    else:
+        image_dirs = find_image_dirs() if args.images_dir is None else \
+            [(args.images_dir, args.url_prefix or f"/{os.path.basename(os.path.normpath(args.images_dir))}")]
+        if not image_dirs: print(f"No image directories found matching {os.path.join(PUBLIC_DIR, IMAGES_DIR_PATTERN)}.")
+        for images_dir, url_prefix in image_dirs: build_derivatives(images_dir, url_prefix, formats=tuple(args.formats), workers=args.workers)
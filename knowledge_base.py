@@ -0,0 +1,87 @@
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from export_db_to_json import SHARD_INDEX_FILE, read_shard_index
+
+# In-memory holder for the exported knowledge base (all_manuals_knowledge.json).
+# The file is parsed and re-serialized once per change; readers always get a
+# complete, immutable snapshot that is swapped in atomically after a reload.
+# The path may also be a JSON Lines export or a shard directory written by
+# export_db_to_json.py; for shards, a reload only reads manuals whose content
+# version changed in index.json.
+
+# --- Configuration ---
+DEFAULT_CHECK_INTERVAL_SECONDS = 1.0 # How often to stat the file for changes
+# --- End Configuration ---
+
+KnowledgeSnapshot = namedtuple("KnowledgeSnapshot", ["manuals", "text", "version", "loaded_at"])
+KnowledgeSnapshot.__doc__ = """A loaded knowledge base: parsed manuals, compact JSON text and a version stamp."""
+
+class KnowledgeBase:
+    """Loads a knowledge base JSON file once and reloads it only when the file changes."""
+
+    def __init__(self, path, check_interval=DEFAULT_CHECK_INTERVAL_SECONDS):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._file_key = None
+        self._shards = {} # Shard mode: manual_id -> (content_version, manual)
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _stat_key(self):
+        st = os.stat(os.path.join(self.path, SHARD_INDEX_FILE) if os.path.isdir(self.path) else self.path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load_shards(self):
+        index = read_shard_index(self.path)
+        if not index["manuals"] and not os.path.exists(os.path.join(self.path, SHARD_INDEX_FILE)):
+            raise FileNotFoundError(f"No {SHARD_INDEX_FILE} in {self.path}")
+        shards = {}
+        for manual_id, entry in index["manuals"].items():
+            cached = self._shards.get(manual_id)
+            if cached and cached[0] == entry["content_version"]:
+                shards[manual_id] = cached
+                continue
+            with open(os.path.join(self.path, entry["file"]), 'r', encoding='utf-8') as f:
+                shards[manual_id] = (entry["content_version"], json.load(f))
+        self._shards = shards
+        return [manual for _, manual in shards.values()], index["version"]
+
+    def _load(self, file_key):
+        version = f"{file_key[0]:x}-{file_key[1]:x}"
+        if os.path.isdir(self.path):
+            manuals, version = self._load_shards()
+        elif self.path.endswith('.jsonl'):
+            with open(self.path, 'r', encoding='utf-8') as f: manuals = [json.loads(line) for line in f if line.strip()]
+        else:
+            with open(self.path, 'r', encoding='utf-8') as f: manuals = json.load(f)
+        text = json.dumps(manuals, ensure_ascii=False, separators=(',', ':')) # Compact JSON for prompts
+        return KnowledgeSnapshot(manuals, text, version, time.time())
+
+    def snapshot(self):
+        """Returns the current snapshot, reloading first if the file changed.
+
+        Raises FileNotFoundError if the file has never been loaded and does not
+        exist. If a reload fails (e.g. the file is mid-write), the previous
+        snapshot keeps being served.
+        """
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._last_check < self.check_interval: return snapshot
+
+        with self._lock:
+            if self._snapshot is not None and now - self._last_check < self.check_interval: return self._snapshot
+            self._last_check = now
+            try:
+                file_key = self._stat_key()
+                if file_key != self._file_key or self._snapshot is None:
+                    self._snapshot = self._load(file_key)
+                    self._file_key = file_key
+                    print(f"Knowledge base loaded from {self.path} (version {self._snapshot.version}, {len(self._snapshot.manuals)} manuals)")
+            except (OSError, ValueError) as e:
+                if self._snapshot is None: raise
+                print(f"Warning: Keeping previous knowledge base, reload of {self.path} failed: {e}")
+            return self._snapshot
@@ -0,0 +1,138 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+from manual_documents import refresh_manual_documents
+
+# Generated media (step images, item audio) recorded in the `assets` table.
+# Generators plan their work from it in bulk instead of probing the filesystem:
+# an asset is fresh if its recorded source-text hash matches the current text,
+# stale if the text changed, missing if there is no row. The manual documents
+# served by the API carry the asset URLs inline (see manual_loader).
+
+# --- Configuration ---
+DATABASE_FILE = 'manuals.db'
+PUBLIC_DIR = 'technisat-manual/public' # Asset paths are URL paths relative to this directory
+# --- End Configuration ---
+
+# Source-text hash of files recorded without knowing what they were generated from
+# (adopted from disk); never matches a real hash, so they are planned as stale
+UNKNOWN_SOURCE_HASH = ''
+
+def text_hash(text):
+    """SHA-256 of the whitespace-normalized source text."""
+    return hashlib.sha256(" ".join(text.split()).encode('utf-8')).hexdigest()
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''): digest.update(block)
+    return digest.hexdigest()
+
+def asset_row(manual_id, item_id, kind, path, source_text_hash, file_path, mime=None, content_hash=None):
+    """Builds a row for record_assets from a generated file (hashing it unless content_hash is known)."""
+    return {"manual_id": manual_id, "item_id": item_id, "kind": kind, "path": path, "mime": mime,
+            "content_hash": content_hash or file_hash(file_path), "source_text_hash": source_text_hash,
+            "size": os.path.getsize(file_path)}
+
+def load_assets(conn, kind, manual_ids=None):
+    """Returns {(manual_id, item_id): row dict} for one kind of asset."""
+    query = "SELECT manual_id, item_id, kind, path, mime, content_hash, source_text_hash, size, generated_at FROM assets WHERE kind = ?"
+    params = [kind]
+    if manual_ids is not None:
+        manual_ids = list(manual_ids)
+        query += f" AND manual_id IN ({', '.join('?' for _ in manual_ids)})"
+        params += manual_ids
+    columns = ("manual_id", "item_id", "kind", "path", "mime", "content_hash", "source_text_hash", "size", "generated_at")
+    return {(row[0], row[1]): dict(zip(columns, row)) for row in conn.execute(query, params)}
+
+def plan_assets(conn, kind, items):
+    """Splits (manual_id, item_id, source_text_hash) items into (fresh, stale, missing) lists using one query."""
+    recorded = load_assets(conn, kind, {manual_id for manual_id, _, _ in items})
+    fresh, stale, missing = [], [], []
+    for item in items:
+        row = recorded.get(item[:2])
+        if row is None: missing.append(item)
+        elif row["source_text_hash"] == item[2]: fresh.append(item)
+        else: stale.append(item)
+    return fresh, stale, missing
+
+def record_assets(conn, rows):
+    """Upserts asset rows, refreshes the affected manual documents and commits.
+
+    Takes the connection first so it can run on a SQLiteWriter: writer.call(record_assets, rows).
+    """
+    if not rows: return 0
+    conn.executemany("""
+        INSERT INTO assets (manual_id, item_id, kind, path, mime, content_hash, source_text_hash, size)
+        VALUES (:manual_id, :item_id, :kind, :path, :mime, :content_hash, :source_text_hash, :size)
+        ON CONFLICT(manual_id, item_id, kind) DO UPDATE SET
+            path = excluded.path, mime = excluded.mime, content_hash = excluded.content_hash,
+            source_text_hash = excluded.source_text_hash, size = excluded.size, generated_at = CURRENT_TIMESTAMP
+    """, rows)
+    refresh_manual_documents(conn, sorted({row["manual_id"] for row in rows}))
+    conn.commit()
+    return len(rows)
+
+def repoint_assets(conn, kind, replacements):
+    """Moves assets to new files, e.g. after transcoding. Refreshes affected documents and commits.
+
+    replacements: (old_path, new_path, mime, content_hash, size) tuples. Returns the number of rows updated.
+    """
+    manual_ids = set()
+    for old_path, *_ in replacements:
+        manual_ids.update(row[0] for row in conn.execute("SELECT manual_id FROM assets WHERE kind = ? AND path = ?", (kind, old_path)))
+    before = conn.total_changes
+    conn.executemany("""
+        UPDATE assets SET path = ?, mime = ?, content_hash = ?, size = ?, generated_at = CURRENT_TIMESTAMP
+        WHERE kind = ? AND path = ?
+    """, [(new_path, mime, content_hash, size, kind, old_path) for old_path, new_path, mime, content_hash, size in replacements])
+    updated = conn.total_changes - before
+    refresh_manual_documents(conn, sorted(manual_ids))
+    conn.commit()
+    return updated
+
+def save_assets(conn, rows, writer=None):
+    """Records rows on the given SQLiteWriter if any (serialized with other writes), else on conn."""
+    return writer.call(record_assets, rows) if writer else record_assets(conn, rows)
+
+def verify_assets(conn, public_dir=PUBLIC_DIR):
+    """Deletes rows whose files are gone (so the next run regenerates them). Returns the number removed."""
+    rows = conn.execute("SELECT asset_id, manual_id, path FROM assets").fetchall()
+    gone = [(asset_id, manual_id) for asset_id, manual_id, path in rows if not os.path.exists(os.path.join(public_dir, path.lstrip('/')))]
+    conn.executemany("DELETE FROM assets WHERE asset_id = ?", [(asset_id,) for asset_id, _ in gone])
+    refresh_manual_documents(conn, sorted({manual_id for _, manual_id in gone}))
+    conn.commit()
+    return len(gone)
+
+def backfill_assets(db_file=DATABASE_FILE, manual_id=None):
+    """Records images and audio already on disk (generated before the assets table existed) without calling any model.
+
+    Their source text is unknown, so they are served until the generators regenerate them as stale.
+    """
+    # Imported here: the generators import this module
+    from generate_manual_audio import OUTPUT_DIR as AUDIO_DIR, process_audio_for_manual
+    from generate_manual_images import OUTPUT_DIR as IMAGES_DIR, process_images_for_manual
+    process_images_for_manual(db_file, IMAGES_DIR, manual_id, generate=False)
+    process_audio_for_manual(db_file, AUDIO_DIR, manual_id, generate=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inspect or verify the generated-asset manifest in the database.")
+    parser.add_argument("--verify", action="store_true", help="Drop rows whose files no longer exist on disk.")
+    parser.add_argument("--backfill", action="store_true", help="Record existing images/audio on disk (no credentials needed).")
+    args = parser.parse_args()
+
+    if not os.path.exists(DATABASE_FILE):
+        print(f"Error: Database file '{DATABASE_FILE}' not found.")
+    else:
+        if args.backfill: backfill_assets(DATABASE_FILE)
+        conn = sqlite3.connect(DATABASE_FILE)
+        try:
+            if args.verify: print(f"Removed {verify_assets(conn)} assets whose files are missing.")
+            for kind, count, size in conn.execute("SELECT kind, COUNT(*), COALESCE(SUM(size), 0) FROM assets GROUP BY kind"):
+                print(f"{kind}: {count} assets, {size / 1e6:.1f} MB")
+        except sqlite3.Error as e:
+            print(f"Database error reading assets: {e} (run setup_database.py first?)")
+        finally:
+            conn.close()
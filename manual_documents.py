@@ -0,0 +1,80 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+from manual_loader import load_manuals
+
+# Pre-serialized manual documents, stored in the `manual_documents` table.
+# The API serves these blobs as-is; they are regenerated whenever a manual is
+# inserted or changed (or its generated assets are), and stamped with a content
+# version (SHA-256 of the JSON).
+
+# --- Configuration ---
+DATABASE_FILE = 'manuals.db'
+# --- End Configuration ---
+
+def serialize_document(manual_data):
+    """Serializes a manual dict into the compact JSON served by the API."""
+    return json.dumps(manual_data, ensure_ascii=False, separators=(',', ':'))
+
+def content_version(document):
+    """Returns the content version (hex SHA-256) of a serialized document."""
+    return hashlib.sha256(document.encode('utf-8')).hexdigest()
+
+def refresh_manual_documents(conn, manual_ids=None):
+    """Rebuilds the stored documents for the given manuals (or all). Does not commit.
+
+    Documents whose content is unchanged keep their version and timestamp.
+    Returns the number of documents written or updated.
+    """
+    manuals = load_manuals(conn, manual_ids, include_assets=True)
+    rows = []
+    for manual_data in manuals:
+        document = serialize_document(manual_data)
+        rows.append((manual_data['manual_id'], content_version(document), document))
+
+    before = conn.total_changes
+    conn.executemany("""
+        INSERT INTO manual_documents (manual_id, content_version, document) VALUES (?, ?, ?)
+        ON CONFLICT(manual_id) DO UPDATE SET
+            content_version = excluded.content_version,
+            document = excluded.document,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE manual_documents.content_version != excluded.content_version
+    """, rows)
+    written = conn.total_changes - before
+
+    # Drop documents of manuals that no longer exist
+    if manual_ids is None:
+        conn.execute("DELETE FROM manual_documents WHERE manual_id NOT IN (SELECT manual_id FROM manuals)")
+    else:
+        found = {manual_id for manual_id, _, _ in rows}
+        missing = [(manual_id,) for manual_id in manual_ids if manual_id not in found]
+        conn.executemany("DELETE FROM manual_documents WHERE manual_id = ?", missing)
+    return written
+
+def get_manual_document(conn, manual_id):
+    """Returns (document, content_version) for a manual, or None if it is not materialized."""
+    row = conn.execute("SELECT document, content_version FROM manual_documents WHERE manual_id = ?", (manual_id,)).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild the pre-serialized manual documents served by the API.")
+    parser.add_argument("-m", "--manual_id", type=int, help="Optional: Rebuild only the document for a specific manual_id.")
+    args = parser.parse_args()
+
+    if not os.path.exists(DATABASE_FILE):
+        print(f"Error: Database file '{DATABASE_FILE}' not found.")
+    else:
+        conn = sqlite3.connect(DATABASE_FILE)
+        try:
+            written = refresh_manual_documents(conn, [args.manual_id] if args.manual_id else None)
+            conn.commit()
+            print(f"Manual documents refreshed ({written} written or updated).")
+        except sqlite3.Error as e:
+            print(f"Database error refreshing manual documents: {e} (run setup_database.py first?)")
+            conn.rollback()
+        finally:
+            conn.close()
@@ -0,0 +1,117 @@
+import json
+import sqlite3
+
+# Assembles manuals into the nested JSON shape used by the API and the exporter.
+# Content is loaded with a fixed number of set-based queries (one per table),
+# regardless of how many manuals or tabs are requested.
+
+def _placeholders(values):
+    return ", ".join("?" for _ in values)
+
+def _parse_json_list(value):
+    """Safely parses a JSON array stored as text, defaulting to an empty list."""
+    try: return json.loads(value or '[]')
+    except (json.JSONDecodeError, TypeError): return []
+
+def _manual_filter(manual_ids, column):
+    """Returns a WHERE fragment and params restricting `column` to manual_ids (None = all)."""
+    if manual_ids is None: return "", []
+    return f" WHERE {column} IN ({_placeholders(manual_ids)})", list(manual_ids)
+
+def load_manuals(conn, manual_ids=None, include_tab_id=False, include_assets=False):
+    """Loads and structures the given manuals (or all manuals if manual_ids is None).
+
+    Returns a list of manual dicts ordered by manual_id. If include_tab_id is set,
+    each tab also carries an 'id' key equal to its tab_key (exporter format).
+    If include_assets is set, each manual carries an 'assets' dict mapping item ids
+    to their generated media, e.g. {"x_step_00": {"image": {"url": ...}, "audio": {"url": ..., "mime": ...}}}.
+    """
+    if manual_ids is not None:
+        manual_ids = list(manual_ids)
+        if not manual_ids: return []
+
+    previous_factory = conn.row_factory
+    conn.row_factory = sqlite3.Row
+    try:
+        where, params = _manual_filter(manual_ids, "manual_id")
+        manuals = conn.execute(f"SELECT * FROM manuals{where} ORDER BY manual_id", params).fetchall()
+        if not manuals: return []
+
+        where, params = _manual_filter(manual_ids, "manual_id")
+        tabs = conn.execute(f"""
+            SELECT manual_id, tab_id, tab_key, title, tab_order, content_type
+            FROM tabs{where} ORDER BY manual_id, tab_order
+        """, params).fetchall()
+
+        where, params = _manual_filter(manual_ids, "t.manual_id")
+        list_rows = conn.execute(f"""
+            SELECT l.tab_id, l.item_order, l.text
+            FROM tab_content_list l JOIN tabs t ON t.tab_id = l.tab_id{where}
+            ORDER BY l.tab_id, l.item_order
+        """, params).fetchall()
+        step_rows = conn.execute(f"""
+            SELECT s.tab_id, s.step_order, s.text, s.warning, s.note
+            FROM tab_content_steps s JOIN tabs t ON t.tab_id = s.tab_id{where}
+            ORDER BY s.tab_id, s.step_order
+        """, params).fetchall()
+        text_rows = conn.execute(f"""
+            SELECT x.tab_id, x.text
+            FROM tab_content_text x JOIN tabs t ON t.tab_id = x.tab_id{where}
+        """, params).fetchall()
+
+        asset_rows = []
+        if include_assets:
+            where, params = _manual_filter(manual_ids, "manual_id")
+            try: asset_rows = conn.execute(f"SELECT manual_id, item_id, kind, path, mime FROM assets{where} ORDER BY manual_id, item_id", params).fetchall()
+            except sqlite3.OperationalError: pass # assets table not created yet
+    finally:
+        conn.row_factory = previous_factory
+
+    # Group content rows by tab_id
+    list_by_tab, steps_by_tab = {}, {}
+    for row in list_rows: list_by_tab.setdefault(row['tab_id'], []).append(row)
+    for row in step_rows: steps_by_tab.setdefault(row['tab_id'], []).append(row)
+    text_by_tab = {row['tab_id']: row['text'] for row in text_rows}
+
+    tabs_by_manual = {}
+    for tab_row in tabs:
+        tab_data = dict(tab_row)
+        manual_id = tab_data.pop('manual_id')
+        tab_id, tab_key, content_type = tab_data['tab_id'], tab_data['tab_key'], tab_data['content_type']
+
+        if content_type == 'list':
+            tab_data['content'] = [{"id": f"{tab_key}_item_{item['item_order']:02d}", "text": item['text']} for item in list_by_tab.get(tab_id, [])]
+        elif content_type == 'steps':
+            steps_raw = steps_by_tab.get(tab_id, [])
+            steps_content = {"steps": [{"id": f"{tab_key}_step_{step['step_order']:02d}", "text": step['text']} for step in steps_raw]}
+            # Warning/note are stored on the first/last step
+            if steps_raw and steps_raw[0]['warning']: steps_content["warning"] = steps_raw[0]['warning']
+            if steps_raw and steps_raw[-1]['note']: steps_content["note"] = steps_raw[-1]['note']
+            tab_data['content'] = steps_content
+        elif content_type == 'text':
+            tab_data['content'] = text_by_tab.get(tab_id, "")
+        else:
+            tab_data['content'] = None
+
+        if include_tab_id: tab_data['id'] = tab_key
+        tabs_by_manual.setdefault(manual_id, []).append(tab_data)
+
+    assets_by_manual = {}
+    for row in asset_rows:
+        asset = {"url": row['path'], "mime": row['mime']} if row['mime'] else {"url": row['path']}
+        assets_by_manual.setdefault(row['manual_id'], {}).setdefault(row['item_id'], {})[row['kind']] = asset
+
+    manuals_data = []
+    for manual_row in manuals:
+        manual_data = dict(manual_row)
+        manual_data['features'] = _parse_json_list(manual_data.get('features'))
+        manual_data['special_features'] = _parse_json_list(manual_data.get('special_features'))
+        manual_data['tabs'] = tabs_by_manual.get(manual_data['manual_id'], [])
+        if include_assets: manual_data['assets'] = assets_by_manual.get(manual_data['manual_id'], {})
+        manuals_data.append(manual_data)
+    return manuals_data
+
+def load_manual(conn, manual_id, include_tab_id=False, include_assets=False):
+    """Loads a single manual, or returns None if it does not exist."""
+    manuals = load_manuals(conn, [manual_id], include_tab_id=include_tab_id, include_assets=include_assets)
+    return manuals[0] if manuals else None
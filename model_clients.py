@@ -0,0 +1,181 @@
+import io
+import json
+import os
+import threading
+import time
+import wave
+
+# Process-wide registry of model clients (Gemini, Imagen, Text-to-Speech).
+# Each client is created lazily, once per process, and then shared by all callers;
+# the client objects own the underlying HTTP/gRPC channels, so reusing them also
+# reuses those connections. vertexai.init runs once per project/location.
+#
+# Set MODEL_BACKEND=fake (or call use_backend('fake')) to swap in local fakes for
+# tests and benchmarks; FAKE_MODEL_LATENCY_MS adds simulated latency per call.
+
+# --- Configuration ---
+PROJECT_ID = "bliss-hack25fra-9531"
+LOCATION = "europe-central2"
+DEFAULT_BACKEND = os.environ.get("MODEL_BACKEND", "vertex")
+FAKE_LATENCY_SECONDS = float(os.environ.get("FAKE_MODEL_LATENCY_MS", "0")) / 1000
+# --- End Configuration ---
+
+class VertexBackend:
+    """Real Google Cloud clients. SDKs are imported lazily so scripts only need what they use."""
+
+    def __init__(self):
+        self._initialized = set()
+        self._lock = threading.Lock()
+
+    def _init_vertex(self, project_id, location):
+        with self._lock:
+            if (project_id, location) not in self._initialized:
+                import vertexai
+                vertexai.init(project=project_id, location=location)
+                self._initialized.add((project_id, location))
+
+    def generative_model(self, model_name, project_id, location):
+        self._init_vertex(project_id, location)
+        from vertexai.generative_models import GenerativeModel
+        return GenerativeModel(model_name)
+
+    def image_model(self, model_name, project_id, location):
+        self._init_vertex(project_id, location)
+        from vertexai.preview.vision_models import ImageGenerationModel
+        return ImageGenerationModel.from_pretrained(model_name)
+
+    def tts_client(self):
+        from google.cloud import texttospeech
+        return texttospeech.TextToSpeechClient()
+
+# --- Local fakes ---
+class _FakePart:
+    def __init__(self, text): self.text = text
+
+class _FakeContent:
+    def __init__(self, text): self.parts = [_FakePart(text)]
+
+class _FakeCandidate:
+    def __init__(self, text): self.content = _FakeContent(text)
+
+class FakeResponse:
+    """Mimics the parts of a GenerationResponse the scripts use (.text and .candidates)."""
+    def __init__(self, text):
+        self.text = text
+        self.candidates = [_FakeCandidate(text)]
+
+def default_fake_responder(contents, generation_config):
+    """Returns a minimal manual JSON for JSON requests, a canned answer otherwise."""
+    if (generation_config or {}).get("response_mime_type") == "application/json":
+        return json.dumps({"title": "Fake Manual", "features": [], "specialFeatures": [], "tabs": []})
+    return "This is a fake answer from the local test backend."
+
+class FakeGenerativeModel:
+    def __init__(self, model_name, responder=default_fake_responder, latency=FAKE_LATENCY_SECONDS):
+        self.model_name = model_name
+        self.responder = responder
+        self.latency = latency
+
+    def generate_content(self, contents, generation_config=None, stream=False, **kwargs):
+        if self.latency: time.sleep(self.latency)
+        text = self.responder(contents, generation_config)
+        if not stream: return FakeResponse(text)
+        words = text.split(" ")
+        return iter([FakeResponse(word if i == 0 else " " + word) for i, word in enumerate(words)])
+
+    async def generate_content_async(self, contents, generation_config=None, stream=False, **kwargs):
+        import asyncio
+        if self.latency: await asyncio.sleep(self.latency)
+        text = self.responder(contents, generation_config)
+        if not stream: return FakeResponse(text)
+        async def chunks():
+            for i, word in enumerate(text.split(" ")): yield FakeResponse(word if i == 0 else " " + word)
+        return chunks()
+
+class _FakeImage:
+    # 1x1 transparent PNG
+    _image_bytes = bytes.fromhex("89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+                                 "1f15c4890000000d49444154789c6360000002000154a24f9d0000000049454e44ae426082")
+
+class _FakeImageResponse:
+    def __init__(self): self.images = [_FakeImage()]
+
+class FakeImageModel:
+    def __init__(self, model_name, latency=FAKE_LATENCY_SECONDS):
+        self.model_name = model_name
+        self.latency = latency
+
+    def generate_images(self, prompt, number_of_images=1, **kwargs):
+        if self.latency: time.sleep(self.latency)
+        return _FakeImageResponse()
+
+class _FakeAudioResponse:
+    def __init__(self, audio_content): self.audio_content = audio_content
+
+class FakeTtsClient:
+    """Returns a short silent WAV for every request."""
+    def __init__(self, latency=FAKE_LATENCY_SECONDS):
+        self.latency = latency
+
+    def synthesize_speech(self, input=None, voice=None, audio_config=None, **kwargs):
+        if self.latency: time.sleep(self.latency)
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as w:
+            w.setnchannels(1); w.setsampwidth(2); w.setframerate(24000)
+            w.writeframes(b"\x00\x00" * 2400)
+        return _FakeAudioResponse(buffer.getvalue())
+
+class FakeBackend:
+    """Local, offline stand-ins for the Google clients."""
+
+    def __init__(self, responder=default_fake_responder):
+        self.responder = responder
+
+    def generative_model(self, model_name, project_id, location): return FakeGenerativeModel(model_name, self.responder)
+    def image_model(self, model_name, project_id, location): return FakeImageModel(model_name)
+    def tts_client(self): return FakeTtsClient()
+# --- End local fakes ---
+
+_backends = {"vertex": VertexBackend(), "fake": FakeBackend()}
+_active_backend = DEFAULT_BACKEND
+_clients = {}
+_lock = threading.RLock()
+
+def register_backend(name, backend):
+    """Registers a backend object providing generative_model(), image_model() and tts_client()."""
+    with _lock: _backends[name] = backend
+
+def use_backend(name):
+    """Switches the active backend and drops clients created by the previous one."""
+    global _active_backend
+    with _lock:
+        if name not in _backends: raise ValueError(f"Unknown model backend '{name}'")
+        _active_backend = name
+        _clients.clear()
+
+def active_backend():
+    return _active_backend
+
+def _get_client(key, factory):
+    client = _clients.get(key)
+    if client is not None: return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory(_backends[_active_backend])
+            _clients[key] = client
+    return client
+
+def get_generative_model(model_name, project_id=PROJECT_ID, location=LOCATION):
+    """Returns the shared Gemini model client for model_name."""
+    return _get_client(("generative", model_name, project_id, location),
+                       lambda backend: backend.generative_model(model_name, project_id, location))
+
+def get_image_model(model_name, project_id=PROJECT_ID, location=LOCATION):
+    """Returns the shared Imagen model client for model_name."""
+    return _get_client(("image", model_name, project_id, location),
+                       lambda backend: backend.image_model(model_name, project_id, location))
+
+def get_tts_client():
+    """Returns the shared Text-to-Speech client (thread-safe, reuses one gRPC channel)."""
+    return _get_client(("tts",), lambda backend: backend.tts_client())
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+# Persistent cache of LLM manual parses, stored in its own SQLite file so it
+# survives rebuilding manuals.db. Entries are keyed by the source file hash, the
+# prompt version (schema description and instructions), the model name and the
+# generation config; any change to those asks the model again. The raw JSON the
+# model returned is kept verbatim together with the source path, so a parse can
+# be replayed at disk speed instead of paying the model latency again.
+
+# --- Configuration ---
+DEFAULT_CACHE_FILE = 'parse_cache.db'
+# --- End Configuration ---
+
+def parse_cache_key(source_hash, prompt_hash, model_name, generation_config):
+    """SHA-256 over everything that determines the model's parse of a source file."""
+    config = json.dumps(generation_config, sort_keys=True)
+    return hashlib.sha256("\x00".join([source_hash, prompt_hash, model_name, config]).encode('utf-8')).hexdigest()
+
+class ParseCache:
+    """Thread-safe store of raw model outputs, shared by concurrent parses."""
+
+    def __init__(self, db_file=DEFAULT_CACHE_FILE):
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0}
+        self._conn = sqlite3.connect(db_file, check_same_thread=False) # Guarded by self._lock
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS llm_parses (
+                cache_key TEXT PRIMARY KEY, -- parse_cache_key(...)
+                source_hash TEXT NOT NULL, -- SHA-256 of the source file
+                source_path TEXT NOT NULL, -- Path the file was parsed from (latest)
+                prompt_hash TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                generation_config TEXT NOT NULL, -- JSON
+                raw_response TEXT NOT NULL, -- The model's JSON output, verbatim
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_llm_parses_source ON llm_parses (source_path, created_at);
+        """)
+        self._conn.commit()
+
+    def get(self, cache_key):
+        """Returns the cached raw response for cache_key, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT raw_response FROM llm_parses WHERE cache_key = ?", (cache_key,)).fetchone()
+            self._stats["hits" if row else "misses"] += 1
+        return row[0] if row else None
+
+    def put(self, cache_key, source_hash, source_path, prompt_hash, model_name, generation_config, raw_response):
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO llm_parses
+                    (cache_key, source_hash, source_path, prompt_hash, model_name, generation_config, raw_response, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (cache_key, source_hash, source_path, prompt_hash, model_name,
+                  json.dumps(generation_config, sort_keys=True), raw_response, time.time()))
+            self._conn.commit()
+            self._stats["stores"] += 1
+
+    def latest_parses(self, prompt_hashes, model_name, generation_config):
+        """Returns [(source_path, source_hash, raw_response)] with the newest matching parse per source path."""
+        marks = ", ".join("?" for _ in prompt_hashes)
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT source_path, source_hash, raw_response FROM llm_parses
+                WHERE prompt_hash IN ({marks}) AND model_name = ? AND generation_config = ?
+                ORDER BY created_at
+            """, [*prompt_hashes, model_name, json.dumps(generation_config, sort_keys=True)]).fetchall()
+        return list({row[0]: row for row in rows}.values())
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM llm_parses").fetchone()[0]
+        return stats
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_parse_cache(db_file=DEFAULT_CACHE_FILE):
+    """Returns the process-wide ParseCache for db_file."""
+    with _caches_lock:
+        if db_file not in _caches: _caches[db_file] = ParseCache(db_file)
+        return _caches[db_file]
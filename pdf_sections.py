@@ -0,0 +1,119 @@
+import re
+
+try:
+    from pypdf import PdfReader # Optional: pip install pypdf (without it, PDFs are always parsed whole)
+except ImportError:
+    PdfReader = None
+
+# Local pre-pass for large PDFs. The page text is extracted and grouped into
+# sections that start at core-topic headings (English or German), capped at a
+# number of pages, so each section can be parsed by the model separately and
+# concurrently. merge_section_results combines the partial manuals in page order
+# into one document of the normal schema, renumbering step and item IDs.
+
+# --- Configuration ---
+MAX_SECTION_PAGES = 12 # Longer sections are split into page ranges
+MIN_TEXT_CHARS_PER_PAGE = 200 # Less extracted text than this (scanned PDFs) means: parse the PDF itself
+# Core tabs in display order, with heading keywords that start a section for them
+CORE_TAB_HEADINGS = {
+    'systemRequirements': ['system requirements', 'systemvoraussetzungen', 'systemanforderungen'],
+    'hardwareInstallation': ['hardware installation', 'installation der hardware', 'connecting', 'connection', 'setting up',
+                             'anschließen', 'anschluss', 'aufstellen', 'montage', 'inbetriebnahme'],
+    'driverInstallation': ['driver installation', 'installing the driver', 'treiberinstallation', 'installation des treibers', 'treiber'],
+    'softwareInstallation': ['software installation', 'installing the software', 'softwareinstallation', 'installation der software'],
+    'usage': ['operation', 'usage', 'using the', 'bedienung', 'betrieb', 'verwendung'],
+}
+# --- End Configuration ---
+
+HEADING_PATTERNS = {tab_id: re.compile(r"^(\d+(\.\d+)*\.?\s+)?(" + "|".join(map(re.escape, keywords)) + r")\b", re.IGNORECASE)
+                    for tab_id, keywords in CORE_TAB_HEADINGS.items()}
+
+def extract_pdf_pages(pdf_path, min_pages=0):
+    """Returns the text of each page, or None if pypdf is missing, the PDF has fewer than min_pages pages
+    or (almost) no text layer."""
+    if PdfReader is None: return None
+    try:
+        reader = PdfReader(pdf_path)
+        if len(reader.pages) < min_pages: return None
+        pages = [page.extract_text() or "" for page in reader.pages]
+    except Exception as e:
+        print(f"Warning: Could not extract text from {pdf_path} ({e}), parsing the PDF itself.")
+        return None
+    if sum(len(text.strip()) for text in pages) < MIN_TEXT_CHARS_PER_PAGE * len(pages): return None
+    return pages
+
+def page_heading(text):
+    """The core tab whose heading appears on a page, or None. Table-of-contents lines (ending in a page number) are ignored."""
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or len(line) > 60 or re.search(r"\d\s*$", line): continue
+        for tab_id, pattern in HEADING_PATTERNS.items():
+            if pattern.match(line): return tab_id
+    return None
+
+def split_sections(pages, max_pages=MAX_SECTION_PAGES):
+    """Groups pages into sections: [(first_page, last_page, tab_id or None, text)], pages 0-based and inclusive.
+
+    A section starts where a different core heading appears (running headers repeating the current one do
+    not split it) or once it reaches max_pages. A section split for length keeps its tab hint.
+    """
+    bounds = [] # [first, last, tab_id]
+    for index, text in enumerate(pages):
+        tab_id = page_heading(text)
+        if bounds and tab_id in (None, bounds[-1][2]) and index - bounds[-1][0] < max_pages:
+            bounds[-1][1] = index
+        else:
+            bounds.append([index, index, tab_id or (bounds[-1][2] if bounds else None)])
+    return [(first, last, tab_id, "\n".join(f"--- Page {i + 1} ---\n{pages[i]}" for i in range(first, last + 1)))
+            for first, last, tab_id in bounds]
+
+def _as_items(tab):
+    """A tab's content as a list of texts, whatever its type."""
+    content = tab.get("content")
+    if tab.get("type") == "steps" and isinstance(content, dict): content = content.get("steps", [])
+    if isinstance(content, str): return [content] if content.strip() else []
+    return [item.get("text", "") if isinstance(item, dict) else str(item) for item in content or []]
+
+def _append_unique(target, values):
+    for value in values:
+        if value and value not in target: target.append(value)
+
+def merge_section_results(results):
+    """Merges partial manuals (in page order) into one manual.
+
+    Title: the first one given (no key if no section states one). Features: ordered union. Tabs: one per id, core tabs in CORE_TAB_HEADINGS
+    order, others after in first-seen order. A tab found in several sections keeps the type of its first
+    occurrence; content is concatenated (text joined by blank lines, warnings/notes de-duplicated) and step
+    and item IDs are renumbered as <tab id>_step_<n> / <tab id>_item_<n>.
+    """
+    merged = {"title": "", "features": [], "specialFeatures": [], "tabs": []}
+    tabs = {}
+    for result in results:
+        if not merged["title"] and result.get("title"): merged["title"] = result["title"]
+        _append_unique(merged["features"], result.get("features") or [])
+        _append_unique(merged["specialFeatures"], result.get("specialFeatures") or [])
+        for tab in result.get("tabs") or []:
+            if not tab.get("id"): continue
+            entry = tabs.setdefault(tab["id"], {"id": tab["id"], "title": tab.get("title", tab["id"]), "type": tab.get("type", "text"),
+                                                "items": [], "warnings": [], "notes": []})
+            entry["items"] += _as_items(tab)
+            if tab.get("type") == "steps" and isinstance(tab.get("content"), dict):
+                _append_unique(entry["warnings"], [tab["content"].get("warning")])
+                _append_unique(entry["notes"], [tab["content"].get("note")])
+
+    order = list(CORE_TAB_HEADINGS) + [tab_id for tab_id in tabs if tab_id not in CORE_TAB_HEADINGS]
+    for tab_id in order:
+        entry = tabs.get(tab_id)
+        if not entry: continue
+        tab = {"id": tab_id, "title": entry["title"], "type": entry["type"]}
+        if entry["type"] == "steps":
+            tab["content"] = {"steps": [{"id": f"{tab_id}_step_{i}", "text": text} for i, text in enumerate(entry["items"])]}
+            if entry["warnings"]: tab["content"]["warning"] = "\n".join(entry["warnings"])
+            if entry["notes"]: tab["content"]["note"] = "\n".join(entry["notes"])
+        elif entry["type"] == "list":
+            tab["content"] = [{"id": f"{tab_id}_item_{i}", "text": text} for i, text in enumerate(entry["items"])]
+        else:
+            tab["content"] = "\n\n".join(entry["items"])
+        merged["tabs"].append(tab)
+    if not merged["title"]: del merged["title"] # Leaves the "Untitled Manual" default to insert_manuals
+    return merged
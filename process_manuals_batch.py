@@ -1,11 +1,15 @@
 import os
 import glob
+import time
 import argparse
-import sqlite3 # Needed to potentially get manual_id if conversion skipped but assets needed
+import sqlite3
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 # Import functions from the other scripts
 # Ensure these scripts are in the same directory or accessible via PYTHONPATH
-from convert_manual_to_db import process_single_manual, DATABASE_FILE as CONVERT_DB_FILE
+from convert_manual_to_db import parse_manual_with_llm, insert_manual_data, apply_ingest_pragmas, source_file_hash, DATABASE_FILE as CONVERT_DB_FILE, PROJECT_ID, LOCATION, MODEL_NAME
+from db_writer import SQLiteWriter
+from rate_limit import non_negative_int, positive_int
 # Import the refactored function for image generation
 from generate_manual_images import process_images_for_manual, DATABASE_FILE as IMG_DB_FILE, OUTPUT_DIR as IMG_OUT_DIR
 from generate_manual_audio import process_audio_for_manual, DATABASE_FILE as AUDIO_DB_FILE, OUTPUT_DIR as AUDIO_OUT_DIR
@@ -14,21 +18,125 @@ from generate_manual_audio import process_audio_for_manual, DATABASE_FILE as AUD
 MANUALS_SOURCE_DIR = "ProduktAssets/TechniSat/BDA/"
 FILE_PATTERN = "*.pdf" # Process only PDF files
 MAX_FILES_TO_PROCESS = 10 # Limit the number of files processed in one run
+PARSE_WORKERS = 4 # Concurrent Gemini parse requests
+IMAGE_WORKERS = 2 # Manuals whose images are generated concurrently
+AUDIO_WORKERS = 2 # Manuals whose audio is generated concurrently
 # --- End Configuration ---
 
-def get_manual_id_by_source(conn, source_path):
-    """Gets the manual_id for a given source_path if it exists."""
-    cursor = conn.cursor()
+def _timed(fn, *args, **kwargs):
+    """Runs fn and returns (result, elapsed_seconds)."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def load_source_hashes(db_file):
+    """Returns {source_path: (manual_id, source_hash)} for every ingested manual (one query)."""
+    conn = sqlite3.connect(db_file)
+    try: return {row[0]: (row[1], row[2]) for row in conn.execute("SELECT source_path, manual_id, source_hash FROM manuals")}
+    finally: conn.close()
+
+def parse_if_changed(pdf_path, known):
+    """Parse stage: returns (parsed data, source hash), or (None, manual_id) if the file is unchanged since its last ingestion."""
+    source_hash = source_file_hash(pdf_path)
+    previous = known.get(pdf_path)
+    if previous and previous[1] == source_hash: return None, previous[0]
+    data = parse_manual_with_llm(pdf_path, PROJECT_ID, LOCATION, MODEL_NAME)
+    return (data, source_hash) if data else None
+
+def _timed_on_writer(conn, fn, *args):
+    """Writer-thread variant of _timed: fn receives the writer's connection first."""
+    return _timed(fn, conn, *args)
+
+def run_batch(pdf_paths, db_file, parse_workers=PARSE_WORKERS, image_workers=IMAGE_WORKERS, audio_workers=AUDIO_WORKERS):
+    """Runs the pipelined ingestion of pdf_paths and returns per-stage statistics.
+
+    Stages: parse (concurrent Gemini calls; skipped for files whose hash matches their
+    last ingestion, which skip all further stages) -> insert (single SQLite writer thread)
+    -> images and audio (separate pools, started as soon as a manual's rows exist;
+    their asset rows are written through the same writer). A worker count of 0
+    disables the images or audio stage. Returns None if db_file does not exist or is not set up; input files
+    that do not exist count as failed parses.
+    """
+    if not os.path.exists(db_file): print(f"Error: Database file '{db_file}' not found."); return None
+    stages = ["parse", "insert"] + (["images"] if image_workers > 0 else []) + (["audio"] if audio_workers > 0 else [])
+    stats = {stage: {"done": 0, "failed": 0, "busy_seconds": 0.0} for stage in stages}
+    remaining = {} # pdf_path -> number of media stages still running
+    completed_manuals, failed_manuals, unchanged_manuals = 0, 0, 0
+    start = time.perf_counter()
+    try: known = load_source_hashes(db_file)
+    except sqlite3.OperationalError as e: print(f"Database error reading ingested manuals: {e} (run setup_database.py first?)"); return None
+
+    parse_pool = ThreadPoolExecutor(max_workers=parse_workers, thread_name_prefix="parse")
+    image_pool = ThreadPoolExecutor(max_workers=image_workers, thread_name_prefix="images") if image_workers > 0 else None
+    audio_pool = ThreadPoolExecutor(max_workers=audio_workers, thread_name_prefix="audio") if audio_workers > 0 else None
+    writer = SQLiteWriter(db_file)
+    writer.call(apply_ingest_pragmas)
     try:
-        cursor.execute("SELECT manual_id FROM manuals WHERE source_path = ?", (source_path,))
-        result = cursor.fetchone()
-        return result[0] if result else None
-    except sqlite3.Error as e:
-        print(f"Error querying manual_id for {source_path}: {e}")
-        return None
-
-def main(limit):
-    """Finds PDFs and processes them."""
+        pending = {} # future -> (stage, pdf_path)
+        for pdf_path in pdf_paths:
+            if not os.path.exists(pdf_path): # Same check as process_single_manual, before any work is queued
+                print(f"Error: Input file not found at {pdf_path}")
+                stats["parse"]["failed"] += 1
+                failed_manuals += 1
+                continue
+            pending[parse_pool.submit(_timed, parse_if_changed, pdf_path, known)] = ("parse", pdf_path)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, pdf_path = pending.pop(future)
+                try: result, seconds = future.result()
+                except Exception as e:
+                    print(f"!! Unexpected error in {stage} stage for {pdf_path}: {e}")
+                    result, seconds = None, 0.0
+                stats[stage]["busy_seconds"] += seconds
+
+                if stage in ("parse", "insert") and result is None:
+                    print(f"Skipping remaining stages for {pdf_path} due to {stage} failure.")
+                    stats[stage]["failed"] += 1
+                    failed_manuals += 1
+                    continue
+                if stage == "parse" and result[0] is None:
+                    print(f"Skipping {pdf_path}: unchanged since its last ingestion (ID: {result[1]}).")
+                    unchanged_manuals += 1
+                    continue
+                stats[stage]["done"] += 1
+
+                if stage == "parse":
+                    pending[writer.submit(_timed_on_writer, insert_manual_data, *result)] = ("insert", pdf_path)
+                elif stage == "insert":
+                    manual_id = result
+                    remaining[pdf_path] = 0
+                    if image_pool:
+                        pending[image_pool.submit(_timed, process_images_for_manual, IMG_DB_FILE, IMG_OUT_DIR, manual_id_filter=manual_id, writer=writer)] = ("images", pdf_path)
+                        remaining[pdf_path] += 1
+                    if audio_pool:
+                        pending[audio_pool.submit(_timed, process_audio_for_manual, AUDIO_DB_FILE, AUDIO_OUT_DIR, manual_id_filter=manual_id, writer=writer)] = ("audio", pdf_path)
+                        remaining[pdf_path] += 1
+                    if remaining[pdf_path] == 0: completed_manuals += 1
+                else:
+                    remaining[pdf_path] -= 1
+                    if remaining[pdf_path] == 0: completed_manuals += 1
+    finally:
+        for pool in (parse_pool, image_pool, audio_pool):
+            if pool: pool.shutdown(wait=True)
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    return {"stages": stats, "completed_manuals": completed_manuals, "failed_manuals": failed_manuals, "unchanged_manuals": unchanged_manuals,
+            "elapsed_seconds": elapsed, "manuals_per_minute": completed_manuals / elapsed * 60 if elapsed > 0 else 0.0}
+
+def print_batch_report(report):
+    print(f"\n===== Batch Processing Complete =====")
+    print(f"Manuals completed: {report['completed_manuals']}, unchanged: {report['unchanged_manuals']}, failed: {report['failed_manuals']}")
+    print(f"Wall time: {report['elapsed_seconds']:.1f}s, throughput: {report['manuals_per_minute']:.2f} manuals/min")
+    for stage, stage_stats in report["stages"].items():
+        runs = stage_stats["done"] + stage_stats["failed"]
+        average = stage_stats["busy_seconds"] / runs if runs else 0.0
+        print(f"  {stage:<7} done={stage_stats['done']:<4} failed={stage_stats['failed']:<4} busy={stage_stats['busy_seconds']:.1f}s avg={average:.1f}s")
+
+def main(limit, parse_workers=PARSE_WORKERS, image_workers=IMAGE_WORKERS, audio_workers=AUDIO_WORKERS):
+    """Finds PDFs and processes them through the pipelined batch engine."""
     source_pattern = os.path.join(MANUALS_SOURCE_DIR, FILE_PATTERN)
     pdf_files = glob.glob(source_pattern)
 
@@ -38,60 +146,24 @@ def main(limit):
 
     print(f"Found {len(pdf_files)} files matching pattern.")
     files_to_process = pdf_files[:limit]
-    print(f"Processing the first {len(files_to_process)} files...")
-
-    processed_count = 0
-    error_count = 0
-    skipped_count = 0 # Count skipped due to already existing
+    print(f"Processing the first {len(files_to_process)} files (parse={parse_workers}, images={image_workers}, audio={audio_workers} workers)...")
 
     # Ensure database exists before starting batch
     if not os.path.exists(CONVERT_DB_FILE):
          print(f"Error: Database file '{CONVERT_DB_FILE}' not found. Please run setup_database.py first.")
          return
 
-    for pdf_path in files_to_process:
-        print(f"\n===== Processing: {os.path.basename(pdf_path)} =====")
-        manual_id = None
-        try:
-            # 1. Convert PDF to DB entry
-            # process_single_manual returns the manual_id (new or existing) or None on failure
-            manual_id = process_single_manual(pdf_path, CONVERT_DB_FILE)
-
-            if manual_id is not None:
-                # Manual was newly inserted or already existed and ID was returned
-                # 2. Generate Images for this manual_id
-                print(f"\n--- Generating images for manual_id: {manual_id} ---")
-                # Call the refactored image generation function using correct arg name
-                process_images_for_manual(IMG_DB_FILE, IMG_OUT_DIR, manual_id_filter=manual_id)
-
-                # 3. Generate Audio for this manual_id
-                print(f"\n--- Generating audio for manual_id: {manual_id} ---")
-                process_audio_for_manual(AUDIO_DB_FILE, AUDIO_OUT_DIR, manual_id_filter=manual_id)
-
-                # Increment count only if it was newly processed (not just assets for existing)
-                # We need process_single_manual to better indicate if it was new vs existing skip
-                # For now, let's assume if manual_id is returned, it's "processed" in some way
-                processed_count += 1
-            else:
-                # This case means process_single_manual failed (returned None)
-                print(f"Skipping asset generation for {pdf_path} due to conversion/parsing failure.")
-                error_count += 1
-
-        except Exception as e:
-            print(f"!! Unexpected error processing {pdf_path}: {e}")
-            error_count += 1
-
-    print(f"\n===== Batch Processing Complete =====")
-    print(f"Manuals processed (conversion attempted/assets generated): {processed_count}")
-    print(f"Errors encountered during processing: {error_count}")
-    # Note: The logic doesn't explicitly track skipped-due-to-existing anymore,
-    # as process_single_manual now returns the existing ID.
+    report = run_batch(files_to_process, CONVERT_DB_FILE, parse_workers, image_workers, audio_workers)
+    if report: print_batch_report(report)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description=f"Batch process PDF manuals from {MANUALS_SOURCE_DIR}.")
-    parser.add_argument("-n", "--limit", type=int, default=MAX_FILES_TO_PROCESS,
+    parser.add_argument("-n", "--limit", type=positive_int, default=MAX_FILES_TO_PROCESS,
                         help=f"Maximum number of PDF files to process (default: {MAX_FILES_TO_PROCESS}).")
+    parser.add_argument("--parse-workers", type=positive_int, default=PARSE_WORKERS, help=f"Concurrent manual parses (default: {PARSE_WORKERS}).")
+    parser.add_argument("--image-workers", type=non_negative_int, default=IMAGE_WORKERS, help=f"Manuals generating images concurrently, 0 disables (default: {IMAGE_WORKERS}).")
+    parser.add_argument("--audio-workers", type=non_negative_int, default=AUDIO_WORKERS, help=f"Manuals generating audio concurrently, 0 disables (default: {AUDIO_WORKERS}).")
     args = parser.parse_args()
 
-    main(limit=args.limit)
\ No newline at end of file
+    main(limit=args.limit, parse_workers=args.parse_workers, image_workers=args.image_workers, audio_workers=args.audio_workers)
\ No newline at end of file
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+# Persistent answer cache for /api/qa, stored in its own SQLite file.
+# Entries are keyed by the normalized question, the knowledge version they were
+# answered against and the QA scope (all manuals, one manual or one tab).
+# Near-duplicate questions can be matched by Jaccard similarity of word shingles.
+
+# --- Configuration ---
+DEFAULT_CACHE_FILE = 'qa_cache.db'
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_SIMILARITY_THRESHOLD = 0.8 # Jaccard similarity for near-duplicate hits (None disables)
+NEAR_DUPLICATE_CANDIDATES = 500 # Most recently used entries compared per lookup
+# --- End Configuration ---
+
+STOPWORDS = frozenset("a an the is are do does i my me to of for on in it how can what please".split())
+
+def normalize_question(question):
+    """Lowercases, strips punctuation and collapses whitespace. Non-string input normalizes to ""."""
+    if not isinstance(question, str): return ""
+    return " ".join(re.findall(r"\w+", question.lower()))
+
+def question_shingles(normalized):
+    """Content words plus word bigrams of a normalized question."""
+    words = [w for w in normalized.split() if w not in STOPWORDS] or normalized.split()
+    return set(words) | {f"{a}_{b}" for a, b in zip(words, words[1:])}
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+class AnswerCache:
+    """Thread-safe, size- and age-bounded answer cache persisted in SQLite."""
+
+    def __init__(self, db_file=DEFAULT_CACHE_FILE, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "near_hits": 0, "misses": 0, "stores": 0}
+        self._conn = sqlite3.connect(db_file, check_same_thread=False) # Guarded by self._lock
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS qa_answers (
+                cache_key TEXT PRIMARY KEY, -- SHA-256 of scope, version and normalized question
+                scope TEXT NOT NULL, -- 'all', 'manual:<id>' or 'manual:<id>/<tab_key>'
+                knowledge_version TEXT NOT NULL,
+                question TEXT NOT NULL, -- Normalized question
+                shingles TEXT NOT NULL, -- Space-separated, for near-duplicate matching
+                answer TEXT NOT NULL,
+                sources TEXT, -- JSON array
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_qa_answers_scope ON qa_answers (scope, knowledge_version, last_used_at);
+            CREATE INDEX IF NOT EXISTS idx_qa_answers_last_used ON qa_answers (last_used_at);
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def _key(scope, version, normalized):
+        return hashlib.sha256(f"{scope}\x00{version}\x00{normalized}".encode('utf-8')).hexdigest()
+
+    def _purge_stale(self, scope, version, now):
+        """Drops entries answered against another version of this scope, and expired entries."""
+        self._conn.execute("DELETE FROM qa_answers WHERE scope = ? AND knowledge_version != ?", (scope, version))
+        self._conn.execute("DELETE FROM qa_answers WHERE created_at < ?", (now - self.ttl_seconds,))
+
+    def get(self, question, version, scope='all'):
+        """Returns {"answer", "sources", "near_duplicate"} for a cached answer, or None."""
+        normalized = normalize_question(question)
+        if not normalized: return None # Nothing to key on (non-string or punctuation only)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT cache_key, answer, sources, created_at FROM qa_answers WHERE cache_key = ?",
+                                     (self._key(scope, version, normalized),)).fetchone()
+            near_duplicate = False
+            if row is None and self.similarity_threshold is not None:
+                shingles = question_shingles(normalized)
+                candidates = self._conn.execute("""
+                    SELECT cache_key, answer, sources, created_at, shingles FROM qa_answers
+                    WHERE scope = ? AND knowledge_version = ? ORDER BY last_used_at DESC LIMIT ?
+                """, (scope, version, NEAR_DUPLICATE_CANDIDATES)).fetchall()
+                best, best_score = None, self.similarity_threshold
+                for candidate in candidates:
+                    score = _jaccard(shingles, set(candidate[4].split()))
+                    if score >= best_score: best, best_score = candidate[:4], score
+                row, near_duplicate = best, best is not None
+
+            if row is None or row[3] < now - self.ttl_seconds:
+                self._stats["misses"] += 1
+                self._purge_stale(scope, version, now)
+                self._conn.commit()
+                return None
+
+            self._conn.execute("UPDATE qa_answers SET last_used_at = ?, hits = hits + 1 WHERE cache_key = ?", (now, row[0]))
+            self._conn.commit()
+            self._stats["near_hits" if near_duplicate else "hits"] += 1
+        return {"answer": row[1], "sources": json.loads(row[2]) if row[2] else [], "near_duplicate": near_duplicate}
+
+    def put(self, question, version, scope, answer, sources=None):
+        """Stores an answer, evicting the least recently used entries beyond max_entries."""
+        normalized = normalize_question(question)
+        if not normalized: return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO qa_answers
+                    (cache_key, scope, knowledge_version, question, shingles, answer, sources, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (self._key(scope, version, normalized), scope, version, normalized,
+                  " ".join(sorted(question_shingles(normalized))), answer, json.dumps(sources or []), now, now))
+            self._conn.execute("""
+                DELETE FROM qa_answers WHERE cache_key IN (
+                    SELECT cache_key FROM qa_answers ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)
+            """, (self.max_entries,))
+            self._conn.commit()
+            self._stats["stores"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM qa_answers").fetchone()[0]
+        return stats
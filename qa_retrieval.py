@@ -0,0 +1,155 @@
+import math
+import re
+import threading
+from collections import Counter, namedtuple
+
+# Retrieval stage for QA: splits manuals into step / list item / text chunks,
+# ranks them against the question with BM25 and packs the best ones into a
+# prompt context that stays within a token budget.
+
+# --- Configuration ---
+DEFAULT_TOP_K = 40
+DEFAULT_TOKEN_BUDGET = 8000 # Approximate prompt tokens spent on retrieved chunks
+CHARS_PER_TOKEN = 4 # Rough estimate used for budgeting
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60 # Reciprocal rank fusion constant
+# --- End Configuration ---
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i if in is it its me my of on or so that the
+then this to was what when where which who why will with you your
+""".split())
+
+Chunk = namedtuple("Chunk", ["manual_id", "manual_title", "tab_key", "tab_title", "item_id", "kind", "text", "position"])
+Chunk.__doc__ = """A retrievable unit of manual content; `position` orders chunks within their manual."""
+
+def tokenize(text):
+    """Lowercases and splits text into word tokens, dropping stopwords."""
+    return [t for t in re.findall(r"\w+", text.lower()) if t not in STOPWORDS]
+
+def iter_chunks(manuals):
+    """Yields the step, list item, text, warning/note and feature chunks of assembled manuals."""
+    for manual in manuals:
+        manual_id, manual_title = manual.get('manual_id'), manual.get('title') or ''
+        position = 0
+        features = [f for f in (manual.get('features') or []) + (manual.get('special_features') or []) if isinstance(f, str)]
+        if features:
+            yield Chunk(manual_id, manual_title, None, "Features", "features", "feature", "; ".join(features), position)
+            position += 1
+        for tab in manual.get('tabs', []):
+            tab_key, tab_title, content = tab.get('tab_key') or tab.get('id'), tab.get('title', ''), tab.get('content')
+            content_type = tab.get('content_type')
+            if content_type == 'steps' and isinstance(content, dict):
+                pieces = []
+                if content.get('warning'): pieces.append((f"{tab_key}_warning", 'warning', content['warning']))
+                pieces += [(step['id'], 'step', step['text']) for step in content.get('steps', [])]
+                if content.get('note'): pieces.append((f"{tab_key}_note", 'note', content['note']))
+            elif content_type == 'list' and isinstance(content, list):
+                pieces = [(item['id'], 'item', item['text']) for item in content]
+            elif content_type == 'text' and isinstance(content, str) and content:
+                pieces = [(f"{tab_key}_main", 'text', content)]
+            else:
+                pieces = []
+            for item_id, kind, text in pieces:
+                yield Chunk(manual_id, manual_title, tab_key, tab_title, item_id, kind, text, position)
+                position += 1
+
+class Bm25Index:
+    """An in-memory BM25 index over chunks. Manual and tab titles are indexed with each chunk."""
+
+    def __init__(self, chunks, k1=BM25_K1, b=BM25_B):
+        self.chunks = list(chunks)
+        self.k1, self.b = k1, b
+        self._postings = {} # term -> [(chunk_index, term_frequency)]
+        self._lengths = []
+        for i, chunk in enumerate(self.chunks):
+            terms = Counter(tokenize(f"{chunk.manual_title} {chunk.tab_title} {chunk.text}"))
+            self._lengths.append(sum(terms.values()))
+            for term, tf in terms.items(): self._postings.setdefault(term, []).append((i, tf))
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+    def search(self, query, top_k=DEFAULT_TOP_K, manual_id=None):
+        """Returns up to top_k (score, chunk) pairs, best first."""
+        n = len(self.chunks)
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings: continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, tf in postings:
+                norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[i] / self._avg_length)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self.k1 + 1) / norm
+        if manual_id is not None:
+            scores = {i: s for i, s in scores.items() if self.chunks[i].manual_id == manual_id}
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        return [(score, self.chunks[i]) for i, score in best]
+
+def fuse_rankings(*rankings, k=RRF_K):
+    """Merges several (score, chunk) rankings with reciprocal rank fusion, keyed by manual and item id."""
+    scores, chunks = {}, {}
+    for ranking in rankings:
+        for rank, (_, chunk) in enumerate(ranking):
+            key = (chunk.manual_id, chunk.item_id)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            chunks.setdefault(key, chunk)
+    return [(score, chunks[key]) for key, score in sorted(scores.items(), key=lambda item: -item[1])]
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def format_chunk(chunk):
+    """Renders a chunk as one line of prompt context."""
+    where = f"{chunk.tab_title} / {chunk.item_id}" if chunk.tab_key else chunk.tab_title
+    return f"[Manual {chunk.manual_id}: {chunk.manual_title} | {where}] {chunk.text}"
+
+def build_context(ranked, token_budget=DEFAULT_TOKEN_BUDGET):
+    """Packs the best-ranked chunks into prompt text without exceeding token_budget.
+
+    Returns (context_text, selected_chunks). Selected chunks are printed in
+    document order so steps read naturally.
+    """
+    selected, used = [], 0
+    for _, chunk in ranked:
+        cost = estimate_tokens(format_chunk(chunk))
+        if used + cost > token_budget: continue
+        selected.append(chunk)
+        used += cost
+    selected.sort(key=lambda c: (c.manual_id, c.position))
+    return "\n".join(format_chunk(c) for c in selected), selected
+
+def format_catalog(manuals, token_budget=None, first_ids=()):
+    """A short list of manual titles, so questions about the catalog itself can be answered.
+
+    With a token_budget the list stops once the budget is spent (noting how many were left out);
+    manuals in first_ids (e.g. those behind the selected chunks) are listed first.
+    """
+    first_ids = set(first_ids)
+    ordered = [m for m in manuals if m.get('manual_id') in first_ids] + [m for m in manuals if m.get('manual_id') not in first_ids]
+    lines, used = [], 0
+    for m in ordered:
+        line = f"- Manual {m.get('manual_id')}: {m.get('title', '')}"
+        if token_budget is not None and used + estimate_tokens(line) > token_budget: break
+        lines.append(line)
+        used += estimate_tokens(line)
+    if len(lines) < len(ordered): lines.append(f"- ... and {len(ordered) - len(lines)} more manuals")
+    return "\n".join(lines)
+
+def chunk_sources(chunks):
+    """Compact source references for API responses."""
+    return [{"manual_id": c.manual_id, "tab_key": c.tab_key, "item_id": c.item_id} for c in chunks]
+
+_index_lock = threading.Lock()
+_index_cache = {} # snapshot version -> Bm25Index (only the latest is kept)
+
+def index_for_snapshot(snapshot):
+    """Returns the BM25 index for a knowledge base snapshot, building it once per version."""
+    index = _index_cache.get(snapshot.version)
+    if index is not None: return index
+    with _index_lock:
+        index = _index_cache.get(snapshot.version)
+        if index is None:
+            index = Bm25Index(iter_chunks(snapshot.manuals))
+            _index_cache.clear()
+            _index_cache[snapshot.version] = index
+    return index
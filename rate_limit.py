@@ -0,0 +1,126 @@
+import argparse
+import random
+import threading
+import time
+
+# Shared helpers for calling quota-limited Google APIs from worker pools:
+# a blocking token-bucket rate limiter, retries with jittered exponential
+# backoff for quota/transient errors, and a thread-safe progress reporter.
+
+# --- Configuration ---
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY_SECONDS = 1.0
+DEFAULT_MAX_DELAY_SECONDS = 60.0
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# --- End Configuration ---
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0: raise ValueError(f"rate must be positive, got {rate}")
+        if capacity is not None and capacity <= 0: raise ValueError(f"capacity must be positive, got {capacity}")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute, burst=None):
+        return cls(requests_per_minute / 60.0, burst)
+
+    def acquire(self, tokens=1.0):
+        """Blocks until `tokens` are available and takes them. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+def _int_at_least(value, minimum):
+    try: number = int(value)
+    except ValueError: raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < minimum: raise argparse.ArgumentTypeError(f"must be at least {minimum}, got {number}")
+    return number
+
+def positive_int(value):
+    """argparse type for counts and rates that must be at least 1 (e.g. --rpm, concurrency)."""
+    return _int_at_least(value, 1)
+
+def non_negative_int(value):
+    """argparse type for counts where 0 means disabled (e.g. a batch stage's workers)."""
+    return _int_at_least(value, 0)
+
+def is_retryable_error(error):
+    """True for quota (429) and transient server/network errors from Google API clients."""
+    try:
+        from google.api_core import exceptions as gexc
+        if isinstance(error, (gexc.TooManyRequests, gexc.ResourceExhausted, gexc.ServiceUnavailable,
+                              gexc.DeadlineExceeded, gexc.InternalServerError, gexc.BadGateway,
+                              gexc.GatewayTimeout, gexc.Aborted)):
+            return True
+    except ImportError:
+        pass
+    code = getattr(error, 'code', None)
+    code = code() if callable(code) else code
+    if isinstance(code, int) and code in RETRYABLE_STATUS_CODES: return True
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+def backoff_delay(attempt, base_delay=DEFAULT_BASE_DELAY_SECONDS, max_delay=DEFAULT_MAX_DELAY_SECONDS):
+    """'Full jitter' exponential backoff: uniform in [0, min(max_delay, base * 2^attempt)]."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+def call_with_retries(fn, *args, rate_limiter=None, max_retries=DEFAULT_MAX_RETRIES, base_delay=DEFAULT_BASE_DELAY_SECONDS,
+                      max_delay=DEFAULT_MAX_DELAY_SECONDS, is_retryable=is_retryable_error, label="request", **kwargs):
+    """Calls fn (after taking a rate-limiter token), retrying retryable errors with jittered backoff.
+
+    Non-retryable errors, and the last error once retries are exhausted, are re-raised.
+    """
+    attempt = 0
+    while True:
+        if rate_limiter is not None: rate_limiter.acquire()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e): raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            print(f"Retryable error for {label} (attempt {attempt + 1}/{max_retries}): {e}. Retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+class ProgressReporter:
+    """Thread-safe progress counter that periodically prints completion and throughput."""
+
+    def __init__(self, total, label="items", every_seconds=5.0):
+        self.total = total
+        self.label = label
+        self.every_seconds = every_seconds
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self._start = time.monotonic()
+        self._last_print = self._start
+        self._lock = threading.Lock()
+
+    def record(self, outcome):
+        """Records one item: outcome is 'succeeded', 'failed' or 'skipped'."""
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            now = time.monotonic()
+            finished = self.succeeded + self.failed + self.skipped
+            if now - self._last_print >= self.every_seconds or finished == self.total:
+                self._last_print = now
+                print(f"Progress: {finished}/{self.total} {self.label} ({self.summary()})")
+
+    def summary(self):
+        elapsed = time.monotonic() - self._start
+        rate = self.succeeded / elapsed if elapsed > 0 else 0.0
+        return f"{self.succeeded} ok, {self.failed} failed, {self.skipped} skipped, {elapsed:.1f}s, {rate:.2f}/s"
@@ -0,0 +1,116 @@
+import argparse
+import html
+import os
+import re
+import sqlite3
+
+# Full-text search over manual content using the SQLite FTS5 table `manual_search`.
+# One row per searchable unit (title, feature, step, list item, text tab), carrying
+# the IDs the frontend uses. The index is refreshed explicitly by insert_manual_data.
+
+# --- Configuration ---
+DATABASE_FILE = 'manuals.db'
+DEFAULT_RESULT_LIMIT = 20
+SNIPPET_TOKENS = 16
+# --- End Configuration ---
+
+# Placeholders FTS5 puts around matches; replaced by <mark> tags after the text is HTML-escaped
+_MATCH_START, _MATCH_END = '\ue000', '\ue001'
+
+# Rows to index, one SELECT per source; {where} restricts the manuals
+_INDEX_SOURCES = [
+    "SELECT m.manual_id, NULL, NULL, 'title', m.title FROM manuals m{where}",
+    """SELECT m.manual_id, NULL, NULL, 'feature', j.value FROM manuals m, json_each(m.features) j
+       WHERE json_valid(m.features) AND j.type = 'text'{and_where}""",
+    """SELECT m.manual_id, NULL, NULL, 'special_feature', j.value FROM manuals m, json_each(m.special_features) j
+       WHERE json_valid(m.special_features) AND j.type = 'text'{and_where}""",
+    """SELECT t.manual_id, t.tab_key, t.tab_key || '_step_' || printf('%02d', s.step_order), 'step', s.text
+       FROM tab_content_steps s JOIN tabs t ON t.tab_id = s.tab_id{t_where}""",
+    """SELECT t.manual_id, t.tab_key, t.tab_key || '_item_' || printf('%02d', l.item_order), 'item', l.text
+       FROM tab_content_list l JOIN tabs t ON t.tab_id = l.tab_id{t_where}""",
+    """SELECT t.manual_id, t.tab_key, t.tab_key || '_main', 'text', x.text
+       FROM tab_content_text x JOIN tabs t ON t.tab_id = x.tab_id{t_where}""",
+]
+
+def index_manuals(conn, manual_ids=None):
+    """Rebuilds the search rows for the given manuals (or all). Does not commit."""
+    if manual_ids is not None:
+        manual_ids = list(manual_ids)
+        if not manual_ids: return
+        marks = ", ".join("?" for _ in manual_ids)
+        conn.execute(f"DELETE FROM manual_search WHERE manual_id IN ({marks})", manual_ids)
+        clauses = {"where": f" WHERE m.manual_id IN ({marks})", "and_where": f" AND m.manual_id IN ({marks})",
+                   "t_where": f" WHERE t.manual_id IN ({marks})"}
+        params = manual_ids
+    else:
+        conn.execute("DELETE FROM manual_search")
+        clauses = {"where": "", "and_where": "", "t_where": ""}
+        params = []
+
+    for source in _INDEX_SOURCES:
+        conn.execute("INSERT INTO manual_search (manual_id, tab_key, item_id, kind, text) " + source.format(**clauses), params)
+
+def build_match_query(query, match_all=True):
+    """Turns free text into a safe FTS5 MATCH expression (quoted terms, last term as prefix)."""
+    terms = re.findall(r"\w+", query.lower())
+    if not terms: return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*' # Match partially typed last word
+    return (" " if match_all else " OR ").join(quoted)
+
+def snippet_html(snippet):
+    """Snippet as safe HTML: the manual text escaped, matches wrapped in <mark>."""
+    return html.escape(snippet or "").replace(_MATCH_START, '<mark>').replace(_MATCH_END, '</mark>')
+
+def search(conn, query, limit=DEFAULT_RESULT_LIMIT, manual_id=None):
+    """Returns ranked hits for `query`, best first.
+
+    Tries to match all terms first and falls back to any term if nothing matches.
+    Snippets are HTML: escaped text with the matches in <mark> tags.
+    """
+    results = []
+    for match_all in (True, False):
+        match = build_match_query(query, match_all)
+        if match is None: return []
+        sql = f"""
+            SELECT s.manual_id, m.title AS manual_title, s.tab_key, s.item_id, s.kind,
+                   snippet(manual_search, 0, '{_MATCH_START}', '{_MATCH_END}', '…', {SNIPPET_TOKENS}) AS snippet,
+                   -bm25(manual_search) AS score -- Higher is better
+            FROM manual_search s JOIN manuals m ON m.manual_id = s.manual_id
+            WHERE manual_search MATCH ?
+        """
+        params = [match]
+        if manual_id is not None:
+            sql += " AND s.manual_id = ?"
+            params.append(manual_id)
+        sql += " ORDER BY score DESC LIMIT ?"
+        params.append(limit)
+        rows = conn.execute(sql, params).fetchall()
+        results = [{"manual_id": r[0], "manual_title": r[1], "tab_key": r[2], "item_id": r[3],
+                    "kind": r[4], "snippet": snippet_html(r[5]), "score": r[6]} for r in rows]
+        if results or len(re.findall(r"\w+", query)) < 2: break
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild the full-text search index, or run a query against it.")
+    parser.add_argument("-q", "--query", help="Optional: Search the index instead of rebuilding it.")
+    args = parser.parse_args()
+
+    if not os.path.exists(DATABASE_FILE):
+        print(f"Error: Database file '{DATABASE_FILE}' not found.")
+    else:
+        conn = sqlite3.connect(DATABASE_FILE)
+        try:
+            if args.query:
+                for hit in search(conn, args.query):
+                    print(f"[{hit['score']:.2f}] manual {hit['manual_id']} {hit['item_id'] or hit['kind']}: {hit['snippet']}")
+            else:
+                index_manuals(conn)
+                conn.commit()
+                count = conn.execute("SELECT COUNT(*) FROM manual_search").fetchone()[0]
+                print(f"Search index rebuilt ({count} rows).")
+        except sqlite3.Error as e:
+            print(f"Database error: {e} (run setup_database.py first?)")
+        finally:
+            conn.close()
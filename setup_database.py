@@ -22,6 +22,13 @@ def execute_sql(conn, sql_statement):
     except sqlite3.Error as e:
         print(f"Error executing SQL: {e}\nStatement: {sql_statement}")
 
+def add_column_if_missing(conn, table, column, definition):
+    """ Add a column to an existing table (for databases created before the column existed) """
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        execute_sql(conn, f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        print(f"Added column {table}.{column}")
+
 def setup_database(conn):
     """ Create tables in the SQLite database """
     print("Setting up database tables...")
@@ -31,6 +38,7 @@ def setup_database(conn):
         manual_id INTEGER PRIMARY KEY AUTOINCREMENT,
         title TEXT NOT NULL,
         source_path TEXT UNIQUE NOT NULL,
+        source_hash TEXT, -- SHA-256 of the source file; unchanged files are not re-parsed
         language TEXT DEFAULT 'en',
         features TEXT, -- Store as JSON array string
         special_features TEXT, -- Store as JSON array string
@@ -91,6 +99,50 @@ def setup_database(conn):
     );
     """
 
+    # Pre-serialized manual JSON served by the API (maintained by manual_documents.py)
+    sql_create_manual_documents_table = """
+    CREATE TABLE IF NOT EXISTS manual_documents (
+        manual_id INTEGER PRIMARY KEY,
+        content_version TEXT NOT NULL, -- SHA-256 of the serialized document
+        document TEXT NOT NULL, -- Compact JSON, same shape as /api/manuals/<id>
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (manual_id) REFERENCES manuals (manual_id) ON DELETE CASCADE
+    );
+    """
+
+    # Full-text index over titles, features, steps, list items and text tabs (maintained by search_index.py)
+    sql_create_search_table = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS manual_search USING fts5(
+        text,
+        manual_id UNINDEXED,
+        tab_key UNINDEXED,
+        item_id UNINDEXED, -- e.g., 'hardwareInstallation_step_00' (NULL for titles/features)
+        kind UNINDEXED, -- 'title', 'feature', 'special_feature', 'step', 'item' or 'text'
+        tokenize = 'porter unicode61'
+    );
+    """
+
+    # Generated media per manual item (maintained by the generators via manual_assets.py)
+    sql_create_assets_table = """
+    CREATE TABLE IF NOT EXISTS assets (
+        asset_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        manual_id INTEGER NOT NULL,
+        item_id TEXT NOT NULL, -- e.g., 'hardwareInstallation_step_00', 'overview_main'
+        kind TEXT NOT NULL CHECK(kind IN ('image', 'audio')),
+        path TEXT NOT NULL, -- URL path under the frontend's public dir, e.g., '/manual_audio/blobs/<hash>.ogg'
+        mime TEXT,
+        content_hash TEXT NOT NULL, -- SHA-256 of the file
+        source_text_hash TEXT NOT NULL, -- Hash of the text/prompt (and voice) it was generated from; detects stale assets
+        size INTEGER NOT NULL,
+        generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (manual_id, item_id, kind),
+        FOREIGN KEY (manual_id) REFERENCES manuals (manual_id) ON DELETE CASCADE
+    );
+    """
+
+    # WAL lets the API keep reading while manuals are being inserted (setting persists in the file)
+    execute_sql(conn, "PRAGMA journal_mode=WAL")
+
     # Execute table creation
     execute_sql(conn, sql_create_manuals_table)
     execute_sql(conn, sql_create_tabs_table)
@@ -100,6 +152,12 @@ def setup_database(conn):
     execute_sql(conn, sql_create_tab_content_steps_table)
     execute_sql(conn, sql_create_steps_index)
     execute_sql(conn, sql_create_tab_content_text_table)
+    execute_sql(conn, sql_create_manual_documents_table)
+    execute_sql(conn, sql_create_search_table)
+    execute_sql(conn, sql_create_assets_table)
+
+    # Migrations for databases created by earlier versions
+    add_column_if_missing(conn, "manuals", "source_hash", "TEXT")
 
     print("Database tables checked/created.")
 
@@ -49,19 +49,46 @@ function ManualListPage() {
         return manuals.filter(manual => manual.title.toLowerCase().includes(searchTerm.toLowerCase()));
     }, [manuals, searchTerm]);
 
+    // Parses one Server-Sent Event block ("event: ...\ndata: ...") into its name and JSON payload
+    const parseSseEvent = (block: string): { event: string; data: { text?: string; error?: string } } | null => {
+        let event = 'message'; const dataLines: string[] = [];
+        for (const line of block.split('\n')) {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+        }
+        if (dataLines.length === 0) return null;
+        try { return { event, data: JSON.parse(dataLines.join('\n')) }; } catch { return null; }
+    };
+
     const handleQaSubmit = async (event: React.FormEvent) => {
         event.preventDefault(); if (!qaQuestion.trim()) return;
         setIsQaLoading(true); setQaError(null); setQaAnswer(null);
         try {
-            const response = await fetch(`${API_BASE_URL}/api/qa`, {
-                method: 'POST', headers: { 'Content-Type': 'application/json' },
+            const response = await fetch(`${API_BASE_URL}/api/qa/stream`, {
+                method: 'POST', headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
                 body: JSON.stringify({ question: qaQuestion }),
             });
-            if (!response.ok) {
+            if (!response.ok || !response.body) {
                 const errorData = await response.json().catch(() => ({}));
                 throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
             }
-            const data = await response.json(); setQaAnswer(data.answer);
+            // Render the answer as tokens arrive
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = ''; let answer = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let boundary: number;
+                while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                    const sseEvent = parseSseEvent(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+                    if (!sseEvent) continue;
+                    if (sseEvent.event === 'token') { answer += sseEvent.data.text ?? ''; setQaAnswer(answer); setIsQaLoading(false); }
+                    else if (sseEvent.event === 'error') throw new Error(sseEvent.data.error || 'Failed to get answer');
+                }
+            }
         } catch (e) {
             console.error("Failed to get QA answer:", e);
             setQaError(e instanceof Error ? e.message : "An unknown error occurred");
@@ -28,6 +28,14 @@ interface TabInfo {
   content_type: 'list' | 'steps' | 'text';
   content: ListItemData[] | StepContentData | string;
 }
+interface AssetInfo {
+  url: string;
+  mime?: string;
+}
+interface ItemAssets {
+  image?: AssetInfo;
+  audio?: AssetInfo;
+}
 interface ManualData {
   manual_id: number;
   title: string;
@@ -35,13 +43,46 @@ interface ManualData {
   features?: string[];
   special_features?: string[];
   tabs: TabInfo[];
+  assets?: Record<string, ItemAssets>; // Generated media by item ID (only recorded files are listed)
 }
 // --- End Interfaces ---
 
 // --- API Configuration ---
 const API_BASE_URL = 'http://localhost:5001';
+const IMAGE_DERIVATIVES_URL = '/manual_images/derivatives.json';
+const STEP_IMAGE_SIZES = '(max-width: 800px) 100vw, 50vw'; // Image half of the split layout
 // --- End API Configuration ---
 
+// --- Image derivatives (responsive WebP/AVIF variants per source image), fetched once per page load ---
+interface ImageVariant {
+  format: 'webp' | 'avif';
+  mime: string;
+  width: number;
+  url: string;
+}
+interface ImageDerivatives {
+  width: number;
+  height: number;
+  variants: ImageVariant[];
+}
+let imageDerivativesPromise: Promise<Record<string, ImageDerivatives>> | null = null;
+function loadImageDerivatives(): Promise<Record<string, ImageDerivatives>> {
+  if (!imageDerivativesPromise) {
+    imageDerivativesPromise = fetch(IMAGE_DERIVATIVES_URL)
+      .then(response => (response.ok ? response.json() : { images: {} }))
+      .then(manifest => manifest.images ?? {})
+      .catch(err => { console.warn("Image derivatives unavailable:", err); return {}; });
+  }
+  return imageDerivativesPromise;
+}
+// One <source> per format (smallest format first), each with a width-based srcset
+function imageSources(derivatives: ImageDerivatives | undefined) {
+  if (!derivatives) return [];
+  return ['avif', 'webp'].map(format => derivatives.variants.filter(v => v.format === format))
+    .filter(variants => variants.length > 0)
+    .map(variants => ({ type: variants[0].mime, srcSet: variants.map(v => `${v.url} ${v.width}w`).join(', ') }));
+}
+
 
 function ManualViewerPage() {
   const { manualId } = useParams<{ manualId: string }>();
@@ -52,6 +93,7 @@ function ManualViewerPage() {
   const [currentSubStepIndex, setCurrentSubStepIndex] = useState(0);
   const [imageError, setImageError] = useState(false);
   const [isAudioEnabled, setIsAudioEnabled] = useState(true);
+  const [imageDerivatives, setImageDerivatives] = useState<Record<string, ImageDerivatives>>({});
   const audioRef = useRef<HTMLAudioElement>(null);
 
   // --- Data Fetching ---
@@ -78,6 +120,8 @@ function ManualViewerPage() {
     fetchManualData(parseInt(manualId, 10));
   }, [manualId]);
 
+  useEffect(() => { loadImageDerivatives().then(setImageDerivatives); }, []);
+
   // Reset image error state
   useEffect(() => { setImageError(false); }, [activeTabIndex, currentSubStepIndex]);
 
@@ -92,24 +136,27 @@ function ManualViewerPage() {
     }
 
     const currentTab = manualData.tabs[activeTabIndex];
-    let audioFilename: string | null = null; // Filename part based on ID
+    let audioItemId: string | null = null; // Item ID the audio was generated for
 
     if (currentTab.content_type === 'steps') {
         const stepsContent = currentTab.content as StepContentData;
         if (stepsContent.steps && currentSubStepIndex < stepsContent.steps.length) {
-            audioFilename = `${stepsContent.steps[currentSubStepIndex].id}.wav`; // Use step ID
+            audioItemId = stepsContent.steps[currentSubStepIndex].id; // Use step ID
         }
     } else if (currentTab.content_type === 'text') {
-       audioFilename = `${currentTab.tab_key}_main.wav`;
+       audioItemId = `${currentTab.tab_key}_main`;
     } else if (currentTab.content_type === 'list') {
         const listContent = currentTab.content as ListItemData[];
         if (listContent && listContent.length > 0 && currentSubStepIndex === 0) {
-            audioFilename = `${listContent[0].id}.wav`; // Use first item's ID
+            audioItemId = listContent[0].id; // Use first item's ID
         }
     }
 
-    // Construct full path including manual_id
-    const audioPath = audioFilename ? `/manual_audio/manual_${manualData.manual_id}_${audioFilename}` : null;
+    // The manual document lists the item's audio (URL and MIME type) if it has been generated;
+    // items without an asset row (database not backfilled yet) fall back to the legacy WAV path
+    const audioEntry = audioItemId ? manualData.assets?.[audioItemId]?.audio : undefined;
+    if (audioEntry?.mime && !audioEl.canPlayType(audioEntry.mime)) console.warn(`Browser may not support ${audioEntry.mime} audio.`);
+    const audioPath = audioEntry?.url ?? (audioItemId ? `/manual_audio/manual_${manualData.manual_id}_${audioItemId}.wav` : null);
 
     const currentSrc = audioEl.currentSrc || audioEl.src;
     const newSrc = audioPath ? `${window.location.origin}${audioPath}` : null;
@@ -159,7 +206,10 @@ function ManualViewerPage() {
         if (!stepContent.steps || currentSubStepIndex >= stepContent.steps.length) return <div>Invalid step index.</div>;
         const currentStep = stepContent.steps[currentSubStepIndex];
         // Construct image path including manual_id
-        const imagePath = `/manual_images/manual_${manualData.manual_id}_${currentStep.id}.png`;
+        const imageKey = `manual_${manualData.manual_id}_${currentStep.id}`;
+        // Listed once generated; items without an asset row (database not backfilled yet) fall back to the legacy path
+        const imagePath = manualData.assets?.[currentStep.id]?.image?.url ?? `/manual_images/${imageKey}.png`;
+        const derivatives = imageDerivatives[imageKey];
         const isEvenStep = currentSubStepIndex % 2 === 0;
         const layoutClass = isEvenStep ? 'layout-image-right' : 'layout-image-left';
         const animationKey = `${activeTabIndex}-${currentSubStepIndex}`;
@@ -169,7 +219,11 @@ function ManualViewerPage() {
             <div className={`split-layout ${layoutClass}`}>
               <div className="text-half"><p><span>{currentSubStepIndex + 1}.</span> {currentStep.text}</p></div>
               <div className="image-half">
-                {!imageError ? (<img key={imagePath} src={imagePath} alt={`Illustration for ${tabKey} step ${currentSubStepIndex + 1}`} className="step-image" onError={handleImageError}/>)
+                {imagePath && !imageError ? (
+                  <picture key={imagePath}>
+                    {imageSources(derivatives).map(source => <source key={source.type} type={source.type} srcSet={source.srcSet} sizes={STEP_IMAGE_SIZES} />)}
+                    <img src={imagePath} width={derivatives?.width} height={derivatives?.height} alt={`Illustration for ${tabKey} step ${currentSubStepIndex + 1}`} className="step-image" onError={handleImageError}/>
+                  </picture>)
                  : (<div className="image-placeholder">Image not available</div>)}
               </div>
             </div>
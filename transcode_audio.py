@@ -0,0 +1,104 @@
+import argparse
+import os
+import shutil
+import sqlite3
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_store import AUDIO_FORMATS, get_audio_store
+from manual_assets import file_hash, repoint_assets
+from rate_limit import ProgressReporter
+
+# Converts audio blobs already in the store (e.g. WAVs from earlier runs) to a
+# compressed format with ffmpeg and repoints their manifest entries. Each distinct
+# blob is transcoded once, however many items share it. Rows in the assets table
+# that pointed at a converted blob are moved to the new file.
+
+# --- Configuration ---
+DATABASE_FILE = 'manuals.db'
+AUDIO_DIR = 'technisat-manual/public/manual_audio'
+TARGET_FORMAT = 'ogg_opus'
+TRANSCODE_WORKERS = os.cpu_count() or 4 # ffmpeg processes run in parallel
+FFMPEG_BINARY = 'ffmpeg'
+# --- End Configuration ---
+
+def transcode_file(source_path, target_path, target_format, ffmpeg=FFMPEG_BINARY):
+    """Transcodes one file with ffmpeg, writing the target atomically. Raises on failure."""
+    tmp_path = f"{target_path}.tmp.{AUDIO_FORMATS[target_format]['extension']}"
+    command = [ffmpeg, '-y', '-loglevel', 'error', '-i', source_path, '-ac', '1', *AUDIO_FORMATS[target_format]['ffmpeg_args'], tmp_path]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0: raise RuntimeError(result.stderr.strip() or f"ffmpeg exited with {result.returncode}")
+        os.replace(tmp_path, target_path)
+    finally:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+
+def transcode_store(audio_dir=AUDIO_DIR, target_format=TARGET_FORMAT, workers=TRANSCODE_WORKERS, delete_sources=False, db_file=DATABASE_FILE):
+    """Transcodes every manifest blob not yet in target_format. Returns (converted, failed)."""
+    store = get_audio_store(audio_dir)
+    by_blob = {} # (hash, source format) -> [item keys]
+    for key, entry in store.items().items():
+        if entry.get("format", "wav") != target_format: by_blob.setdefault((entry["hash"], entry.get("format", "wav")), []).append(key)
+    if not by_blob:
+        print(f"All {len(store.items())} items already use {target_format}.")
+        return 0, 0
+
+    print(f"Transcoding {len(by_blob)} blobs ({sum(map(len, by_blob.values()))} items) to {target_format} with {workers} workers...")
+    progress = ProgressReporter(len(by_blob), "blobs")
+
+    def run(blob):
+        content_hash, source_format = blob
+        source_path = store.blob_path(content_hash, source_format)
+        target_path = store.blob_path(content_hash, target_format)
+        try:
+            if not os.path.exists(target_path): transcode_file(source_path, target_path, target_format)
+        except (OSError, RuntimeError) as e:
+            print(f"Error transcoding {os.path.basename(source_path)}: {e}")
+            progress.record("failed")
+            return False
+        for key in by_blob[blob]: store.link(key, content_hash, target_format)
+        progress.record("succeeded")
+        return True
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="transcode") as pool:
+        results = dict(zip(by_blob, pool.map(run, by_blob)))
+    store.save()
+
+    # Move asset rows to the converted blobs before any source is deleted
+    replacements = []
+    for (content_hash, source_format), converted in results.items():
+        if not converted: continue
+        target_path = store.blob_path(content_hash, target_format)
+        replacements.append((f"{store.url_prefix}/{store.blob_relpath(content_hash, source_format)}",
+                             f"{store.url_prefix}/{store.blob_relpath(content_hash, target_format)}",
+                             AUDIO_FORMATS[target_format]['mime'], file_hash(target_path), os.path.getsize(target_path)))
+    if replacements and os.path.exists(db_file):
+        conn = sqlite3.connect(db_file)
+        try: print(f"Updated {repoint_assets(conn, 'audio', replacements)} audio assets in {db_file}.")
+        except sqlite3.Error as e: print(f"Database error updating audio assets: {e}")
+        finally: conn.close()
+
+    if delete_sources:
+        referenced = {entry["path"] for entry in store.items().values()}
+        for (content_hash, source_format), converted in results.items():
+            if converted and store.blob_relpath(content_hash, source_format) not in referenced:
+                os.remove(store.blob_path(content_hash, source_format))
+
+    converted = sum(results.values())
+    stats = store.stats()
+    print(f"Transcoding finished: {converted} converted, {len(results) - converted} failed ({progress.summary()}). "
+          f"Store: {stats['items']} items -> {stats['blobs']} blobs, {stats['bytes'] / 1e6:.1f} MB.")
+    return converted, len(results) - converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcode stored manual audio (e.g. WAV) to a compressed format and update the manifest.")
+    parser.add_argument("-f", "--format", default=TARGET_FORMAT, choices=sorted(AUDIO_FORMATS), help=f"Target format (default: {TARGET_FORMAT}).")
+    parser.add_argument("-w", "--workers", type=int, default=TRANSCODE_WORKERS, help=f"Parallel ffmpeg processes (default: {TRANSCODE_WORKERS}).")
+    parser.add_argument("--delete-sources", action="store_true", help="Delete source blobs no longer referenced by the manifest.")
+    args = parser.parse_args()
+
+    if shutil.which(FFMPEG_BINARY) is None:
+        print(f"Error: '{FFMPEG_BINARY}' not found. Install ffmpeg (with libopus/libmp3lame) to transcode audio.")
+    else:
+        transcode_store(AUDIO_DIR, args.format, args.workers, args.delete_sources)